@@ -1,29 +1,101 @@
-import os, re
+import os, sys, csv, json, time, argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from lib.libwacom import LIBWACOMDIR, parseKeyfile, normalizeDevMatch, splitList
+
+'''
+Catalog of the libwacom tablet database, used to audit which models we support.
+
+    python3 check_models.py                          <- One "tablet:" line per file, like before
+    python3 check_models.py --format json            <- Full records as JSON (or --format csv)
+    python3 check_models.py --match usb:056a:00d1    <- Only tablets with this DeviceMatch
+    python3 check_models.py --name bamboo            <- Only tablets whose Name/ModelName contains this
+
+Files are parsed in a process pool, parse throughput is reported on stderr.
+'''
+
+CSVFIELDS = ["name", "model", "matches", "class", "buttons", "stylus", "touch", "ring", "reversible", "layout", "file"]
+
+def parseRecord(fullfile):
+    # Runs in a worker process, returns a plain dict so it pickles cheaply
+    with open(fullfile, "r", errors="replace") as tablet:
+        groups = parseKeyfile(tablet)
+
+    device   = groups.get("device", {})
+    features = groups.get("features", {})
+    layout   = device.get("layout")
+    return {
+        "name"      : device.get("name") or "None",
+        "model"     : device.get("modelname") or "None",
+        "matches"   : [normalizeDevMatch(entry) for entry in splitList(device.get("devicematch"))],
+        "class"     : device.get("_class"),
+        "buttons"   : features.get("buttons", 0),
+        "stylus"    : bool(features.get("stylus", False)), # <- Plain bools, so JSON says true/false
+        "touch"     : bool(features.get("touch", False)),
+        "ring"      : bool(features.get("ring", False)),
+        "reversible": bool(features.get("reversible", False)),
+        "layout"    : os.path.join(os.path.dirname(fullfile), "layouts", layout) if layout else None,
+        "file"      : fullfile,
+    }
+
+def parseChunk(files):
+    return [parseRecord(fullfile) for fullfile in files]
+
+def listTabletFiles(basedir):
+    files = []
+    for entry in os.scandir(basedir):
+        if entry.is_file() and entry.name.endswith(".tablet"):
+            files.append(entry.path)
+    return sorted(files)
+
+def loadCatalog(basedir, workers=None, chunkSize=64):
+    files  = listTabletFiles(basedir)
+    chunks = [files[i:i + chunkSize] for i in range(0, len(files), chunkSize)]
+    records = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for chunk in pool.map(parseChunk, chunks): # <- map keeps file order
+            records.extend(chunk)
+    return records
+
+def filterCatalog(records, match=None, name=None):
+    if match != None:
+        match   = normalizeDevMatch(match)
+        records = [record for record in records if match in record["matches"]]
+    if name != None:
+        name    = name.lower()
+        records = [record for record in records if name in str(record["name"]).lower() or name in str(record["model"]).lower()]
+    return records
+
+def writeCatalog(records, outputFormat, stream=sys.stdout):
+    if outputFormat == "json":
+        json.dump(records, stream, indent=2)
+        stream.write("\n")
+    elif outputFormat == "csv":
+        writer = csv.DictWriter(stream, fieldnames=CSVFIELDS)
+        writer.writeheader()
+        for record in records:
+            row = dict(record)
+            row["matches"] = ";".join(record["matches"])
+            writer.writerow(row)
+    else:
+        for record in records:
+            print("tablet:", record["name"], record["model"], record["file"], file=stream)
 
 def main():
-    basedir = "/usr/share/libwacom/"
-    dirList = os.listdir(basedir)
-    for file in dirList:
-        if file == "__pycache__":
-            continue
-        fullfile   = os.path.join(basedir, file)
-        tabletName = "None"
-        modelName  = "None"
-        if not os.path.isdir(fullfile):
-            with open(fullfile, "r") as tablet:
-                contents = tablet.readlines()
-                for line in contents:
-                    modelMatch = re.search(r"^ModelName=", line)
-                    nameMatch  = re.search(r"^Name=", line)
-                    if nameMatch != None:
-                        tabletName = line.strip("\n").split("=")[-1]
-                        if tabletName == "":
-                            tabletName = "None"
-                    if modelMatch != None:
-                        modelName = line.strip("\n").split("=")[-1]
-                        if modelName == "":
-                            modelName = "None"
-        print("tablet:",tabletName, modelName, fullfile)
+    parser = argparse.ArgumentParser(description="Catalog the libwacom tablet database")
+    parser.add_argument("--dir",     default=LIBWACOMDIR, help="libwacom data directory")
+    parser.add_argument("--format",  default="text", choices=["text", "json", "csv"])
+    parser.add_argument("--match",   help="only tablets with this DeviceMatch, Eg. usb:056a:00d1")
+    parser.add_argument("--name",    help="only tablets whose name or model contains this")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: cpu count)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    records = loadCatalog(args.dir, args.workers)
+    elapsed = time.perf_counter() - started
+
+    writeCatalog(filterCatalog(records, args.match, args.name), args.format)
+    print("Parsed {} files in {:.3f}s ({:.0f} files/s)".format(len(records), elapsed, len(records) / elapsed if elapsed else 0), file=sys.stderr)
 
 if __name__ == '__main__':
     main()
@@ -2,7 +2,7 @@ import os
 
 from lib.util import legalize
 
-from PyQt6.uic       import loadUi
+from lib.uiCache     import loadUi
 from PyQt6.QtGui     import QIcon
 from PyQt6.QtCore    import QSize
 from PyQt6.QtWidgets import QDialog, QFileDialog
@@ -0,0 +1,152 @@
+import sys
+
+'''
+Button Actions:
+    Offline parser and normalizer for xsetwacom action strings, Eg.
+        "key +ctrl z"       ->  "key +Control_L +z -z"
+        "button 3"          ->  "button +3 -3"
+        "key +alt button 1" ->  "key +Alt_L button +1 -1"
+
+    After "xsetwacom set <pad> button N <action>" the driver hands back a sanitized
+    version of the action, and we used to run "xsetwacom get" again just to learn it.
+    canonicalize() produces that same string locally.
+
+    How xsetwacom gets to its canonical form:
+    - every word is an action type ("key", "button", "modetoggle", "displaytoggle", "pan")
+      or an argument of the last type
+    - "+x" is a press, "-x" a release, a bare "x" is a press followed by a release
+    - key names go through its alias tables (ctrl -> Control_L, esc -> Escape, ...)
+    - keys are stored as keycodes and printed back with the level 0 keysym of that keycode
+    - the type word is only printed when it changes
+
+    The last step depends on the keymap, so canonicalize() only answers for keysyms that
+    survive it unchanged on every layout: modifiers, F-keys and the named specials. Letters,
+    digits and punctuation move around (AZERTY reads "key 1" back as "ampersand", German
+    layouts have bracketleft on AltGr+8), so for those and everything else it returns None.
+    Callers should then ask xsetwacom, like before.
+'''
+
+# Modifier names xsetwacom accepts (case insensitive), and the keysym they stand for
+MODIFIER_ALIASES = {
+    'ctrl' : 'Control_L', 'ctl'   : 'Control_L', 'control': 'Control_L', 'lctrl': 'Control_L', 'rctrl': 'Control_R',
+    'meta' : 'Meta_L',    'lmeta' : 'Meta_L',    'rmeta'  : 'Meta_R',
+    'alt'  : 'Alt_L',     'lalt'  : 'Alt_L',     'ralt'   : 'Alt_R',
+    'shift': 'Shift_L',   'lshift': 'Shift_L',   'rshift' : 'Shift_R',
+    'super': 'Super_L',   'lsuper': 'Super_L',   'rsuper' : 'Super_R',
+    'hyper': 'Hyper_L',   'lhyper': 'Hyper_L',   'rhyper' : 'Hyper_R',
+}
+
+# Other shorthands xsetwacom accepts (case sensitive)
+SPECIAL_KEYS = {
+    'esc'      : 'Escape',    'Esc'      : 'Escape',
+    'up'       : 'Up',        'down'     : 'Down',
+    'left'     : 'Left',      'right'    : 'Right',
+    'backspace': 'BackSpace', 'Backspace': 'BackSpace',
+    'tab'      : 'Tab',
+    'PgUp'     : 'Prior',     'PgDn'     : 'Next',
+}
+SPECIAL_KEYS.update({"f{}".format(number): "F{}".format(number) for number in range(1, 36)})
+
+# Keysyms that come back from the keycode round trip exactly as they went in, whatever the layout.
+# Meta, Hyper, Alt_R and F13+ are left out on purpose: on common keymaps they share
+# a keycode with another keysym (Alt_L, ISO_Level3_Shift, XF86Tools, ...)
+STABLE_KEYSYMS = set(
+    ["F{}".format(number) for number in range(1, 13)] +
+    ['Control_L', 'Control_R', 'Shift_L', 'Shift_R', 'Alt_L', 'Super_L', 'Super_R',
+     'Escape', 'Tab', 'BackSpace', 'Return', 'space', 'Delete', 'Insert', 'Home', 'End',
+     'Prior', 'Next', 'Up', 'Down', 'Left', 'Right', 'Print', 'Pause', 'Menu']
+)
+
+ACTION_TYPES    = ['key', 'button', 'modetoggle', 'displaytoggle', 'pan']
+ARGUMENTLESS    = ['modetoggle', 'displaytoggle', 'pan']
+
+def keysymName(key):
+    # Resolve xsetwacom's aliases, Eg. "ctrl" -> "Control_L", "esc" -> "Escape"
+    if key.lower() in MODIFIER_ALIASES:
+        return MODIFIER_ALIASES[key.lower()]
+    return SPECIAL_KEYS.get(key, key)
+
+def parseAction(action):
+    # Return [(type, "+" or "-" or "", detail), ...] or None if xsetwacom would reject it
+    parsed     = []
+    actionType = None
+    for word in action.split():
+        if word.lower() in ACTION_TYPES:
+            actionType = word.lower()
+            if actionType in ARGUMENTLESS:
+                parsed.append((actionType, "", ""))
+            continue
+
+        if actionType == None or actionType in ARGUMENTLESS:
+            return None # <- Argument without a type in front of it
+
+        sign   = word[0] if word[0] in "+-" else ""
+        detail = word.lstrip("+-")
+        if detail == "":
+            return None
+        if actionType == 'button' and not detail.isdigit():
+            return None
+
+        parsed.append((actionType, sign, detail))
+
+    return parsed
+
+def defaultAction(buttonNumber):
+    # What the driver falls back to when a binding is cleared with ""
+    return "button +{}".format(buttonNumber)
+
+def canonicalize(action, buttonNumber=None):
+    # Return the string "xsetwacom get" would print after setting action, or None if we cant be sure
+    if action.strip() == "":
+        return defaultAction(buttonNumber) if buttonNumber != None else None
+
+    parsed = parseAction(action)
+    if parsed == None:
+        return None
+
+    words    = []
+    lastType = None
+    for actionType, sign, detail in parsed:
+        if actionType != lastType:
+            words.append(actionType)
+            lastType = actionType
+
+        if actionType in ARGUMENTLESS:
+            continue
+
+        if actionType == 'key':
+            detail = keysymName(detail)
+            if not detail in STABLE_KEYSYMS:
+                return None
+        else:
+            detail = str(int(detail)) # <- "button +03" comes back as "+3"
+
+        if sign == "":
+            words.append("+" + detail)
+            words.append("-" + detail)
+        else:
+            words.append(sign + detail)
+
+    return " ".join(words)
+
+def recordCorpus(actions, buttonNumber=1):
+    # Set each action on a real pad and print what xsetwacom hands back, as entries for RECORDED_CORPUS
+    # in tests/test_buttonActions.py
+    try:
+        from lib.commandInterfaces import deviceRegistry
+    except ImportError:
+        from commandInterfaces     import deviceRegistry
+
+    pad      = deviceRegistry.getDevices()["PAD"]
+    original = pad.getButton(buttonNumber)
+    for action in actions:
+        pad.setButton(buttonNumber, action)
+        print("    ({}, {}),".format(repr(action), repr(pad.getButton(buttonNumber))))
+    pad.setButton(buttonNumber, original)
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "--record":
+        recordCorpus(sys.argv[2:])
+    else:
+        print("Usage: python3 lib/buttonActions.py --record <action> [<action> ...]")
+        sys.exit(2)
@@ -1,14 +1,20 @@
-import os, re, json
-
-from pathlib import Path
+import os, json
 
 try:
-    from util              import legalize
-    from commandInterfaces import xsetwacom
+    from util              import legalize, sameSetting
+    from buttonActions     import canonicalize
+    from persistence       import writeBehind
+    from profileCache      import profileCache
+    from profilePlans      import compileProfile, transitionPlanner
+    from commandInterfaces import deviceRegistry
     from settings          import SETTINGSDIR
 except ImportError:
-    from lib.util              import legalize
-    from lib.commandInterfaces import xsetwacom
+    from lib.util              import legalize, sameSetting
+    from lib.buttonActions     import canonicalize
+    from lib.persistence       import writeBehind
+    from lib.profileCache      import profileCache
+    from lib.profilePlans      import compileProfile, transitionPlanner
+    from lib.commandInterfaces import deviceRegistry
     from lib.settings          import SETTINGSDIR
 
 '''
@@ -28,9 +34,12 @@ ButtonManager:
     - save settings to file
 
     the profile settings should be saved immediatly when changes are made.
+    (save() queues the write, it lands on disk a fraction of a second later, atomically)
 
 '''
-BUTTONPROFILESDIR = os.path.join(SETTINGSDIR, "ButtonProfiles")
+BUTTONPROFILESDIR   = os.path.join(SETTINGSDIR, "ButtonProfiles")
+PROFILEINDEXFILE    = ".index.json" # <- Profile metadata cache, lives inside each ButtonProfiles dir
+PROFILEINDEXVERSION = 1
 
 class ButtonManager():
     def __init__(self, profilesDir, activeProfile=None):
@@ -38,7 +47,9 @@ class ButtonManager():
         self.activeProfile     = self.assembleProfileUri(activeProfile) # <- Currently active profile uri
         self.activeProfileData = {} # <- Currently active profile data, yet to be loaded
         self.profiles          = []
-        self.devices           = xsetwacom.getDevices()
+        self.recentProfiles    = [] # <- Profile file names, most recently used first
+        self.appliedPlan       = None # <- Bindings we know are live on the pad (see profilePlans.py), None if unknown
+        self.devices           = deviceRegistry.getDevices()
 
         os.makedirs(self.profilesDir, exist_ok=True)
 
@@ -64,72 +75,175 @@ class ButtonManager():
 
             self.devices["PAD"].setButton(id, value) # <- tell xsetwacom to change the button binding
 
-            correctedButtonString = self.devices["PAD"].getButton(id) # After you apply a setting in xsetwacom
-                                                                      # the tool may correct it in order to sanitize it
-                                                                      # Eg. +ctrl becomes +Control_L
-                                                                      # Ideally, we want to display the sanitized settings
-                                                                      # So we get the new keybinding again from Xsetwacom
-                                                                      # and adjust our settings to match the sanitized version
+            correctedButtonString = canonicalize(value, buttonNumber=id) # After you apply a setting in xsetwacom
+                                                                         # the tool may correct it in order to sanitize it
+                                                                         # Eg. +ctrl becomes +Control_L
+                                                                         # Ideally, we want to display the sanitized settings
+                                                                         # so we work out the sanitized version locally
+            if correctedButtonString == None:
+                # Not something we can predict (odd keysym, keymap dependent, ...), ask Xsetwacom instead
+                correctedButtonString = self.devices["PAD"].getButton(id)
 
             self.setButton(index, correctedButtonString) # <- adjust the setting to match xsetwacom's corrected/sanitized version
+            if self.appliedPlan != None:
+                self.appliedPlan = tuple((buttonId, correctedButtonString if buttonId == str(id) else binding) for buttonId, binding in self.appliedPlan)
             if not suppressOutput:
                 print("Tablet Button {}: set to value: {}".format(id, correctedButtonString))
 
             self.save()
 
-    def applyButtons(self, suppressOutput=False):
-
+    def applyButtons(self, suppressOutput=False, onlyChanged=False):
+        # onlyChanged: Snapshot the pad first, and only send bindings that differ from it.
+        # Returns the number of commands skipped
+        skipped = 0
         if (self.devices != None) and (self.activeProfileData != {}):
             buttons = self.getButtons()
+            live    = self.devices["PAD"].getState() if onlyChanged else {}
             for button in buttons:
+                if onlyChanged and sameSetting(live.get("button {}".format(button['id'])), button['value']):
+                    skipped += 1
+                    continue
+
                 if not suppressOutput:
                     print("Tablet Button {}: set to value: {}".format(button['id'], button['value']))
 
                 self.devices["PAD"].setButton(button['id'], button['value'])
+
+            self.appliedPlan = compileProfile(self.activeProfileData)
+            if onlyChanged:
+                print("Applied {} button bindings, skipped {} unchanged".format(len(buttons) - skipped, skipped))
             self.save()
 
+        return skipped
+
+    def applyTransition(self, dryRun=False, suppressOutput=False):
+        # Send only what differs between the bindings live on the pad and the active profile.
+        # dryRun: Print the planned commands and their estimated cost instead. Returns the planned commands
+        if (self.devices == None) or (self.activeProfileData == {}):
+            return []
+
+        if self.appliedPlan == None and not dryRun:
+            # We dont know what is on the pad yet, compare against the real thing once
+            self.applyButtons(suppressOutput=suppressOutput, onlyChanged=True)
+            return []
+
+        commands = transitionPlanner.plan(self.appliedPlan, compileProfile(self.activeProfileData))
+        if dryRun:
+            print(transitionPlanner.describe(commands, self.devices["PAD"].interface.estimatedCost()))
+            return commands
+
+        for command in commands:
+            if not suppressOutput:
+                print("Tablet Button {}: set to value: {}".format(command.buttonId, command.value))
+            self.devices["PAD"].setButton(command.buttonId, command.value)
+
+        self.appliedPlan = compileProfile(self.activeProfileData)
+        print("Profile transition: sent {} of {} bindings".format(len(commands), len(self.appliedPlan)))
+        return commands
+
     def load(self):
-        # Load active profile
-        with open(self.activeProfile, 'r') as profileFile:
-            jsonString = profileFile.read()
-            self.activeProfileData = json.loads(jsonString)
+        # Load active profile, from the profile cache if we have it
+        self.activeProfileData = profileCache.get(self.activeProfile)
+        self.rememberRecent()
+
+    def rememberRecent(self):
+        fileName = os.path.basename(self.activeProfile)
+        if fileName in self.recentProfiles:
+            self.recentProfiles.remove(fileName)
+        self.recentProfiles.insert(0, fileName)
+        del self.recentProfiles[profileCache.size:]
+
+    def warmProfileCache(self, recentProfiles):
+        # Parse the most recently used profiles in the background, so switching to them is instant
+        for fileName in recentProfiles:
+            if not fileName in self.recentProfiles:
+                self.recentProfiles.append(fileName)
+        del self.recentProfiles[profileCache.size:]
+        profileCache.warm([os.path.join(self.profilesDir, fileName) for fileName in self.recentProfiles])
 
     def loadProfileList(self):
+        # Build the profile list from the on disk index, only re-reading profiles whose mtime or size changed
+        writeBehind.flush() # <- Pending saves may have renamed a profile
+        index    = self.loadProfileIndex()
+        newIndex = {}
+        reparsed = 0
         profileList = []
-        for profile in os.listdir(self.profilesDir):
-            uri = os.path.join(self.profilesDir, profile)
-            if not os.path.isdir(uri):
-                with open(uri, 'r') as proFile:
-                    jString = proFile.read()
-                    loadedProfile = json.loads(jString)
-                    newProfile = {'name': loadedProfile['name'], 'icon': loadedProfile['icon'], 'uri': uri}
-                    if loadedProfile['name'] == "Default":
-                        profileList.insert(0, newProfile)
-
-                    else:
-                        profileList.append(newProfile)
+        with os.scandir(self.profilesDir) as entries:
+            for entry in entries:
+                if entry.name.startswith(".") or entry.is_dir():
+                    continue # <- The index itself, temp files from atomic saves, sub directories
+
+                stat   = entry.stat()
+                cached = index.get(entry.name)
+                if cached != None and cached['mtime'] == stat.st_mtime_ns and cached['size'] == stat.st_size:
+                    meta = cached
+                else:
+                    reparsed += 1
+                    try:
+                        with open(entry.path, 'r') as proFile:
+                            loadedProfile = json.loads(proFile.read())
+                        meta = {'name': loadedProfile['name'], 'icon': loadedProfile['icon'],
+                                'mtime': stat.st_mtime_ns, 'size': stat.st_size}
+                    except (ValueError, KeyError) as e:
+                        print("ButtonManager -> loadProfileList: Skipping unreadable profile", entry.path, e)
+                        continue
+
+                newIndex[entry.name] = meta
+                newProfile = {'name': meta['name'], 'icon': meta['icon'], 'uri': entry.path}
+                if meta['name'] == "Default":
+                    profileList.insert(0, newProfile)
+
+                else:
+                    profileList.append(newProfile)
+
+        if newIndex != index:
+            self.saveProfileIndex(newIndex)
+            print("Profile index updated: {} of {} profiles re-read".format(reparsed, len(newIndex)))
 
         self.profiles = profileList
 
+    def loadProfileIndex(self):
+        # {file name: {'name', 'icon', 'mtime', 'size'}}, or {} if missing/outdated/corrupt
+        try:
+            with open(os.path.join(self.profilesDir, PROFILEINDEXFILE), 'r') as indexFile:
+                index = json.loads(indexFile.read())
+            if index.get('version') == PROFILEINDEXVERSION:
+                return index['profiles']
+        except (OSError, ValueError, KeyError):
+            pass
+        return {}
+
+    def saveProfileIndex(self, profiles):
+        writeBehind.write(os.path.join(self.profilesDir, PROFILEINDEXFILE), {'version': PROFILEINDEXVERSION, 'profiles': profiles})
+
     def loadOtherProfileData(self, profileUri):
         # Load a profiles data and return it
         otherProfileData = {}
+        writeBehind.flush(profileUri)
         with open(profileUri, 'r') as profileFile:
             jsonString = profileFile.read()
             otherProfileData = json.loads(jsonString)
         return otherProfileData
 
-    def save(self):
-        # Save active profile
-        with open(self.activeProfile, 'w') as profileFile:
-            jsonString = json.dumps(self.activeProfileData)
-            profileFile.write(jsonString)
+    def save(self, now=False):
+        # Save active profile. Coalesced and written atomically a moment later, see persistence.py
+        profileCache.put(self.activeProfile, self.activeProfileData)
+        if now:
+            writeBehind.write(self.activeProfile, self.activeProfileData)
+        else:
+            writeBehind.schedule(self.activeProfile, self.activeProfileData)
 
     def saveOtherProfileData(self, profileUri, profileData):
         # Save a profile other then the activly loaded one
-        with open(profileUri, 'w') as profileFile:
-            jsonString = json.dumps(profileData)
-            profileFile.write(jsonString)
+        profileCache.invalidate(profileUri)
+        writeBehind.write(profileUri, profileData)
+
+    def removeProfile(self, profileUri):
+        writeBehind.remove(profileUri) # <- Or the pending save would bring it back
+        profileCache.invalidate(profileUri)
+        fileName = os.path.basename(profileUri)
+        if fileName in self.recentProfiles:
+            self.recentProfiles.remove(fileName)
 
     def assembleProfileUri(self, activeProfile):
         if activeProfile == None:
@@ -201,29 +315,24 @@ class ButtonManager():
     def resetButtons(self):
         # Reset Buttons
         buttons = self.getButtons()
-        for button in buttons:
-            index = buttons.index(button)
+        for index in range(0, len(buttons)):
             self.setButton(index, "")
-            self.applyButton(index)
+            self.applyButton(index) # <- Each of these saves, but the writes are coalesced into one
         self.save()
         print("Buttons Reset!")
 
     def parseTabletButtons(self):
         # Figure out how many button there are, given that the button count in the metadata is a fucking lier
-        devices = xsetwacom.getDevices()
+        devices = deviceRegistry.getDevices()
         buttons = []
         if devices != None:
-            props = devices["PAD"].getProp('all', s=True)
-            for line in props.splitlines():
-                match = re.search("\"Button\" \"[\d+]\".*", line)
-                if match != None:
-                    buttonNum = match.group().split()[1].strip("\"")
-                    buttonVal = " ".join(match.group().split()[2:]).strip("\"")
-                    entry = {
-                        'id'   : buttonNum,
-                        'value': buttonVal
-                    }
-                    buttons.append(entry)
+            snapshot = devices["PAD"].takeSnapshot()
+            for buttonNum, buttonVal in snapshot.getButtons():
+                entry = {
+                    'id'   : str(buttonNum),
+                    'value': buttonVal
+                }
+                buttons.append(entry)
 
             return buttons
         else:
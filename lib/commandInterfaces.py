@@ -1,13 +1,41 @@
-import re
+import re, os, sys, time, struct
 from pyudev     import Context, Devices
-from subprocess import Popen, PIPE
+from subprocess import Popen, PIPE, TimeoutExpired
+from threading  import RLock, Lock
 
 try:
-    from lib.util      import *
-except ModuleNotFoundError:
-    from util      import *
+    # Optional: only needed by the XinputNative backend
+    from Xlib       import X, XK, display as xdisplay
+    from Xlib.ext   import xinput as xi
+    from Xlib.error import XError, ConnectionClosedError, CatchError
+    from Xlib.keysymdef import miscellany, latin1
+except ImportError:
+    xdisplay = None
 
-# TODO create command interface class for xinput and xrandr
+try:
+    from lib.util           import *
+    from lib.deviceSnapshot import DeviceSnapshot
+    from lib.buttonActions  import keysymName
+except ModuleNotFoundError:
+    from util           import *
+    from deviceSnapshot import DeviceSnapshot
+    from buttonActions  import keysymName
+
+def keysymNames():
+    # keysym -> name, what XK.string_to_keysym does in reverse. XK's own globals are filled in alphabetical
+    # order, the keysymdef modules keep keysymdef.h's, where the name xsetwacom prints comes first
+    # (Eg. "Prior" before "Page_Up", "apostrophe" before "quoteright")
+    names = {}
+    for group in [miscellany, latin1]:
+        for name, keysym in vars(group).items():
+            if name.startswith('XK_'):
+                names.setdefault(keysym, name[3:])
+    return names
+
+KEYSYM_NAMES = keysymNames() if xdisplay != None else {}
+
+COMMAND_TIMEOUT = 5 # <- Seconds before a hung xsetwacom/xinput/xrandr gets killed
+DEFAULT_COST    = 15.0 # <- Milliseconds we guess a command costs, until we have measured some
 
 class Device():
 
@@ -18,35 +46,83 @@ class Device():
         self.node = node # Device node according to xinput
         self.udev = udev # udev Device Object from pyudev
 
-        self.interface = Xsetwacom()
+        self.interface = getInterface()
+        self.snapshot  = None # <- DeviceSnapshot, see takeSnapshot()
 
     def __str__(self):
         return "Device(Name: {}, Id: {} Type: {})".format(self.name, self.id, self.type)
 
     def getUdev(self, prop):
+        if self.udev == None:
+            return None # <- Neither udev nor xinput knew the node, see Xsetwacom.getDevices()
         return self.udev.properties.get(prop)
 
     def getProp(self, prop, s=False):
         if s:
             return self.interface.getProp(self.name, prop, s=s)
+        elif self.snapshot != None and self.snapshot.has(prop):
+            return self.snapshot.get(prop) # <- Served from the last snapshot, no subprocess
         else:
             return self.interface.getProp(self.name, prop)
 
     def getButton(self, number):
+        if self.snapshot != None and self.snapshot.has('button', number):
+            return self.snapshot.getButton(number)
         return self.interface.getButton(self.name, number)
 
+    def takeSnapshot(self):
+        # Read every parameter in one "xsetwacom -s get <dev> all" call.
+        # Until dropSnapshot(), getProp and getButton answer from it
+        self.snapshot = DeviceSnapshot.parse(self.getProp('all', s=True), self.name)
+        return self.snapshot
+
+    def dropSnapshot(self):
+        self.snapshot = None
+
+    def getState(self):
+        # Fresh snapshot as {'mode': 'Absolute', 'button 2': 'button +2', ...}, keys lower case
+        return self.takeSnapshot().flatten()
+
     def setProp(self, prop, value):
         self.interface.setProp(self.name, prop, value)
+        if self.snapshot != None:
+            self.snapshot.forget(prop) # <- The driver may sanitize what we sent, so read it fresh next time
 
     def setButton(self, number, value):
         self.interface.setButton(self.name, number, value)
+        if self.snapshot != None:
+            self.snapshot.forget('button', number)
+
+class CommandTimeout(ValueError):
+    # A tool did not answer within COMMAND_TIMEOUT and was killed. A ValueError like any other failed command,
+    # catch this one to tell "no answer" apart from an answer
+    pass
 
 class CommandInterface():
-    def checkOutput(self, command, shell=False):
+    commandsRun    = 0   # <- Shared by every interface of a class, for cost estimates
+    commandSeconds = 0.0
+
+    def checkOutput(self, command, shell=False, timeout=COMMAND_TIMEOUT):
+        started = time.perf_counter()
         proc = Popen(command, stdout=PIPE, stderr=PIPE, shell=shell)
-        output = proc.communicate()
+        try:
+            output = proc.communicate(timeout=timeout)
+        except TimeoutExpired:
+            # Dont let a wedged tool (Eg. right after a hotplug) freeze whoever called us
+            proc.kill()
+            proc.communicate()
+            raise CommandTimeout("{} timed out after {} seconds".format(" ".join(command), timeout))
+        finally:
+            type(self).commandsRun    += 1
+            type(self).commandSeconds += time.perf_counter() - started
         return output
 
+    def estimatedCost(self):
+        # Average milliseconds per command so far, or a guess
+        if self.commandsRun == 0:
+            return DEFAULT_COST
+        return self.commandSeconds / self.commandsRun * 1000
+
 class Xsetwacom(CommandInterface):
 
     def _xsetwacom(self, *args, **kwargs):
@@ -55,32 +131,52 @@ class Xsetwacom(CommandInterface):
             command = ["xsetwacom"] + list(args)
             #print(command)
             output = self.checkOutput(command)
-            return output[0].decode('utf-8').strip('\n').strip()
-            '''
-            if output[1] == b'':
+            if output[1] == b'' or output[0].strip() != b'':
+                # "-s get <dev> all" complains about every parameter the device lacks and still answers
                 return output[0].decode('utf-8').strip('\n').strip()
             else:
                 # If command execution fails, raise ValueError to tell me why.
                 raise ValueError(output[1].decode('utf-8').strip('\n'))
-            '''
         else:
             # If no arguments are passed, return no information
             return None
 
+    def _get(self, *args):
+        # A refused get is printed and reads as empty, the callers treat "" as "not set".
+        # Only a hung xsetwacom raises (CommandTimeout)
+        try:
+            return self._xsetwacom(*args)
+        except CommandTimeout:
+            raise
+        except ValueError as e:
+            print("Xsetwacom:", e)
+            return ""
+
     def setProp(self, name, prop, value):
-        self._xsetwacom('set', name, prop, str(value))
+        # Returns False if xsetwacom hung or refused the value
+        try:
+            self._xsetwacom('set', name, prop, str(value))
+        except ValueError as e:
+            print("Xsetwacom:", e)
+            return False
+        return True
 
     def setButton(self, name, number, value):
-        self._xsetwacom("set", name, "button", str(number), str(value))
+        try:
+            self._xsetwacom("set", name, "button", str(number), str(value))
+        except ValueError as e:
+            print("Xsetwacom:", e)
+            return False
+        return True
 
     def getProp(self, name, prop, s=False):
         if s:
-            return self._xsetwacom('-s', 'get', name, str(prop))
+            return self._get('-s', 'get', name, str(prop))
         else:
-            return self._xsetwacom('get', name, str(prop))
+            return self._get('get', name, str(prop))
 
     def getButton(self, name, number):
-        return self._xsetwacom("get", name, "button", str(number))
+        return self._get("get", name, "button", str(number))
 
     def getDevices(self):
         # Return a list of device objects.
@@ -88,13 +184,19 @@ class Xsetwacom(CommandInterface):
         try:
             devices = {}
             deviceList = self._xsetwacom('list', 'devices').splitlines()
+            eventNodes = inputNodes.scan() # <- One pass over udev for every device, instead of one xinput call each
             for line in deviceList:
                 deviceName  = " ".join(line.split()[:-4])                        # Isolate the part of Line that contains the device name
                 deviceID    = re.search(r"id: [0-9]*", line).group().split()[-1] # Isolate the part of Line that contains the device ID
                 deviceType  = line.split()[-1]
                                                    # Isolate the part of Line that contains the device type
-                node = xinput.getDeviceNode(deviceName)
-                udev = Devices.from_name(Context(), 'input', node.split('/')[-1])
+                udev = inputNodes.match(eventNodes, deviceName, deviceType)
+                if udev != None:
+                    node = udev.device_node
+                else:
+                    # Name did not line up with any kernel device, ask xinput the slow way
+                    node = xinput.getDeviceNode(deviceName)
+                    udev = Devices.from_name(udevContext, 'input', node.split('/')[-1]) if node != None else None
 
                 devices[deviceType] = Device(name=deviceName, id=deviceID, type=deviceType, node=node, udev=udev)
 
@@ -107,10 +209,56 @@ class Xsetwacom(CommandInterface):
             print(e)
 
     def getDeviceId(self, deviceType):
-        devices = self.getDevices()
+        devices = deviceRegistry.getDevices()
         if devices != None:
             return devices[deviceType].id
 
+class InputNodeIndex():
+    '''
+    InputNodeIndex:
+        Correlates X devices with their /dev/input/eventN node and udev properties
+        (ID_VENDOR_ID, ID_MODEL_ID, ID_PATH, ID_INPUT_TABLET_PAD, ...) using a single
+        enumeration of the udev input subsystem.
+
+        The wacom driver names its X devices "<kernel device name> <tool type>",
+        Eg. kernel "Wacom Bamboo 16FG 4x5 Pen" becomes "Wacom Bamboo 16FG 4x5 Pen stylus"
+        and "... Pen eraser", so the longest kernel name that prefixes the X name wins.
+    '''
+    def __init__(self, context):
+        self.context = context
+
+    def scan(self):
+        # Return [(kernel device name, udev event device), ...] for every event node
+        eventNodes = []
+        for device in self.context.list_devices(subsystem='input'):
+            node = device.device_node
+            if node == None or not os.path.basename(node).startswith('event'):
+                continue
+
+            parent = device.parent
+            if parent == None or parent.properties.get('NAME') == None:
+                continue
+
+            eventNodes.append((parent.properties.get('NAME').strip('"'), device))
+
+        return eventNodes
+
+    def match(self, eventNodes, deviceName, deviceType):
+        best = None
+        for kernelName, device in eventNodes:
+            if deviceName != kernelName and not deviceName.startswith(kernelName + " "):
+                continue
+
+            # Prefer the longest (most specific) name. On a tie, a PAD wants the node udev tagged as a pad
+            isPad = device.properties.get('ID_INPUT_TABLET_PAD') == "1"
+            rank  = (len(kernelName), isPad == (deviceType == "PAD"))
+            if best == None or rank > best[0]:
+                best = (rank, device)
+
+        if best != None:
+            return best[1]
+        return None
+
 class Xinput(CommandInterface):
 
     def _xinput(self, *args, **kwargs):
@@ -166,28 +314,437 @@ class XrandR(CommandInterface):
                 return output[0].decode('utf-8')
             else:
                 # If command execution fails, raise ValueError to tell me why.
-                raise ValueError(cmdout[1].decode('utf-8').strip('\n'))
+                raise ValueError(output[1].decode('utf-8').strip('\n'))
         else:
             # If no arguments are passed, return no information
             return None
 
-    def getActiveMonitorList(self):
+    def getActiveMonitors(self):
+        # [(name, width, height, x, y), ...] from one "xrandr --listactivemonitors",
+        # Eg. " 1: +HDMI-1 2560/597x1440/336+1920+0  HDMI-1"
         activeMonitors = []
-        activeMonitorsString = self._xrandr("--listactivemonitors")
-        print(activeMonitorsString)
-        for line in activeMonitorsString.splitlines():
-            if not ("Monitors:" in line):
-                activeMonitors.append(line.split()[-1])
+        for line in self._xrandr("--listactivemonitors").splitlines():
+            match = re.search(r"(\d+)/\d+x(\d+)/\d+\+(-?\d+)\+(-?\d+)\s+(\S+)\s*$", line)
+            if match != None:
+                width, height, x, y, name = match.groups()
+                activeMonitors.append((name, int(width), int(height), int(x), int(y)))
         return activeMonitors
 
+    def getActiveMonitorList(self):
+        return [monitor[0] for monitor in self.getActiveMonitors()]
+
+class XinputNative(CommandInterface):
+    '''
+    XinputNative:
+        Drop in replacement for Xsetwacom that reads and writes the wacom driver's
+        XInput device properties over one persistent X connection, instead of
+        forking a new xsetwacom (and reconnecting to X) for every single get or set.
+
+        Only the parameters this app actually uses are handled natively:
+        Touch, Rotate, PressureCurve, MapToOutput, Mode (get only) and Button
+        (for "key" and "button" actions). Anything else, or anything we dont
+        know how to encode, is handed to xsetwacom so the results stay identical.
+    '''
+
+    ROTATIONS = ['none', 'cw', 'ccw', 'half'] # <- Index == value of "Wacom Rotation"
+
+    # Action encoding used by the driver for "Wacom Button Actions" (see Xwacom.h)
+    AC_CODE        = 0x0000ffff
+    AC_KEY         = 0x00010000
+    AC_BUTTON      = 0x00080000
+    AC_TYPE        = 0x000f0000
+    AC_KEYBTNPRESS = 0x00100000
+
+    def __init__(self):
+        self.fallback   = Xsetwacom()
+        self._display   = None
+        self._available = xdisplay != None
+        self._deviceIds = {}
+        self._lock      = RLock() # <- Called from both the GUI thread and the udev observer thread
+
+    #### Connection ####
+    def _connect(self):
+        if self._display == None and self._available:
+            try:
+                self._display = xdisplay.Display()
+                if not self._display.has_extension('XInputExtension'):
+                    raise ValueError("XInputExtension is missing")
+                self._display.xinput_query_version() # <- Announce XI2 support, or the server refuses XI2 requests
+            except Exception as e:
+                print("XinputNative: Could not connect to X, falling back to xsetwacom:", e)
+                self._display   = None
+                self._available = False
+
+        return self._display
+
+    def _deviceId(self, name):
+        if not name in self._deviceIds:
+            # Refresh the whole name -> id table in one request
+            self._deviceIds = {}
+            for info in self._display.xinput_query_device(xi.AllDevices).devices:
+                self._deviceIds[info.name] = info.deviceid
+
+        return self._deviceIds.get(name)
+
+    def _atom(self, name, create=False):
+        atom = self._display.get_atom(name, only_if_exists=not create)
+        if atom == X.NONE:
+            return None
+        return atom
+
+    def _getProperty(self, name, propName):
+        # Return the raw item list of a device property, or None if the device/property does not exist
+        deviceId = self._deviceId(name)
+        atom     = self._atom(propName)
+        if deviceId == None or atom == None:
+            return None
+
+        reply = self._display.xinput_get_device_property(deviceId, atom, X.AnyPropertyType, 0, 1024)
+        if reply.value == None:
+            return None
+
+        fmt, data = reply.value
+        return list(data)
+
+    def _setProperty(self, name, propName, typeName, fmt, values):
+        deviceId = self._deviceId(name)
+        atom     = self._atom(propName)
+        if deviceId == None or atom == None:
+            return False
+
+        # XIChangeProperty has no reply, the server's BadValue/BadMatch arrives later on its own.
+        # Catch it for this request, otherwise python-xlib only prints it and we would report success
+        rejected = CatchError()
+        xi.XIChangeProperty(display=self._display.display, onerror=rejected,
+                            opcode=self._display.get_extension_major(xi.extname),
+                            deviceid=deviceId, property=atom, type=self._atom(typeName, create=True),
+                            mode=X.PropModeReplace, value=(fmt, values))
+        self._display.sync() # <- Make sure the driver has seen (or refused) the change before we return, just like xsetwacom
+        if rejected.get_error() != None:
+            print("XinputNative: Setting {} on {} was refused: {}".format(propName, name, rejected.get_error()))
+            return False
+        return True
+
+    def _run(self, native, fallback):
+        # Try the native path, use xsetwacom if it is unavailable or cant express the request
+        with self._lock:
+            if self._connect() != None:
+                try:
+                    result = native()
+                    if result != None:
+                        return result
+                except XError as e:
+                    print("XinputNative:", e)
+                except ConnectionClosedError as e:
+                    print("XinputNative: Lost X connection:", e)
+                    self._display = None
+                    self._deviceIds = {}
+
+        return fallback()
+
+    #### Getters ####
+    def getProp(self, name, prop, s=False):
+        if s:
+            return self.fallback.getProp(name, prop, s=s)
+
+        return self._run(lambda: self._nativeGetProp(name, str(prop).lower()),
+                         lambda: self.fallback.getProp(name, prop))
+
+    def _nativeGetProp(self, name, prop):
+        if prop == 'touch':
+            values = self._getProperty(name, 'Wacom Touch')
+            if values:
+                return "on" if values[0] else "off"
+
+        elif prop == 'rotate':
+            values = self._getProperty(name, 'Wacom Rotation')
+            if values and values[0] < len(self.ROTATIONS):
+                return self.ROTATIONS[values[0]]
+
+        elif prop == 'pressurecurve':
+            values = self._getProperty(name, 'Wacom Pressurecurve')
+            if values:
+                return " ".join(str(value) for value in values)
+
+        elif prop == 'mode':
+            deviceId = self._deviceId(name)
+            if deviceId != None:
+                for info in self._display.xinput_query_device(deviceId).devices:
+                    for deviceClass in info.classes:
+                        if deviceClass.type == xi.ValuatorClass:
+                            return "Absolute" if deviceClass.mode == xi.ModeAbsolute else "Relative"
+
+        return None
+
+    def getButton(self, name, number):
+        return self._run(lambda: self._nativeGetButton(name, int(number)),
+                         lambda: self.fallback.getButton(name, number))
+
+    def _nativeGetButton(self, name, number):
+        actionAtoms = self._getProperty(name, 'Wacom Button Actions')
+        if not actionAtoms or number < 1 or number > len(actionAtoms) or actionAtoms[number-1] == X.NONE:
+            return None
+
+        actionName = self._display.get_atom_name(actionAtoms[number-1])
+        actions    = self._getProperty(name, actionName)
+        if actions == None:
+            return None
+
+        return self._formatActions(actions)
+
+    def _formatActions(self, actions):
+        # Build the same string "xsetwacom get" prints, Eg. "key +Control_L +z -z -Control_L"
+        words    = []
+        lastType = None
+        for action in actions:
+            actionType = action & self.AC_TYPE
+            sign       = "+" if action & self.AC_KEYBTNPRESS else "-"
+            if actionType == self.AC_BUTTON:
+                typeName = "button"
+                detail   = str(action & self.AC_CODE)
+            elif actionType == self.AC_KEY:
+                typeName = "key"
+                detail   = KEYSYM_NAMES.get(self._display.keycode_to_keysym(action & self.AC_CODE, 0))
+                if detail == None:
+                    return None
+            else:
+                return None # <- modetoggle, pan, etc. Let xsetwacom describe those
+
+            if typeName != lastType:
+                words.append(typeName)
+                lastType = typeName
+            words.append(sign + detail)
+
+        return " ".join(words)
+
+    #### Setters ####
+    def setProp(self, name, prop, value):
+        return self._run(lambda: self._nativeSetProp(name, str(prop).lower(), str(value).strip()),
+                         lambda: self.fallback.setProp(name, prop, value))
+
+    def _nativeSetProp(self, name, prop, value):
+        if prop == 'touch':
+            state = {'on': 1, 'off': 0}.get(value.lower(), boolFromStr(value))
+            if state != None:
+                return self._setProperty(name, 'Wacom Touch', 'INTEGER', 8, [int(state)]) or None
+
+        elif prop == 'rotate':
+            if value.lower() in self.ROTATIONS:
+                return self._setProperty(name, 'Wacom Rotation', 'INTEGER', 8, [self.ROTATIONS.index(value.lower())]) or None
+
+        elif prop == 'pressurecurve':
+            points = value.split()
+            if len(points) == 4 and all(point.isdigit() for point in points):
+                return self._setProperty(name, 'Wacom Pressurecurve', 'INTEGER', 32, [int(point) for point in points]) or None
+
+        elif prop == 'maptooutput':
+            matrix = self._outputMatrix(value)
+            if matrix != None:
+                packed = list(struct.unpack('=9I', struct.pack('=9f', *matrix))) # <- FLOAT properties travel as raw 32 bit words
+                return self._setProperty(name, 'Coordinate Transformation Matrix', 'FLOAT', 32, packed) or None
+
+        return None
+
+    def _outputMatrix(self, output):
+        # Same math as xsetwacom's MapToOutput: scale and offset the device onto the output's area of the desktop
+        if output.lower() == 'desktop':
+            return [1, 0, 0, 0, 1, 0, 0, 0, 1]
+
+        geometry = None
+        match = re.fullmatch(r"(\d+)x(\d+)\+(\d+)\+(\d+)", output) # <- WIDTHxHEIGHT+X+Y
+        if match != None:
+            geometry = [int(group) for group in match.groups()]
+        elif self._display.has_extension('RANDR'):
+            for monitor in self._display.screen().root.xrandr_get_monitors().monitors:
+                if self._display.get_atom_name(monitor.name) == output:
+                    geometry = [monitor.width_in_pixels, monitor.height_in_pixels, monitor.x, monitor.y]
+
+        if geometry == None:
+            return None # <- "next", "HEAD-0" and friends are left to xsetwacom
+
+        width, height, x, y = geometry
+        screenWidth  = self._display.screen().width_in_pixels
+        screenHeight = self._display.screen().height_in_pixels
+        return [width/screenWidth, 0, x/screenWidth,
+                0, height/screenHeight, y/screenHeight,
+                0, 0, 1]
+
+    def setButton(self, name, number, value):
+        return self._run(lambda: self._nativeSetButton(name, int(number), str(value)),
+                         lambda: self.fallback.setButton(name, number, value))
+
+    def _nativeSetButton(self, name, number, value):
+        actions = self._parseActions(value)
+        if not actions:
+            return None # <- Empty (reset) and unknown actions go through xsetwacom
+
+        actionAtoms = self._getProperty(name, 'Wacom Button Actions')
+        if not actionAtoms or number < 1 or number > len(actionAtoms) or actionAtoms[number-1] == X.NONE:
+            return None
+
+        actionName = self._display.get_atom_name(actionAtoms[number-1])
+        return self._setProperty(name, actionName, 'INTEGER', 32, actions) or None
+
+    def _parseActions(self, value):
+        # Encode an xsetwacom action string, Eg. "key +ctrl z", into driver action codes
+        actions    = []
+        actionType = None
+        for word in value.split():
+            if word.lower() in ['key', 'button']:
+                actionType = word.lower()
+                continue
+            if actionType == None:
+                return None
+
+            press   = not word.startswith('-')
+            release = not word.startswith('+')
+            detail  = word.lstrip('+-')
+            if actionType == 'button':
+                if not detail.isdigit():
+                    return None
+                code = self.AC_BUTTON | int(detail)
+            else:
+                keysym = XK.string_to_keysym(keysymName(detail))
+                keycode = self._display.keysym_to_keycode(keysym) if keysym != X.NoSymbol else 0
+                if keycode == 0:
+                    return None
+                code = self.AC_KEY | keycode
+
+            if press:
+                actions.append(code | self.AC_KEYBTNPRESS)
+            if release:
+                actions.append(code)
+
+        return actions
+
+    #### Everything else ####
+    def estimatedCost(self):
+        return 1.0 # <- One round trip on an open connection, no fork/exec
+
+    def getDevices(self):
+        return self.fallback.getDevices()
+
+    def getDeviceId(self, deviceType):
+        return self.fallback.getDeviceId(deviceType)
+
+# Selectable backends for Device objects, choose with $TABLETCFG_BACKEND or setBackend()
+BACKENDS = {
+    'xsetwacom': Xsetwacom,
+    'native'   : XinputNative,
+}
+_backend    = os.environ.get('TABLETCFG_BACKEND', 'xsetwacom')
+if not _backend in BACKENDS:
+    print("Unknown TABLETCFG_BACKEND:", _backend, "- using xsetwacom")
+    _backend = 'xsetwacom'
+_interfaces = {}
+
+def setBackend(name):
+    global _backend
+    if not name in BACKENDS:
+        raise ValueError("Unknown command interface backend: {}".format(name))
+    _backend = name
+
+def getInterface(name=None):
+    # Backends are shared, so the native one keeps a single X connection for every Device
+    name = name if name != None else _backend
+    if not name in _interfaces:
+        _interfaces[name] = BACKENDS[name]()
+    return _interfaces[name]
+
+class DeviceRegistry():
+    '''
+    DeviceRegistry:
+        Enumerating devices costs one "xsetwacom list devices" plus udev and xinput lookups
+        per device, so we do it once and hand out the same Device objects to everybody
+        (TabletInfo, SettingsManager, ButtonManager, listeners, ...).
+
+        The cached map is only thrown away when the udev Daemon sees an input device being
+        added or removed, the next caller then pays for one fresh enumeration.
+    '''
+    def __init__(self, interface):
+        self.interface     = interface
+        self.hits          = 0
+        self.misses        = 0
+        self.invalidations = 0
+        self._devices      = None
+        self._valid        = False
+        self._lock         = Lock() # <- Only one thread enumerates, the others wait for its result
+
+    def __str__(self):
+        return "DeviceRegistry(Hits: {}, Misses: {}, Invalidations: {})".format(self.hits, self.misses, self.invalidations)
+
+    def getDevices(self):
+        with self._lock:
+            if self._valid:
+                self.hits += 1
+            else:
+                self.misses  += 1
+                self._devices = self.interface.getDevices()
+                self._valid   = True
+
+            return self._devices
+
+    def getDeviceId(self, deviceType):
+        devices = self.getDevices()
+        if devices != None:
+            return devices[deviceType].id
+
+    def invalidate(self):
+        with self._lock:
+            if self._valid:
+                self.invalidations += 1
+            self._valid = False
+
+    def refresh(self):
+        self.invalidate()
+        return self.getDevices()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'invalidations': self.invalidations}
+
+udevContext = Context() # <- Shared, building a Context per device lookup is wasteful
+inputNodes  = InputNodeIndex(udevContext)
+
 xsetwacom = Xsetwacom()
 xinput    = Xinput()
 xrandr    = XrandR()
 
+deviceRegistry = DeviceRegistry(xsetwacom)
+
+def compareBackends():
+    # Read every setting the app uses through both backends and report any disagreement.
+    # Run against a real tablet, or Xvfb with a uinput tablet that the wacom driver picked up.
+    native  = getInterface('native')
+    devices = xsetwacom.getDevices()
+    if devices == None:
+        print("No devices to compare")
+        return False
+
+    same = True
+    for deviceType, device in devices.items():
+        for prop in ['touch', 'mode', 'rotate', 'pressurecurve']:
+            expected = xsetwacom.getProp(device.name, prop)
+            actual   = native.getProp(device.name, prop)
+            if expected != actual:
+                same = False
+                print("{} {}: xsetwacom: \"{}\" native: \"{}\"".format(deviceType, prop, expected, actual))
+        for button in [1, 2, 3, 8, 9]:
+            expected = xsetwacom.getButton(device.name, button)
+            actual   = native.getButton(device.name, button)
+            if expected != actual:
+                same = False
+                print("{} button {}: xsetwacom: \"{}\" native: \"{}\"".format(deviceType, button, expected, actual))
+
+    print("Backends agree" if same else "Backends disagree")
+    return same
+
 if __name__ == '__main__':
+    if '--compare-backends' in sys.argv:
+        sys.exit(0 if compareBackends() else 1)
+
     #### Button States Test ####
     bindings = []
-    devices = xsetwacom.getDevices()
+    devices = deviceRegistry.getDevices()
     # Clear bindings first, or we cant read them
     # Just give the user fair warning, since the use case for this involves rebinding all the buttons...
     for i in range(1, 10):
@@ -7,51 +7,44 @@ from PyQt6.QtGui        import QIcon, QPixmap, QPainter
 from PyQt6.QtCore       import QSize, QTimer, pyqtSignal
 from PyQt6.QtSvg        import QSvgRenderer
 from PyQt6.QtSvgWidgets import QSvgWidget
-from PyQt6              import uic
 
 ## Local Imports ##
-from lib.tabinfo           import TabletInfo
-from lib.settings          import SettingsManager, SETTINGSDIR
-from lib.buttons           import ButtonManager
-from lib.daemon            import Daemon
-from lib.commandInterfaces import xrandr
+from lib.uiCache           import loadUi
+from lib.workers           import workerPool
+from lib.monitors          import monitorTopology
 
 ## Custom Widgets ##
-from lib.keybindList          import KeybindList, KeybindListElement
+from lib.keybindList          import KeybindList
 from lib.setKeyBindDialog     import SetKeyBindDialog
 from lib.quickSetDialog       import QuickSetDialog
 from lib.warningResetBindings import WarningResetBindingsDialog
 from lib.addProfileDialog     import AddProfileDialog
 
 class ConfigUI(QWidget):
+    '''
+    The settings window. Built the first time it is opened (see Main.ensureConfigUI), the tablet
+    itself is loaded, applied and watched by Main through the shared TabletSession.
+    '''
     #### DEFINE SIGNALS ####
-    startDaemon = pyqtSignal()
-    stopDaemon  = pyqtSignal()
-    resetUI     = pyqtSignal(bool) # Signal Returns: True if tablet is present, False if tablet is not present
-
     profileListChanged  = pyqtSignal()
     earlyDismisalSignal = pyqtSignal()
 
 
-    def __init__(self, parent=None):
+    def __init__(self, session, parent=None):
         super(ConfigUI, self).__init__(parent)
         #### LOAD UI FILES ####
-        self.ui = uic.loadUi("lib/qtUI/configUI.ui", self)
+        self.ui = loadUi("lib/qtUI/configUI.ui", self)
 
         #### VARIABLES ####
         self.parent   = parent
-        self.daemon   = Daemon()
-        self.tabInfo  = TabletInfo()
-        self.settings = self.doLoadSettings()
-        self.buttons  = self.doLoadActiveButtonProfile()
-        self.monitors = xrandr.getActiveMonitorList()
+        self.session  = session # <- tabInfo, settings and buttons live here, shared with Main
+        self.monitors = [] # <- Fetched on a worker by populateFeilds
+        self.uiStale  = False # <- Set when the active profile changed while the window was hidden
 
         #### Widgets ####
         self.keybindList = KeybindList(self)
 
         #### Connect Signals ####
-        self.startDaemon.connect(self.setupDaemon)
-        self.stopDaemon.connect(self.daemon.stop)
         self.modeComboBox.currentIndexChanged.connect(self.doChangeTrackingMode)
         self.orientationComboBox.currentIndexChanged.connect(self.doChangeOrientation)
         self.mapToMonitorComboBox.currentIndexChanged.connect(self.doChangeMonitorMapping)
@@ -69,59 +62,24 @@ class ConfigUI(QWidget):
         self.ui.viewTabletButtonsLabel.linkActivated.connect(self.testMethod)
 
     #### Data Handling ####
+    @property
+    def tabInfo(self):
+        return self.session.tabInfo
+
+    @property
+    def settings(self):
+        return self.session.settings
+
+    @property
+    def buttons(self):
+        return self.session.buttons
+
     def deloadDataObjects(self):
-        self.tabInfo  = None
-        self.settings = None
-        self.buttons  = None
-        self.monitors = None
+        self.monitors = []
 
     def reloadDataObjects(self):
-        self.tabInfo  = TabletInfo()
-        self.settings = self.doLoadSettings()
-        self.buttons  = self.doLoadActiveButtonProfile()
-        self.monitors = xrandr.getActiveMonitorList()
-
-    def applyAllSettings(self):
-        self.settings.applyAll()
-        self.buttons.applyButtons(suppressOutput=True)
-
-    def setupDaemon(self):
-
-        self.daemon.setAddHandler(self.devicePlugged)
-        self.daemon.setRemoveHandler(self.deviceUnplugged)
-        self.daemon.start()
-
-    def deviceUnplugged(self, device):
-        # Fired when any device is unplugged/removed via USB
-        try:
-            idPath = device.properties["ID_PATH"]
-            idTabletPad = device.properties["ID_INPUT_TABLET_PAD"]
-            if (idTabletPad == "1") and (idPath == self.tabInfo.getIdPath()):
-                # Was the device im processing a tablet pad
-                # And if so, was it MY tablet pad
-                print("Tablet device at {} was removed".format(idPath))
-                # Shut down all window interaction here
-                self.earlyDismisalSignal.emit()
-                self.resetUI.emit(False)
-
-        except KeyError:
-            pass
-
-    def devicePlugged(self, device):
-        # Fired when any device is plugged in/added via USB
-        try:
-            '''
-            for i in device.properties:
-                print(i, device.properties[i])
-            '''
-            idSerial    = device.properties["ID_SERIAL"].replace("_", " ")
-            idTabletPad = device.properties["ID_INPUT_TABLET_PAD"]
-            if idTabletPad == "1":
-                print("Found new tablet device:", idSerial)
-                self.resetUI.emit(True)
-
-        except KeyError:
-            pass
+        # The session was reloaded by Main, only the window's own data is left. populateFeilds fetches it
+        self.monitors = []
 
     #### Determiners #####
     def determineStylusComboBoxIndex(self, setting):
@@ -153,61 +111,6 @@ class ConfigUI(QWidget):
 
     #### Do'ers ####
 
-    def doLoadSettings(self):
-        if not self.tabInfo.isTabletPresent():
-            return None
-
-        name = self.tabInfo.getGenericName()
-        model = self.tabInfo.getModel()
-        # Assertain a good directory name for per model settings
-        perDeviceName = "{} {}".format(name, model).replace(" ", "_")
-        perDeviceDir  = os.path.join(SETTINGSDIR, perDeviceName)
-        perDeviceSettings = os.path.join(perDeviceDir, "settings.json")
-        # Create settings object.
-        settings = SettingsManager(perDeviceSettings)
-        # Load settings if they exist, or generate new ones
-        if os.path.isfile(perDeviceSettings):
-            print("Loaded per device settings from:", perDeviceSettings)
-            settings.load()
-        else:
-            print("Generating new per device settings at:", perDeviceSettings)
-            settings.genDefaultSettings()
-
-        return settings
-
-    def doLoadActiveButtonProfile(self):
-        if not self.tabInfo.isTabletPresent():
-            return None
-
-        perDeviceDir = self.settings.perDeviceDir
-        # Given that we know where per device settings are saved
-        # Assemble the ButtonProfiles directory and Last Active Profile Uri
-        profilesDir  = os.path.join(perDeviceDir, "ButtonProfiles") # <-- The location where button profiles are saved
-        lastActiveProfile = self.settings.get('active_profile') # <-- Last loaded profile json file
-        lastActiveProfileUri = os.path.join(profilesDir, lastActiveProfile) # <-- The exact location of the last loaded profile json file
-
-        # Load profile data if it exists, or generate a new default one
-        if os.path.isfile(lastActiveProfileUri):
-            print("Loaded button profile settings from last known active profile:", lastActiveProfileUri)
-            buttons = ButtonManager(profilesDir, activeProfile=lastActiveProfile)
-            buttons.load()
-
-        else:
-            print("Could not find last active button profile:", lastActiveProfile)
-            print("Loaded default button profile...")
-            self.settings.set('active_profile', 'default.json')
-            buttons = ButtonManager(profilesDir)
-            if os.path.isfile(os.path.join(profilesDir, "default.json")):
-                buttons.load()
-
-            else:
-                buttons.genDefaultProfile()
-                buttons.load()
-
-        buttons.loadProfileList()
-
-        return buttons
-
     def doShowKeybindDialogByIndex(self, bindIndex):
         bindDict = self.buttons.getButton(bindIndex)
 
@@ -217,8 +120,7 @@ class ConfigUI(QWidget):
             if exitStatus:
                 self.buttons.setButton(bindIndex, dialog.newBinding['value'])
                 self.buttons.applyButton(bindIndex)
-                self.keybindList.setItems(self.buttons.getButtons())
-                self.keybindList.notifyDataSetChanged()
+                self.keybindList.notifyItemChanged(bindIndex)
             return exitStatus
 
         else:
@@ -233,8 +135,7 @@ class ConfigUI(QWidget):
             if exitStatus:
                 self.buttons.setButton(bindIndex, dialog.newBinding['value'])
                 self.buttons.applyButton(bindIndex)
-                self.keybindList.setItems(self.buttons.getButtons())
-                self.keybindList.notifyDataSetChanged()
+                self.keybindList.notifyItemChanged(bindIndex)
                 return 1 # <- dialog accepted
             else:
                 if dialog.dismissedEarly:
@@ -272,7 +173,7 @@ class ConfigUI(QWidget):
             QMessageBox.StandardButton.No)
 
         if reply == QMessageBox.StandardButton.Yes:
-            os.remove(self.buttons.activeProfile)
+            self.buttons.removeProfile(self.buttons.activeProfile)
             self.buttons.loadProfileList()
             self.doSwitchActiveProfile(0)
             self.profileListChanged.emit()
@@ -314,18 +215,12 @@ class ConfigUI(QWidget):
 
     def doResetButtons(self):
         self.buttons.resetButtons()
-        self.keybindList.setItems(self.buttons.getButtons())
-        self.keybindList.notifyDataSetChanged()
-
-    def doSwitchActiveProfile(self, profileIndex):
-        self.buttons.switchProfile(profileIndex)
-        newProfileFileName = self.buttons.getProfileFileByIndex(profileIndex)
-        print("Switching active profile to:", newProfileFileName)
-        self.settings.set('active_profile', newProfileFileName)
-        self.settings.save()
-        self.populateButtonProfileComboBox()
-        self.populateKeybindScrollableArea()
-        self.buttons.applyButtons(suppressOutput=True)
+        self.keybindList.notifyDataSetChanged() # <- Only rows that were not at their default repaint
+
+    def doSwitchActiveProfile(self, profileIndex, refreshUi=True):
+        # refreshUi=False: Nobody is looking (Eg. switched from the tray), repopulate when the window is shown
+        self.session.switchProfile(profileIndex)
+        self.profileSwitched(refreshUi)
         # TODO: Create notification informing user of the change
 
     def doChangeTrackingMode(self, index):
@@ -376,15 +271,23 @@ class ConfigUI(QWidget):
 
     #### POPULATORS ####
     def populateFeilds(self):
-
+        # In memory settings fill in right away
         self.populateTabletMode()
         self.populateHandedness()
-        self.populateMonitorMapping()
         self.populateTouchEnabled()
         self.populateStylus()
         self.populateButtonProfileComboBox()
         self.populateKeybindScrollableArea()
-        self.populateInfoTab()
+
+        # Whatever forks a process or asks udev arrives from a worker as it is ready.
+        # A hotplug in the mean time cancels these (Main.toggleUILater), so stale results never land
+        self.tabletDataTextBrowser.setText("Reading tablet information...")
+        workerPool.submit(monitorTopology.names).then(self.monitorsArrived) # <- Cached, xrandr only runs after a layout change
+        workerPool.submit(self.tabInfo.getInfoString).then(self.populateInfoTab)
+
+    def monitorsArrived(self, monitors):
+        self.monitors = monitors if monitors != None else []
+        self.populateMonitorMapping()
 
     def populateTabletMode(self):
         self.modeComboBox.blockSignals(True) # <- Block signal output while we prepair the ui element
@@ -414,6 +317,8 @@ class ConfigUI(QWidget):
     def populateMonitorMapping(self):
         # Populate the combo box based on the currently active displays in xrandr
         self.mapToMonitorComboBox.blockSignals(True) # <- Block signal output while we prepair the ui element
+        while self.mapToMonitorComboBox.count() > 1:
+            self.mapToMonitorComboBox.removeItem(1) # <- Keep "No Mapping", drop the monitors of the last populate
         for monitor in self.monitors:
             self.mapToMonitorComboBox.addItem(monitor)
 
@@ -453,6 +358,19 @@ class ConfigUI(QWidget):
         self.stylusPrimaryComboBox.blockSignals(False)
         self.stylusSecondaryComboBox.blockSignals(False)
 
+    def profileSwitched(self, refreshUi=True):
+        if refreshUi:
+            self.populateButtonProfileComboBox()
+            self.populateKeybindScrollableArea()
+        else:
+            self.uiStale = True
+
+    def populateIfStale(self):
+        if self.uiStale:
+            self.populateButtonProfileComboBox()
+            self.populateKeybindScrollableArea()
+            self.uiStale = False
+
     def populateButtonProfileComboBox(self):
         # Load every profile that exists for this device
         # Assemble a list of Profile Names, and their corrosponding File Names
@@ -486,11 +404,12 @@ class ConfigUI(QWidget):
 
     def populateKeybindScrollableArea(self):
         self.ui.keybindScrollArea.setWidget(self.keybindList)
-        self.keybindList.setItems(self.buttons.getButtons())
-        self.keybindList.notifyDataSetChanged()
+        self.keybindList.setSource(self.buttons) # <- After a switch, only bindings that differ repaint
 
-    def populateInfoTab(self):
-        self.tabletDataTextBrowser.setText(self.tabInfo.getInfoString())
+    def populateInfoTab(self, infoString=None):
+        if infoString == None:
+            infoString = self.tabInfo.getInfoString()
+        self.tabletDataTextBrowser.setText(infoString)
 
     # ==========================================================================
 
@@ -0,0 +1,97 @@
+import os, json, socket
+
+'''
+Control socket:
+    The headless settings daemon (tablet_daemon.py) listens on a Unix socket, one JSON object per line
+    each way. This is the client side and only imports the standard library, so clients (tabletctl.py)
+    start fast. The daemon's side is in controlServer.py.
+
+    -> {"command": "status"}
+    <- {"ok": true, "present": true, "profile": "Krita", "touch": "on", ...}
+    -> {"command": "switch", "profile": "krita.json"}   <- Index, file name or display name
+    -> {"command": "touch", "state": "toggle"}           <- "on", "off" or "toggle"
+    -> {"command": "reapply"}                            <- Reload settings from disk and apply them all
+    <- {"ok": false, "error": "..."}                     <- On failure
+
+GUI lock:
+    wacom_settings.py holds an flock on GUI_LOCK for as long as it runs. While no daemon runs the GUI
+    serves the control socket itself. If it does not (a daemon it relied on died), tabletctl.py checks
+    isGuiRunning() and does not write the settings behind the GUI's back.
+
+Session cache:
+    Whoever loads a tablet session (GUI or daemon) leaves the device names/ids and settings paths in
+    SESSION_CACHE, so tabletctl.py can apply directly without enumerating devices when no daemon runs.
+'''
+
+RUNTIME_DIR     = os.environ.get("XDG_RUNTIME_DIR") or os.environ.get("TMPDIR") or "/tmp"
+CONTROL_SOCKET  = os.path.join(RUNTIME_DIR, "tabletcfg-{}.sock".format(os.getuid()))
+GUI_LOCK        = os.path.join(RUNTIME_DIR, "tabletcfg-{}.gui.lock".format(os.getuid()))
+CONTROL_TIMEOUT = 5.0 # <- Seconds a client waits for an answer, a full reapply takes the longest
+SESSION_CACHE   = os.path.join(os.path.expanduser("~"), ".cache", "TabletCfg", "session.json")
+SESSION_VERSION = 1
+
+def readSessionCache(path=SESSION_CACHE):
+    # {'devices': {type: {'name', 'id'}}, 'settingsFile', 'profilesDir'}, or None if missing/outdated
+    try:
+        with open(path, 'r') as cacheFile:
+            cache = json.loads(cacheFile.read())
+    except (OSError, ValueError):
+        return None
+    if cache.get('version') != SESSION_VERSION:
+        return None
+    return cache
+
+def acquireGuiLock(path=GUI_LOCK):
+    # The open lock file, keep it for as long as the GUI runs. None if another GUI holds it
+    import fcntl
+    lockFile = open(path, 'a')
+    try:
+        fcntl.flock(lockFile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lockFile.close()
+        return None
+    return lockFile
+
+def isGuiRunning(path=GUI_LOCK):
+    if not os.path.exists(path):
+        return False
+    lockFile = acquireGuiLock(path)
+    if lockFile == None:
+        return True
+    lockFile.close() # <- Closing drops the lock again
+    return False
+
+class ControlClient():
+    def __init__(self, path=CONTROL_SOCKET, timeout=CONTROL_TIMEOUT):
+        self.path    = path
+        self.timeout = timeout
+
+    def isRunning(self):
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with self._connect():
+                return True
+        except OSError:
+            return False
+
+    def _connect(self):
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.settimeout(self.timeout)
+        try:
+            connection.connect(self.path)
+        except OSError:
+            connection.close()
+            raise
+        return connection
+
+    def request(self, command, **args):
+        # Raises OSError if no daemon is listening
+        args['command'] = command
+        with self._connect() as connection:
+            connection.sendall(json.dumps(args).encode('utf-8') + b"\n")
+            with connection.makefile('rb') as reader:
+                line = reader.readline()
+        if not line:
+            raise ConnectionError("Settings daemon closed the connection")
+        return json.loads(line)
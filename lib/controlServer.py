@@ -0,0 +1,125 @@
+import os, json
+from threading    import Thread
+from socketserver import ThreadingUnixStreamServer, StreamRequestHandler
+
+try:
+    from lib.control     import ControlClient, CONTROL_SOCKET
+    from lib.persistence import writeBehind
+except ImportError:
+    from control         import ControlClient, CONTROL_SOCKET
+    from persistence     import writeBehind
+
+'''
+Control socket, the serving side. See control.py for the protocol.
+
+    ControlServer(SessionCommands(session).handleRequest).start()
+
+    SessionCommands runs the protocol's commands against a TabletSession. tablet_daemon.py serves it,
+    and so does the GUI while no daemon runs. onChanged(command) is called on the connection's thread
+    after a command changed the session, the GUI uses it to refresh its widgets.
+'''
+
+class SessionCommands():
+    def __init__(self, session, onChanged=None):
+        self.session   = session
+        self.onChanged = onChanged
+        self.commands  = {
+            'status' : self.doStatus,
+            'switch' : self.doSwitch,
+            'touch'  : self.doTouch,
+            'reapply': self.doReapply,
+        }
+
+    def handleRequest(self, request):
+        command = self.commands.get(request.get('command'))
+        if command == None:
+            return {'ok': False, 'error': "Unknown command: {}".format(request.get('command'))}
+
+        with self.session.lock:
+            if request.get('command') != 'reapply':
+                self.session.syncFromDisk()
+            response = command(request)
+        writeBehind.flush() # <- Clients read the files right after we answer
+
+        if response.get('ok') and request.get('command') != 'status' and self.onChanged != None:
+            self.onChanged(request.get('command'))
+        return response
+
+    def requirePresent(self):
+        if not self.session.isPresent():
+            return {'ok': False, 'error': "No tablet present"}
+
+    def doStatus(self, request):
+        response = self.session.status()
+        response['ok'] = True
+        return response
+
+    def doSwitch(self, request):
+        error = self.requirePresent()
+        if error:
+            return error
+        profileIndex = self.session.findProfile(request.get('profile'))
+        if profileIndex == None:
+            return {'ok': False, 'error': "No such profile: {}".format(request.get('profile'))}
+        return {'ok': True, 'profileFile': self.session.switchProfile(profileIndex), 'profile': self.session.buttons.getName()}
+
+    def doTouch(self, request):
+        error = self.requirePresent()
+        if error:
+            return error
+        state = request.get('state', 'toggle')
+        if state not in ['on', 'off', 'toggle']:
+            return {'ok': False, 'error': "Touch state must be on, off or toggle"}
+        return {'ok': True, 'touch': self.session.setTouch(state)}
+
+    def doReapply(self, request):
+        if not self.session.load():
+            return {'ok': False, 'error': "No tablet present"}
+        self.session.applyAll(onlyChanged=False)
+        return {'ok': True}
+
+class ControlRequestHandler(StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request  = json.loads(line)
+                response = self.server.handler(request)
+            except ValueError as e:
+                response = {'ok': False, 'error': "Bad request: {}".format(e)}
+            except Exception as e:
+                response = {'ok': False, 'error': "{}: {}".format(type(e).__name__, e)} # <- Never let one request kill the daemon
+            self.wfile.write(json.dumps(response).encode('utf-8') + b"\n")
+
+class ControlServer(ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, handler, path=CONTROL_SOCKET):
+        # handler(request dict) -> response dict, called on a per connection thread
+        self.handler = handler
+        self.path    = path
+        self._thread = None
+        if os.path.exists(path):
+            if ControlClient(path).isRunning():
+                raise RuntimeError("Another settings daemon is already listening on {}".format(path))
+            os.unlink(path) # <- Left behind by a daemon that died
+
+        oldMask = os.umask(0o177) # <- Socket is only for our user
+        try:
+            super(ControlServer, self).__init__(path, ControlRequestHandler)
+        finally:
+            os.umask(oldMask)
+
+    def start(self):
+        self._thread = Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        print("Control socket listening on:", self.path)
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread != None:
+            self._thread.join()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
@@ -1,6 +1,11 @@
-from pyudev import Context, Monitor, MonitorObserver
+from pyudev    import Context, Monitor, MonitorObserver
+from threading import Timer, Lock
+import time
 
-from lib.util import dump
+from lib.util              import dump
+from lib.commandInterfaces import deviceRegistry
+
+HOTPLUG_SETTLE = 0.5 # <- Seconds of quiet on one ID_PATH before its burst counts as one transition
 
 class Daemon():
     # Consideration:
@@ -21,6 +26,7 @@ class Daemon():
     def stop(self):
         print("Stoping Device Daemon...")
         self.observer.stop()
+        print(deviceRegistry)
 
     def setAddHandler(self, method):
         self.addHandler = method
@@ -32,7 +38,108 @@ class Daemon():
         pass
 
     def handleEvent(self, action, device):
+        if action in ["add", "remove"]:
+            deviceRegistry.invalidate() # <- The device map is stale, the next getDevices() re-enumerates
+
         if action == "add":
             self.addHandler(device)
         elif action == "remove":
             self.removeHandler(device)
+
+class HotplugCoalescer():
+    '''
+    HotplugCoalescer:
+        One tablet plug is a burst of udev "input" events (pad, stylus, eraser, touch, their event
+        and mouse nodes...). Every one of them used to trigger a full reload and re-apply.
+        Feed the Daemon's add/remove events in here instead. Events are grouped by ID_PATH (one
+        physical tablet) and once a group has been quiet for HOTPLUG_SETTLE seconds it becomes a
+        single "arrived" or "left" transition, depending on the last action seen.
+
+        Groups that never contained a tablet pad (mice, keyboards...) are dropped.
+        Handlers get the pad's udev device and run on a timer thread. firstSeen[ID_PATH] keeps the
+        time.monotonic() of the burst's first event, the moment the tablet was actually plugged.
+
+        daemon.setAddHandler(coalescer.deviceAdded)
+        daemon.setRemoveHandler(coalescer.deviceRemoved)
+    '''
+    def __init__(self, settle=HOTPLUG_SETTLE):
+        self.settle         = settle
+        self.arrivedHandler = self.dummy
+        self.leftHandler    = self.dummy
+        self.pending        = {} # <- ID_PATH -> pending group, see feed()
+        self.firstSeen      = {} # <- ID_PATH -> time.monotonic() of the last settled burst's first event
+        self._lock          = Lock()
+
+        self.events      = 0 # <- udev events fed in
+        self.ignored     = 0 # <- Events without an ID_PATH, or groups without a pad
+        self.transitions = 0 # <- arrived/left handler calls
+
+    def __str__(self):
+        return "HotplugCoalescer(Events: {}, Transitions: {}, Merged: {}, Ignored: {})".format(
+            self.events, self.transitions, self.merged(), self.ignored)
+
+    def merged(self):
+        return self.events - self.ignored - self.transitions
+
+    def dummy(self, device):
+        pass
+
+    def setArrivedHandler(self, method):
+        self.arrivedHandler = method
+
+    def setLeftHandler(self, method):
+        self.leftHandler = method
+
+    def deviceAdded(self, device):
+        self.feed("add", device)
+
+    def deviceRemoved(self, device):
+        self.feed("remove", device)
+
+    def feed(self, action, device):
+        idPath = device.properties.get("ID_PATH")
+        with self._lock:
+            self.events += 1
+            if idPath == None:
+                self.ignored += 1
+                return
+
+            group = self.pending.get(idPath)
+            if group == None:
+                group = self.pending[idPath] = {"action": action, "pad": None, "events": 0, "timer": None, "first": time.monotonic()}
+            else:
+                group["timer"].cancel() # <- Still bursting, start the quiet period over
+
+            group["action"]  = action
+            group["events"] += 1
+            if device.properties.get("ID_INPUT_TABLET_PAD") == "1":
+                group["pad"] = device
+
+            group["timer"] = Timer(self.settle, self.settled, args=(idPath,))
+            group["timer"].daemon = True
+            group["timer"].start()
+
+    def settled(self, idPath):
+        with self._lock:
+            group = self.pending.pop(idPath, None)
+            if group == None:
+                return
+            if group["pad"] == None:
+                self.ignored += group["events"]
+                return
+            self.transitions      += 1
+            self.firstSeen[idPath] = group["first"]
+
+        print("Hotplug: tablet at {} {} ({} udev events merged into one)".format(
+            idPath, "arrived" if group["action"] == "add" else "left", group["events"]))
+        if group["action"] == "add":
+            self.arrivedHandler(group["pad"])
+        else:
+            self.leftHandler(group["pad"])
+
+    def cancel(self):
+        with self._lock:
+            for group in self.pending.values():
+                group["timer"].cancel()
+            self.pending = {}
+        print(self)
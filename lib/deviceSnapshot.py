@@ -0,0 +1,139 @@
+import re, time
+
+'''
+DeviceSnapshot:
+    The whole state of one xsetwacom device, read with a single
+    "xsetwacom -s get <device> all" instead of one "xsetwacom get" per parameter.
+
+    Every line of the dump looks like one of:
+        xsetwacom set "Wacom Bamboo 16FG 4x5 Pad pad" "Mode" "Absolute"
+        xsetwacom set "Wacom Bamboo 16FG 4x5 Pad pad" "Button" "3" "key +Control_L "
+        xsetwacom set "Wacom Bamboo 16FG 4x5 Pad pad" "StripLeftUp" "1" "button +4 "
+
+    Values are kept twice:
+    - raw:    exactly what "xsetwacom get" prints for that parameter, so getters can be served from here
+    - values: typed, on/off -> bool, numbers -> int, number lists -> tuple of int, actions stay strings
+
+    Parameter names are case insensitive in xsetwacom, so they are stored lower case.
+    Button actions are stored per button number, Eg. values['button'][3] == "key +Control_L"
+'''
+
+# Parameters that carry an extra argument before their value.
+# For "Button" it is the button number, for wheels and strips it is just
+# their position in the driver's action list, so we only keep it for buttons.
+ACTION_PARAMS = [
+    'button',
+    'relwheelup', 'relwheeldown',
+    'abswheelup', 'abswheeldown',
+    'abswheel2up', 'abswheel2down',
+    'stripleftup', 'stripleftdown',
+    'striprightup', 'striprightdown',
+]
+
+class DeviceSnapshot():
+    def __init__(self, deviceName=None):
+        self.deviceName = deviceName
+        self.takenAt    = time.time()
+        self.raw        = {} # <- param -> string, 'button' -> {number: string}
+        self.values     = {} # <- param -> typed value, 'button' -> {number: string}
+
+    def __str__(self):
+        return "DeviceSnapshot(Device: {}, Parameters: {})".format(self.deviceName, len(self.raw))
+
+    @classmethod
+    def parse(cls, dump, deviceName=None):
+        snapshot = cls(deviceName)
+        if dump == None:
+            return snapshot
+
+        for line in dump.splitlines():
+            words = re.findall(r'"([^"]*)"', line) # <- [device name, parameter, argument, ...]
+            if len(words) < 3:
+                continue
+
+            if snapshot.deviceName == None:
+                snapshot.deviceName = words[0]
+
+            param = words[1].lower()
+            value = words[-1].strip()
+            if param == 'button' and len(words) > 3:
+                snapshot.raw.setdefault('button', {})[int(words[2])] = value
+                snapshot.values.setdefault('button', {})[int(words[2])] = value
+            else:
+                snapshot.raw[param]    = value
+                snapshot.values[param] = value if param in ACTION_PARAMS else cls.toTyped(value)
+
+        return snapshot
+
+    @staticmethod
+    def toTyped(value):
+        if value in ['on', 'off']:
+            return value == 'on'
+
+        words = value.split()
+        if words != [] and all(re.fullmatch(r"-?\d+", word) for word in words):
+            if len(words) == 1:
+                return int(words[0])
+            return tuple(int(word) for word in words)
+
+        return value
+
+    #### Getters ####
+    def has(self, param, number=None):
+        param = str(param).lower()
+        if number != None:
+            return int(number) in self.raw.get(param, {})
+        return param in self.raw and param != 'button'
+
+    def get(self, param, number=None):
+        # Same string "xsetwacom get <device> <param> [number]" would print, or None if we dont have it
+        if not self.has(param, number):
+            return None
+        if number != None:
+            return self.raw[str(param).lower()][int(number)]
+        return self.raw[str(param).lower()]
+
+    def getTyped(self, param, number=None):
+        if not self.has(param, number):
+            return None
+        if number != None:
+            return self.values[str(param).lower()][int(number)]
+        return self.values[str(param).lower()]
+
+    def getButton(self, number):
+        return self.get('button', number)
+
+    def getButtons(self):
+        # [(number, action), ...] in the order xsetwacom listed them
+        return list(self.raw.get('button', {}).items())
+
+    def asDict(self):
+        return dict(self.values)
+
+    def flatten(self):
+        # {'mode': 'Absolute', 'button 2': 'button +2', ...}, raw strings with buttons spelled out
+        state = {}
+        for param, value in self.raw.items():
+            if param == 'button':
+                for number, action in value.items():
+                    state["button {}".format(number)] = action
+            else:
+                state[param] = value
+        return state
+
+    #### Setters ####
+    def forget(self, param, number=None):
+        # Drop a value we just changed, so the next read goes to the device again
+        param = str(param).lower()
+        if number != None:
+            self.raw.get(param, {}).pop(int(number), None)
+            self.values.get(param, {}).pop(int(number), None)
+        elif param != 'button':
+            self.raw.pop(param, None)
+            self.values.pop(param, None)
+
+if __name__ == "__main__":
+    with open("xsetwacom-persistant-settings.sh", 'r') as dump:
+        snapshot = DeviceSnapshot.parse(dump.read())
+    print(snapshot)
+    print(snapshot.asDict())
@@ -1,22 +1,53 @@
-from PyQt6.uic       import loadUi
-from PyQt6.QtCore    import pyqtSignal
-from PyQt6.QtWidgets import QWidget, QVBoxLayout, QSpacerItem, QSizePolicy
+from PyQt6.QtGui     import QPalette
+from PyQt6.QtCore    import Qt, QAbstractListModel, QModelIndex, QEvent, QRect, QSize, pyqtSignal
+from PyQt6.QtWidgets import QListView, QStyledItemDelegate, QStyle, QStyleOptionButton, QApplication, QAbstractItemView
 
 from lib.util        import dump
 
-class KeybindListElement(QWidget):
-    def __init__(self, name, keys, bindIndex, parent):
-        super().__init__()
-        loadUi("lib/qtUI/keybind_list_element.ui", self)
-        self.parent    = parent
-        self.bindIndex = bindIndex
-
-        # populate feilds
-        self.buttonNameLabel.setText(name)
-        self.currentBindingLabel.setText(self.determineBindingText(keys))
-
-        # tell button to open dialog box
-        self.configureBindingToolButton.clicked.connect(self.emitDialogOpenSignal)
+'''
+KeybindList:
+    The pad bindings of the active profile, as a model/view list.
+
+    KeybindListModel reads straight from the ButtonManager and remembers the (id, value) pairs it has
+    shown. refresh() compares them with the manager's current buttons and only emits dataChanged for the
+    rows that differ (plus row inserts/removes when the button count changes), so editing one binding
+    repaints one row, and switching between profiles of the same tablet repaints only the differences.
+    Rows are painted by KeybindItemDelegate, no widgets per row, so pads with dozens of buttons, rings
+    and strips cost nothing extra to build.
+'''
+
+class KeybindListModel(QAbstractListModel):
+    BindingRole  = Qt.ItemDataRole.UserRole + 1 # <- Binding as shown to the user, Eg. "Do Nothing"
+    ButtonIdRole = Qt.ItemDataRole.UserRole + 2
+
+    def __init__(self, parent=None):
+        super(KeybindListModel, self).__init__(parent)
+        self.buttons = None # <- ButtonManager
+        self.shown   = []   # <- (button id, value) per row, as last announced to the view
+
+    def setSource(self, buttonManager):
+        self.buttons = buttonManager
+        return self.refresh()
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.shown)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.shown):
+            return None
+
+        buttonId, value = self.shown[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return "Button {}".format(buttonId)
+        elif role == self.BindingRole:
+            return self.determineBindingText(value)
+        elif role == Qt.ItemDataRole.ToolTipRole:
+            return value
+        elif role == self.ButtonIdRole:
+            return buttonId
+        return None
 
     def determineBindingText(self, keys):
         if "button +0" in keys:
@@ -24,56 +55,117 @@ class KeybindListElement(QWidget):
         else:
             return keys
 
-    def emitDialogOpenSignal(self):
-        self.parent.showDialogButtonClicked.emit(self.bindIndex)
-
-    def test(self):
-        print(self.bindIndex)
-
-    def setInfoRef(self, ref):
-        self.infoRef = ref
-
-class KeybindList(QWidget):
+    def current(self):
+        if self.buttons == None:
+            return []
+        return [(button["id"], button["value"]) for button in self.buttons.getButtons()]
+
+    def refresh(self):
+        # Bring the view up to date with the ButtonManager. Returns how many rows changed
+        current = self.current()
+        changed = 0
+
+        if len(current) < len(self.shown):
+            self.beginRemoveRows(QModelIndex(), len(current), len(self.shown) - 1)
+            del self.shown[len(current):]
+            self.endRemoveRows()
+
+        first = None
+        for row in range(len(self.shown)):
+            if self.shown[row] != current[row]:
+                self.shown[row] = current[row]
+                changed += 1
+                if first == None:
+                    first = row
+            elif first != None:
+                self.dataChanged.emit(self.index(first), self.index(row - 1)) # <- One signal per run of changed rows
+                first = None
+        if first != None:
+            self.dataChanged.emit(self.index(first), self.index(len(self.shown) - 1))
+
+        if len(current) > len(self.shown):
+            changed += len(current) - len(self.shown)
+            self.beginInsertRows(QModelIndex(), len(self.shown), len(current) - 1)
+            self.shown.extend(current[len(self.shown):])
+            self.endInsertRows()
+
+        return changed
+
+    def refreshRow(self, row):
+        # Cheaper refresh() when we know only this row changed
+        current = self.current()
+        if len(current) != len(self.shown) or row >= len(current):
+            return self.refresh()
+        if self.shown[row] == current[row]:
+            return 0
+        self.shown[row] = current[row]
+        self.dataChanged.emit(self.index(row), self.index(row))
+        return 1
+
+class KeybindItemDelegate(QStyledItemDelegate):
+    configureClicked = pyqtSignal(int)
+
+    ROWHEIGHT   = 40 # <- Same as the old keybind_list_element.ui rows
+    BUTTONWIDTH = 32
+
+    def sizeHint(self, option, index):
+        return QSize(340, self.ROWHEIGHT)
+
+    def buttonRect(self, rect):
+        return QRect(rect.right() - self.BUTTONWIDTH - 6, rect.top() + 6, self.BUTTONWIDTH, rect.height() - 12)
+
+    def paint(self, painter, option, index):
+        style = option.widget.style() if option.widget != None else QApplication.style()
+        style.drawPrimitive(QStyle.PrimitiveElement.PE_PanelItemViewItem, option, painter, option.widget)
+
+        buttonRect  = self.buttonRect(option.rect)
+        textRect    = option.rect.adjusted(9, 0, -(self.BUTTONWIDTH + 18), 0)
+        binding     = index.data(KeybindListModel.BindingRole)
+        bindingText = option.fontMetrics.elidedText(binding, Qt.TextElideMode.ElideLeft, textRect.width() // 2)
+
+        painter.save()
+        if option.state & QStyle.StateFlag.State_Selected:
+            painter.setPen(option.palette.color(QPalette.ColorRole.HighlightedText))
+        painter.drawText(textRect, Qt.AlignmentFlag.AlignVCenter | Qt.AlignmentFlag.AlignLeft, index.data())
+        painter.drawText(textRect, Qt.AlignmentFlag.AlignVCenter | Qt.AlignmentFlag.AlignRight, bindingText)
+        painter.restore()
+
+        button = QStyleOptionButton()
+        button.rect  = buttonRect
+        button.text  = "..."
+        button.state = QStyle.StateFlag.State_Enabled | QStyle.StateFlag.State_Raised
+        style.drawControl(QStyle.ControlElement.CE_PushButton, button, painter, option.widget)
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() == QEvent.Type.MouseButtonRelease and self.buttonRect(option.rect).contains(event.position().toPoint()):
+            self.configureClicked.emit(index.row())
+            return True
+        return super(KeybindItemDelegate, self).editorEvent(event, model, option, index)
+
+class KeybindList(QListView):
     showDialogButtonClicked = pyqtSignal(int)
 
     def __init__(self, parent):
         super(KeybindList, self).__init__(parent)
 
-        self.parent = parent
-
-        self.items    = []
-        self.elements = [] #List containing KeybindListElements
-        self.layout   = QVBoxLayout()
-        self.setLayout(self.layout)
-
-    def setItems(self, items):
-        self.items = items
-
-    def _resetElements(self):
-        for element in self.elements:
-            element.deleteLater()
-            
-        self.elements = [] # Reset element list
-        for i in self.items:
-            newElement = KeybindListElement(name = "Button {}".format(i["id"]),
-                                            keys = i["value"],
-                                            bindIndex=self.items.index(i),
-                                            parent = self)
-            newElement.setInfoRef(self.parent.tabInfo)
-            self.elements.append(newElement)
-
-    def _renderElements(self):
-        for element in self.elements:
-            self.layout.addWidget(element)
-        self.layout.addStretch()
-
-    def _clearSelf(self):
-        while self.layout.count():
-            child = self.layout.takeAt(0)
-            if child.widget():
-                child.widget().deleteLater()
+        self.parent   = parent
+        self.keybindModel    = KeybindListModel(self)
+        self.keybindDelegate = KeybindItemDelegate(self)
+
+        self.setModel(self.keybindModel)
+        self.setItemDelegate(self.keybindDelegate)
+        self.setUniformItemSizes(True) # <- Lets the view lay out thousands of rows without asking each one
+        self.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
+        self.setMouseTracking(True)
+
+        self.keybindDelegate.configureClicked.connect(self.showDialogButtonClicked.emit)
+        self.activated.connect(lambda index: self.showDialogButtonClicked.emit(index.row())) # <- Enter or double click
+
+    def setSource(self, buttonManager):
+        self.keybindModel.setSource(buttonManager)
+
+    def notifyItemChanged(self, bindIndex):
+        self.keybindModel.refreshRow(bindIndex)
 
     def notifyDataSetChanged(self):
-        self._clearSelf()
-        self._resetElements()
-        self._renderElements()
+        self.keybindModel.refresh()
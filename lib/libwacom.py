@@ -0,0 +1,324 @@
+import os, sys, json, time, tempfile
+from pathlib import Path
+
+try:
+    from lib.persistence import writeJsonAtomic
+except ImportError:
+    from persistence     import writeJsonAtomic
+
+'''
+Libwacom:
+    Lookups into the libwacom tablet database (/usr/share/libwacom/).
+
+    LibwacomIndex:
+        TabletInfo used to open and read every .tablet file, line by line, on every
+        construction (startup and every hotplug) just to find the one whose DeviceMatch
+        is ours. Instead we scan the directory once into a DeviceMatch -> (.tablet, layout svg)
+        map, keep it in memory, and cache it on disk. The disk copy is only trusted while
+        the libwacom directory's mtime is unchanged, which catches package updates since
+        those add, remove or rename files.
+
+        A DeviceMatch line can list several devices, Eg. "usb:056a:00d1;usb:056a:00d2;",
+        newer libwacom versions also write them as "usb|056a|00d1|Optional Name".
+        Every entry is indexed as "bus:vendor:product" in lower case.
+
+    parseTabletFile / TabletMetadata:
+        Single pass keyfile parser for .tablet files. Group and key names are lower cased
+        ("Class" becomes "_class" so it can be reached as an attribute) and values are typed:
+        "true"/"false" -> bool, digits -> int, ";" separated -> list, anything else stays a str.
+        Parsed files are cached by path and mtime so repeated hotplugs never re-parse.
+
+    Benchmark against a synthetic tree:
+        python3 lib/libwacom.py --bench [number of files]
+'''
+
+LIBWACOMDIR  = "/usr/share/libwacom/"
+CACHEDIR     = os.path.join(Path.home(), ".cache", "TabletCfg")
+INDEXFILE    = os.path.join(CACHEDIR, "libwacom-index.json")
+INDEXVERSION = 1
+
+def normalizeDevMatch(devMatch):
+    # "usb|056A|00d1|Some Name" or "usb:056a:00d1" -> "usb:056a:00d1"
+    fields = devMatch.strip().replace("|", ":").split(":")
+    return ":".join(fields[:3]).lower()
+
+class LibwacomIndex():
+    def __init__(self, libwacomDir=LIBWACOMDIR, indexFile=INDEXFILE):
+        self.libwacomDir = libwacomDir
+        self.indexFile   = indexFile
+        self.dirMtime    = None
+        self.matches     = None # <- "bus:vendor:product" -> [tablet file, layout svg or None]
+
+    def __str__(self):
+        count = len(self.matches) if self.matches != None else 0
+        return "LibwacomIndex(Dir: {}, Matches: {})".format(self.libwacomDir, count)
+
+    def lookup(self, devMatch):
+        # Return (tablet file, layout file) for a DeviceMatch, or (None, None)
+        if devMatch == None or not self.ensureLoaded():
+            return (None, None)
+
+        match = self.matches.get(normalizeDevMatch(devMatch))
+        if match == None:
+            return (None, None)
+        return tuple(match)
+
+    def ensureLoaded(self):
+        try:
+            dirMtime = os.stat(self.libwacomDir).st_mtime_ns
+        except OSError:
+            return False
+
+        if self.matches != None and self.dirMtime == dirMtime:
+            return True # <- Already in memory and still fresh
+
+        if not self.loadFromDisk(dirMtime):
+            self.build()
+            self.dirMtime = dirMtime
+            self.saveToDisk()
+        return True
+
+    def loadFromDisk(self, dirMtime):
+        try:
+            with open(self.indexFile, 'r') as indexFile:
+                index = json.loads(indexFile.read())
+        except (OSError, ValueError):
+            return False
+
+        if index.get('version') != INDEXVERSION or index.get('dir') != self.libwacomDir or index.get('dirMtime') != dirMtime:
+            return False
+
+        self.matches  = index['matches']
+        self.dirMtime = dirMtime
+        return True
+
+    def saveToDisk(self):
+        try:
+            os.makedirs(os.path.dirname(self.indexFile), exist_ok=True)
+            writeJsonAtomic(self.indexFile, {'version' : INDEXVERSION,
+                                             'dir'     : self.libwacomDir,
+                                             'dirMtime': self.dirMtime,
+                                             'matches' : self.matches})
+        except OSError as e:
+            print("LibwacomIndex: Could not cache index:", e)
+
+    def build(self):
+        # One pass over the tree, only looking at the two keys we need
+        matches = {}
+        for file in sorted(os.listdir(self.libwacomDir)):
+            fullfile = os.path.join(self.libwacomDir, file)
+            if not file.endswith(".tablet") or os.path.isdir(fullfile):
+                continue
+
+            devMatches = []
+            layout     = None
+            with open(fullfile, "r", errors="replace") as tablet:
+                for line in tablet:
+                    if line.startswith("DeviceMatch="):
+                        devMatches = splitList(line.strip().split("=", 1)[1])
+                    elif line.startswith("Layout="):
+                        layout = line.strip().split("=", 1)[1]
+
+            if layout:
+                layoutFile = os.path.join(self.libwacomDir, "layouts", layout)
+            else:
+                layoutFile = os.path.join(self.libwacomDir, "layout/" + file.split(".")[0] + ".svg")
+
+            for devMatch in devMatches:
+                matches.setdefault(normalizeDevMatch(devMatch), [fullfile, layoutFile]) # <- First file wins
+
+        self.matches = matches
+
+libwacomIndex = LibwacomIndex()
+
+#### .tablet metadata ####
+class TabletGroup(dict):
+    # One [Group] of a .tablet file, keys are also reachable as attributes. Missing keys are None
+    def __getattr__(self, attr):
+        return self.get(attr)
+
+class TabletMetadata():
+    __slots__ = ("path", "groups")
+
+    def __init__(self, path=None, groups=None):
+        self.path   = path
+        self.groups = groups if groups != None else {}
+
+    def __getattr__(self, attr):
+        # metadata.device.name, metadata.features.stylus... Missing groups are None
+        if attr.startswith("__"):
+            raise AttributeError(attr)
+        return self.groups.get(attr)
+
+    def __getitem__(self, group):
+        return self.groups[group]
+
+    def __contains__(self, group):
+        return group in self.groups
+
+    def __iter__(self):
+        return iter(self.groups)
+
+    def get(self, group, key=None, default=None):
+        if key == None:
+            return self.groups.get(group, default)
+        return self.groups.get(group, {}).get(key, default)
+
+    def __str__(self):
+        infoString = ""
+        for catagory in self.groups:
+            infoString += "[" + catagory + "]\n"
+            for key, value in self.groups[catagory].items():
+                infoString += key + " -> " + str(value) + "\n"
+        return infoString
+
+# Only these keys are typed, everything else (Name, ModelName, DeviceMatch...) stays the file's string.
+# Keyed by (group, key), lower case: [Buttons] Ring is a list of buttons, [Features] Ring a boolean
+NUMERIC_KEYS = {("device", "width"), ("device", "height"), ("features", "buttons"), ("features", "numstrips"),
+                ("features", "numrings"), ("buttons", "ringnummodes"), ("buttons", "ring2nummodes"),
+                ("buttons", "stripsnummodes"), ("buttons", "strip2nummodes")}
+BOOLEAN_KEYS = {("features", "reversible"), ("features", "stylus"), ("features", "touch"), ("features", "ring"),
+                ("features", "ring2"), ("features", "touchswitch"), ("device", "isreversible")}
+
+class KeyfileBool(int):
+    # Truth value of a "true"/"false" key, printed the way the file spells it
+    def __new__(cls, spelling):
+        value = super(KeyfileBool, cls).__new__(cls, spelling.lower() == "true")
+        value.spelling = spelling
+        return value
+
+    def __str__(self):
+        return self.spelling
+
+    __repr__ = __str__
+
+def parseValue(group, key, value):
+    if (group, key) in BOOLEAN_KEYS and value.lower() in ("true", "false"):
+        return KeyfileBool(value)
+    if (group, key) in NUMERIC_KEYS and value.isdigit():
+        return int(value)
+    return value
+
+def splitList(value):
+    # "usb|056a|00d1;bluetooth|056a|00d1;" -> ["usb|056a|00d1", "bluetooth|056a|00d1"]
+    if value == None:
+        return []
+    return [entry for entry in str(value).split(";") if entry.strip() != ""]
+
+def parseKeyfile(lines):
+    groups = {}
+    group  = None
+    for line in lines:
+        line = line.strip()
+        if line == "" or line[0] == "#":
+            continue
+
+        if line[0] == "[" and line[-1] == "]":
+            groupName = line[1:-1].lower()
+            group     = groups.setdefault(groupName, TabletGroup())
+            continue
+
+        key, sep, value = line.partition("=") # <- First "=" only, values may contain more
+        if not sep or group == None:
+            continue
+        key = key.strip().lower()
+        if key == "class":
+            key = "_class"
+        group[key] = parseValue(groupName, key, value.strip())
+    return groups
+
+class MetadataCache():
+    def __init__(self):
+        self.entries = {} # <- path -> (mtime_ns, size, TabletMetadata)
+        self.hits    = 0
+        self.misses  = 0
+
+    def load(self, path):
+        # Return the parsed .tablet file, or None if it can not be read
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        entry = self.entries.get(path)
+        if entry != None and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+            self.hits += 1
+            return entry[2]
+
+        self.misses += 1
+        with open(path, "r", errors="replace") as tablet:
+            metadata = TabletMetadata(path, parseKeyfile(tablet))
+        self.entries[path] = (stat.st_mtime_ns, stat.st_size, metadata)
+        return metadata
+
+    def __str__(self):
+        return "MetadataCache(Files: {}, Hits: {}, Misses: {})".format(len(self.entries), self.hits, self.misses)
+
+metadataCache = MetadataCache()
+
+def parseTabletFile(path):
+    return metadataCache.load(path)
+
+#### Benchmark ####
+def legacyLookup(libwacomDir, devMatch):
+    # The old TabletInfo.findTabletFileAndLayout, for comparison
+    found = None
+    for file in os.listdir(libwacomDir):
+        fullfile = os.path.join(libwacomDir, file)
+        if not os.path.isdir(fullfile):
+            with open(fullfile, "r") as tablet:
+                contents = tablet.readlines()
+                for line in contents:
+                    if "DeviceMatch=" in line:
+                        devMatchFromFile = line.strip("\n").split("=")[-1]
+                        if devMatchFromFile == devMatch:
+                            found = fullfile
+    return found
+
+def benchmark(fileCount=10000):
+    with tempfile.TemporaryDirectory() as tree:
+        libwacomDir = os.path.join(tree, "libwacom")
+        os.makedirs(os.path.join(libwacomDir, "layouts"))
+        for number in range(fileCount):
+            with open(os.path.join(libwacomDir, "synthetic-{:05d}.tablet".format(number)), 'w') as tablet:
+                tablet.write("# Synthetic tablet {0}\n\n[Device]\nName=Synthetic Tablet {0}\nModelName=SYN-{0}\n"
+                             "DeviceMatch=usb:056a:{0:04x}\nClass=Bamboo\nLayout=synthetic-{0:05d}.svg\n\n"
+                             "[Features]\nStylus=true\nTouch=false\nButtons=4\n".format(number))
+
+        target = "usb:056a:{:04x}".format(fileCount - 1)
+        index  = LibwacomIndex(libwacomDir, os.path.join(tree, "index.json"))
+
+        started = time.perf_counter()
+        legacyLookup(libwacomDir, target)
+        legacy = time.perf_counter() - started
+
+        started = time.perf_counter()
+        index.lookup(target)
+        cold = time.perf_counter() - started
+
+        index = LibwacomIndex(libwacomDir, os.path.join(tree, "index.json")) # <- Fresh process, warm disk cache
+        started = time.perf_counter()
+        index.lookup(target)
+        disk = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for repeat in range(1000):
+            result = index.lookup(target)
+        memory = (time.perf_counter() - started) / 1000
+
+        print("libwacom tree: {} files".format(fileCount))
+        print("legacy linear scan : {:10.3f} ms per lookup".format(legacy * 1000))
+        print("index, cold build  : {:10.3f} ms".format(cold * 1000))
+        print("index, disk cache  : {:10.3f} ms".format(disk * 1000))
+        print("index, in memory   : {:10.3f} ms per lookup".format(memory * 1000))
+        print("match:", result)
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--bench":
+        benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 10000)
+    else:
+        tabletFile, layoutFile = libwacomIndex.lookup(sys.argv[1] if len(sys.argv) > 1 else "usb:056a:00d1")
+        print(tabletFile, layoutFile)
+        print(libwacomIndex)
+        if tabletFile != None:
+            print(parseTabletFile(tabletFile))
@@ -1,13 +1,340 @@
-import time
-from threading import Thread
+import os, time, struct, select, fcntl, shutil
+from subprocess import Popen, PIPE, DEVNULL
+from threading import Thread, Lock, current_thread
 
 try:
-    from lib.commandInterfaces import xinput, xsetwacom
+    from lib.commandInterfaces import xinput, deviceRegistry
 except ImportError:
-    from commandInterfaces import xinput, xsetwacom
+    from commandInterfaces import xinput, deviceRegistry
 
 # xinput --query-state {id/name} <-- for potential tablet button listener
 
+'''
+Tablet button listeners:
+    Every listener has the same interface:
+        setListenerCallback(callback) <- callback(buttonNumber), called once per button press
+        start() / stop()
+
+    buttonNumber is the X button number, the same one xsetwacom uses for "Button N".
+    Use createButtonListener() to get the best listener that works on this system.
+
+    EvdevButtonListener:
+        Reads the PAD's evdev node directly and sleeps in epoll until the kernel has an event for us,
+        so it costs nothing while idle and does not care what the buttons are currently bound to.
+        It also reports releases and kernel timestamps through setEventCallback(callback),
+        callback(buttonNumber, pressed, timestamp) <- timestamp in seconds, CLOCK_MONOTONIC when the kernel allows it.
+        Needs read access to /dev/input/eventN (usually the "input" group).
+
+    XinputTestListener:
+        For users without access to /dev/input. Runs one long lived "xinput test-xi2 --root <pad>"
+        (or "xinput test <pad>" when test-xi2 is missing) and parses its output as it streams in:
+            lines -> xi2Events / legacyTestEvents -> PointerEvent(kind, button, pressed, time, valuators)
+        Button presses go to the listener callback, every PointerEvent goes to setEventCallback(callback).
+        Raw XI2 events are used so it keeps working while the pad is grabbed.
+
+    TabletButtonListener:
+        Polls "xinput --query-state". Fallback only, it forks a process per poll and only works
+        while the buttons are reset to their defaults (see Xinput.getButtonStates).
+'''
+
+#### evdev constants, see linux/input.h and linux/input-event-codes.h ####
+INPUT_EVENT  = struct.Struct("llHHi") # <- struct input_event: timeval, type, code, value
+EV_KEY       = 0x01
+KEY_MAX      = 0x2ff
+POLL_TIMEOUT = 0.02 # <- Seconds between xinput polls in the fallback listener
+
+def _ioc(direction, number, size):
+    return (direction << 30) | (size << 16) | (ord('E') << 8) | number
+
+EVIOCGBIT_KEY = _ioc(2, 0x20 + EV_KEY, KEY_MAX // 8 + 1)
+EVIOCSCLOCKID = _ioc(1, 0xa0, 4)
+
+# Pad key codes in the order xf86-input-wacom numbers them, only the ones the device has count
+PADKEY_CODES = [
+    0x100, 0x101, 0x102, 0x103, 0x104, 0x105, 0x106, 0x107, 0x108, 0x109, # <- BTN_0 .. BTN_9
+    0x130, 0x131, 0x132, 0x133, 0x134, 0x135,                             # <- BTN_A, B, C, X, Y, Z
+    0x126, 0x127, 0x128, 0x129, 0x12a, 0x12b,                             # <- BTN_BASE .. BTN_BASE6
+    0x136, 0x137, 0x138, 0x139, 0x13a,                                    # <- BTN_TL, TR, TL2, TR2, SELECT
+]
+
+# Older pads (Bamboo, ...) use mouse button codes, these have a fixed index
+MOUSE_CODES = {
+    0x110: 0, # <- BTN_LEFT
+    0x112: 1, # <- BTN_MIDDLE
+    0x111: 2, # <- BTN_RIGHT
+    0x113: 3, # <- BTN_SIDE
+    0x116: 3, # <- BTN_BACK
+    0x114: 4, # <- BTN_EXTRA
+    0x115: 4, # <- BTN_FORWARD
+}
+
+def xButtonNumber(index):
+    # Physical button index -> X button number. X reserves 4-7 for scrolling
+    return index + 1 if index < 3 else index + 5
+
+def padButtonMap(keyBits):
+    # Map evdev key codes to X button numbers, given the EVIOCGBIT(EV_KEY) bitmask
+    def hasKey(code):
+        return keyBits[code // 8] & (1 << (code % 8))
+
+    buttonMap = {}
+    index = 0
+    for code in PADKEY_CODES:
+        if hasKey(code):
+            buttonMap[code] = xButtonNumber(index)
+            index += 1
+
+    for code, mouseIndex in MOUSE_CODES.items():
+        if hasKey(code):
+            buttonMap[code] = xButtonNumber(mouseIndex)
+    return buttonMap
+
+class EvdevButtonListener():
+    def __init__(self, node=None):
+        self.node = node # <- Defaults to the PAD's node when started
+
+        self._workerThread     = None
+        self._listenerCallback = self._dummy
+        self._eventCallback    = self._dummy
+        self._wakeWrite        = None
+        self._wakeLock         = Lock() # <- The worker closes the wake pipe, stop() must not write to a closed one
+        self.buttonMap         = {}
+        self.monotonic         = False
+        self.running           = False
+
+    def _dummy(self, *args, **kwargs):
+        pass
+
+    def setListenerCallback(self, callback):
+        self._listenerCallback = callback
+
+    def setEventCallback(self, callback):
+        self._eventCallback = callback
+
+    @staticmethod
+    def isAvailable(node=None):
+        if node == None:
+            devices = deviceRegistry.getDevices()
+            if not devices or "PAD" not in devices:
+                return False
+            node = devices["PAD"].node
+        return node != None and os.access(node, os.R_OK)
+
+    def start(self):
+        if self.node == None:
+            self.node = deviceRegistry.getDevices()["PAD"].node
+
+        fd = os.open(self.node, os.O_RDONLY | os.O_NONBLOCK | os.O_CLOEXEC)
+        try:
+            keyBits = bytearray(KEY_MAX // 8 + 1)
+            fcntl.ioctl(fd, EVIOCGBIT_KEY, keyBits, True)
+            self.buttonMap = padButtonMap(keyBits)
+
+            try:
+                fcntl.ioctl(fd, EVIOCSCLOCKID, struct.pack("i", time.CLOCK_MONOTONIC))
+                self.monotonic = True # <- Timestamps comparable with time.monotonic()
+            except OSError:
+                self.monotonic = False
+        except OSError:
+            os.close(fd)
+            raise
+
+        wakeRead, self._wakeWrite = os.pipe()
+        self.running       = True
+        self._workerThread = Thread(target=self._doListen, args=(fd, wakeRead, self._wakeWrite), daemon=True)
+        self._workerThread.start()
+
+    def stop(self):
+        if self._workerThread == None:
+            return
+        self.running = False # <- A callback calling stop() gets no more events, not even from the current read
+        with self._wakeLock:
+            if self._wakeWrite != None: # <- None once the worker left on its own, Eg. on unplug
+                os.write(self._wakeWrite, b"x") # <- Wakes epoll, the worker closes everything on its way out
+
+        if self._workerThread is not current_thread(): # <- stop() may be called from a callback
+            self._workerThread.join()
+        self._workerThread = None
+
+    def _doListen(self, fd, wakeRead, wakeWrite):
+        poller = select.epoll()
+        poller.register(fd, select.EPOLLIN)
+        poller.register(wakeRead, select.EPOLLIN)
+        try:
+            while True:
+                for eventFd, mask in poller.poll():
+                    if eventFd == wakeRead:
+                        return
+                    if mask & (select.EPOLLHUP | select.EPOLLERR):
+                        print("EvdevButtonListener: {} went away".format(self.node))
+                        return
+                    if not self._readEvents(fd) or not self.running:
+                        return
+        finally:
+            poller.close()
+            os.close(fd)
+            with self._wakeLock:
+                if self._wakeWrite == wakeWrite: # <- Not if stop() and start() already made a new pipe
+                    self._wakeWrite = None
+                os.close(wakeRead)
+                os.close(wakeWrite)
+
+    def _readEvents(self, fd):
+        try:
+            data = os.read(fd, INPUT_EVENT.size * 64)
+        except BlockingIOError:
+            return True
+        except OSError as e:
+            print("EvdevButtonListener: read failed on {}: {}".format(self.node, e)) # <- ENODEV on unplug
+            return False
+
+        for sec, usec, evType, code, value in INPUT_EVENT.iter_unpack(data):
+            if not self.running:
+                break
+            if evType != EV_KEY or value == 2: # <- Ignore key repeats
+                continue
+            buttonNumber = self.buttonMap.get(code)
+            if buttonNumber == None:
+                continue
+
+            self._eventCallback(buttonNumber, value == 1, sec + usec / 1000000)
+            if value == 1 and self.running:
+                self._listenerCallback(buttonNumber)
+        return True
+
+class PointerEvent():
+    def __init__(self, kind, button=None, pressed=None, time=None, valuators=None):
+        self.kind      = kind      # <- "button" or "motion"
+        self.button    = button    # <- X button number
+        self.pressed   = pressed
+        self.time      = time      # <- X server time in milliseconds, if xinput printed one
+        self.valuators = valuators # <- {axis: value} for motion
+
+    def __str__(self):
+        if self.kind == "button":
+            return "PointerEvent(Button: {}, Pressed: {}, Time: {})".format(self.button, self.pressed, self.time)
+        return "PointerEvent(Motion: {}, Time: {})".format(self.valuators, self.time)
+
+XI2_BUTTON_EVENTS = {"RawButtonPress": True, "RawButtonRelease": False, "ButtonPress": True, "ButtonRelease": False}
+XI2_MOTION_EVENTS = ("RawMotion", "Motion")
+
+def xi2Blocks(lines):
+    # "EVENT type 15 (RawButtonPress)" followed by indented "key: value" lines -> (name, {key: value})
+    name   = None
+    fields = {}
+    for line in lines:
+        if line.startswith("EVENT type"):
+            if name != None:
+                yield name, fields
+            name   = line[line.find("(") + 1:line.rfind(")")]
+            fields = {}
+        elif name != None:
+            key, sep, value = line.strip().partition(":")
+            if sep:
+                fields[key] = value.strip() # <- Valuators show up as "0: 123.45 (123.45)"
+    if name != None:
+        yield name, fields
+
+def xi2Events(lines, deviceId=None):
+    for name, fields in xi2Blocks(lines):
+        if deviceId != None and fields.get("device", "").split(" ")[0] != str(deviceId):
+            continue
+        eventTime = int(fields["time"]) if fields.get("time", "").isdigit() else None
+        if name in XI2_BUTTON_EVENTS and fields.get("detail", "").isdigit():
+            yield PointerEvent("button", int(fields["detail"]), XI2_BUTTON_EVENTS[name], eventTime)
+        elif name in XI2_MOTION_EVENTS:
+            yield PointerEvent("motion", time=eventTime, valuators={key: value.split(" ")[0] for key, value in fields.items() if key.isdigit() and value})
+
+def legacyTestEvents(lines):
+    # "button press   1", "button release 1", "motion a[0]=5 a[1]=7"
+    for line in lines:
+        words = line.split()
+        if len(words) >= 3 and words[0] == "button" and words[2].isdigit():
+            yield PointerEvent("button", int(words[2]), words[1] == "press")
+        elif words and words[0] == "motion":
+            valuators = {}
+            for word in words[1:]:
+                axis, sep, value = word.partition("=")
+                if sep:
+                    valuators[axis.strip("a[]")] = value
+            yield PointerEvent("motion", valuators=valuators)
+
+class XinputTestListener():
+    def __init__(self, deviceId=None):
+        self.deviceId = deviceId # <- Defaults to the PAD's id when started
+
+        self._process          = None
+        self._workerThread     = None
+        self._listenerCallback = self._dummy
+        self._eventCallback    = self._dummy
+        self.running           = False
+
+    def _dummy(self, *args, **kwargs):
+        pass
+
+    def setListenerCallback(self, callback):
+        self._listenerCallback = callback
+
+    def setEventCallback(self, callback):
+        self._eventCallback = callback
+
+    @staticmethod
+    def isAvailable():
+        return shutil.which("xinput") != None
+
+    def start(self):
+        if self.deviceId == None:
+            self.deviceId = deviceRegistry.getDevices()["PAD"].id
+
+        command = ["xinput", "test-xi2", "--root", str(self.deviceId)]
+        parser  = xi2Events
+        if not self._hasTestXi2():
+            command = ["xinput", "test", str(self.deviceId)]
+            parser  = legacyTestEvents
+        if shutil.which("stdbuf"):
+            command = ["stdbuf", "-oL"] + command # <- Line buffered, otherwise events sit in a pipe buffer
+
+        self._process      = Popen(command, stdout=PIPE, stderr=DEVNULL, text=True, bufsize=1)
+        self.running       = True
+        self._workerThread = Thread(target=self._doListen, args=(self._process, parser), daemon=True)
+        self._workerThread.start()
+
+    def _hasTestXi2(self):
+        try:
+            output = xinput._xinput("--version")
+        except ValueError:
+            return False
+        for line in output.splitlines():
+            if line.startswith("XI version on server:"):
+                return not line.split(":")[-1].strip().startswith("1.")
+        return True
+
+    def stop(self):
+        if self._workerThread == None:
+            return
+        self.running = False
+        if self._process.poll() == None:
+            self._process.terminate() # <- stdout closes, the worker's loop ends
+
+        if self._workerThread is not current_thread(): # <- From a callback, the worker reaps xinput on its way out
+            self._workerThread.join()
+        self._workerThread = None
+
+    def _doListen(self, process, parser):
+        events = parser(process.stdout, self.deviceId) if parser is xi2Events else parser(process.stdout)
+        try:
+            for event in events:
+                if not self.running:
+                    break
+                self._eventCallback(event)
+                if event.kind == "button" and event.pressed and self.running:
+                    self._listenerCallback(event.button)
+        finally:
+            if process.poll() == None:
+                process.terminate()
+            process.stdout.close()
+            process.wait() # <- No zombie xinput, whichever thread stopped us
+
 class TabletButtonListener():
     def __init__(self):
         self._doContinue       = False
@@ -24,7 +351,7 @@ class TabletButtonListener():
         # Listen for tablet keys
         # Parse into list of keys [0, 0, 0, 0, 0] <- pressed keys = 1
         # Pass keys list to callback
-        padId = xsetwacom.getDevices()["PAD"].id
+        padId = deviceRegistry.getDevices()["PAD"].id
         while self._doContinue:
             currentKeyStates = xinput.getButtonStates(padId)
             buttonNumber = 1
@@ -34,6 +361,7 @@ class TabletButtonListener():
                     break
 
                 buttonNumber += 1
+            time.sleep(POLL_TIMEOUT) # <- Dont pin a core forking xinput
 
     def start(self):
         self._doContinue = True
@@ -42,6 +370,16 @@ class TabletButtonListener():
     def stop(self):
         self._doContinue = False
 
+def createButtonListener():
+    # Prefer the evdev listener, then a streaming xinput test, then polling xinput
+    if EvdevButtonListener.isAvailable():
+        return EvdevButtonListener()
+    if XinputTestListener.isAvailable():
+        print("createButtonListener: PAD event node is not readable, streaming xinput test-xi2 instead")
+        return XinputTestListener()
+    print("createButtonListener: PAD event node is not readable, polling xinput instead")
+    return TabletButtonListener()
+
 class Listener():
     def __init__(self):
         self._workerThread = Thread(target=self.workerExecutor, daemon=True)
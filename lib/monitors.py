@@ -0,0 +1,217 @@
+import os, select
+from threading import Thread, Timer, Lock
+
+try:
+    # Optional: RandR notifications straight from the X server
+    from Xlib     import display as xdisplay
+    from Xlib.ext import randr
+except ImportError:
+    xdisplay = None
+
+try:
+    from lib.commandInterfaces import xrandr, udevContext
+except ImportError:
+    from commandInterfaces     import xrandr, udevContext
+
+'''
+Monitor topology:
+    "xsetwacom set <stylus> MapToOutput" is computed against the output layout of the moment, so
+    it has to be re-run whenever the outputs change, and nothing did. Asking xrandr every time
+    the window was populated did not help with that either, it only cost a fork.
+
+    MonitorTopology caches the active outputs as (name, width, height, x, y) and only asks
+    xrandr again once it is told the layout may have changed:
+        RandrWatcher <- RandR screen/crtc/output change events, when python-xlib is installed
+        DrmWatcher   <- udev "change" events of the drm subsystem (connector hotplug), otherwise
+    Both are bursty (one re-plug is several events), so a refresh happens TOPOLOGY_SETTLE seconds
+    after the last one. Change handlers get handler(oldMonitors, newMonitors) on a timer thread.
+
+    layoutFor(output, monitors) is the part of a layout a MapToOutput setting depends on. Compare
+    it between the old and new monitors to know if a device actually needs to be re-mapped.
+
+    monitorTopology.addChangeHandler(session.remapOutputs)
+    monitorTopology.watch()
+'''
+
+TOPOLOGY_SETTLE = 0.3 # <- Seconds of quiet after a RandR/drm event before xrandr is asked again
+
+class RandrWatcher():
+    def __init__(self, callback):
+        self.callback = callback
+        self.display  = xdisplay.Display() # <- Raises when there is no X server to talk to
+        if not self.display.has_extension('RANDR'):
+            self.display.close()
+            raise RuntimeError("X server has no RandR")
+        self.wakeRead, self.wakeWrite = os.pipe()
+        self.thread  = None
+        self.running = False
+
+    def __str__(self):
+        return "RandrWatcher(Running: {})".format(self.running)
+
+    def start(self):
+        self.display.screen().root.xrandr_select_input(randr.RRScreenChangeNotifyMask |
+                                                       randr.RRCrtcChangeNotifyMask   |
+                                                       randr.RROutputChangeNotifyMask)
+        self.display.flush()
+        self.running = True
+        self.thread  = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        os.write(self.wakeWrite, b'x') # <- Wake select() so the thread sees running == False
+        if self.thread != None:
+            self.thread.join(1)
+        self.display.close()
+        os.close(self.wakeRead)
+        os.close(self.wakeWrite)
+
+    def run(self):
+        while self.running:
+            readable, _, _ = select.select([self.display.fileno(), self.wakeRead], [], [])
+            if not self.running:
+                break
+            changed = False
+            while self.display.pending_events():
+                self.display.next_event()
+                changed = True
+            if changed:
+                self.callback()
+
+class DrmWatcher():
+    def __init__(self, callback):
+        from pyudev import Monitor, MonitorObserver
+        self.callback = callback
+        self.monitor  = Monitor.from_netlink(udevContext)
+        self.monitor.filter_by(subsystem='drm')
+        self.observer = MonitorObserver(self.monitor, self.handleEvent)
+
+    def __str__(self):
+        return "DrmWatcher()"
+
+    def start(self):
+        self.observer.start()
+
+    def stop(self):
+        self.observer.stop()
+
+    def handleEvent(self, action, device):
+        if action == "change": # <- A connector was plugged/unplugged, X picks it up right after
+            self.callback()
+
+class MonitorTopology():
+    def __init__(self, probe=None, settle=TOPOLOGY_SETTLE):
+        self.probe    = probe if probe != None else xrandr.getActiveMonitors
+        self.settle   = settle
+        self.monitors = None # <- [(name, width, height, x, y), ...], None until first probed
+        self.handlers = []
+        self.watcher  = None
+        self.timer    = None
+        self._lock    = Lock()
+
+        self.probes        = 0 # <- xrandr calls made
+        self.notifications = 0 # <- RandR/drm events seen
+        self.changes       = 0 # <- Refreshes that found a different layout
+
+    def __str__(self):
+        return "MonitorTopology(Monitors: {}, Probes: {}, Notifications: {}, Changes: {}, Watcher: {})".format(
+            self.names(probe=False), self.probes, self.notifications, self.changes, self.watcher)
+
+    def addChangeHandler(self, method):
+        self.handlers.append(method)
+
+    def get(self):
+        with self._lock:
+            if self.monitors == None:
+                self._probe()
+            return list(self.monitors or [])
+
+    def names(self, probe=True):
+        monitors = self.get() if probe else (self.monitors or [])
+        return [monitor[0] for monitor in monitors]
+
+    def _probe(self):
+        try:
+            self.probes  += 1
+            self.monitors = self.probe()
+        except (ValueError, OSError) as e:
+            print("Could not read the monitor layout:", e)
+        return self.monitors
+
+    def refresh(self):
+        # Ask xrandr again and call the change handlers if the layout differs. Returns True if it did
+        with self._lock:
+            oldMonitors = self.monitors
+            newMonitors = self._probe()
+            if newMonitors == None or oldMonitors == None or newMonitors == oldMonitors:
+                return False
+            self.changes += 1
+
+        print("Monitor layout changed:", [monitor[0] for monitor in newMonitors])
+        for handler in self.handlers:
+            handler(list(oldMonitors), list(newMonitors))
+        return True
+
+    def notify(self):
+        # Called by the watchers, coalesces a burst of events into one refresh
+        with self._lock:
+            self.notifications += 1
+            if self.timer != None:
+                self.timer.cancel()
+            self.timer = Timer(self.settle, self.refresh)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def watch(self):
+        if self.watcher != None:
+            return self.watcher
+        for watcherClass in [RandrWatcher, DrmWatcher]:
+            if watcherClass == RandrWatcher and xdisplay == None:
+                continue
+            try:
+                self.watcher = watcherClass(self.notify)
+                self.watcher.start()
+                break
+            except Exception as e:
+                print("{} unavailable: {}".format(watcherClass.__name__, e))
+                self.watcher = None
+
+        if self.monitors == None:
+            Timer(0, self.get).start() # <- Prime the cache off the caller's thread, changes are relative to it
+        return self.watcher
+
+    def stop(self):
+        if self.timer != None:
+            self.timer.cancel()
+        if self.watcher != None:
+            self.watcher.stop()
+            self.watcher = None
+
+    @staticmethod
+    def layoutFor(output, monitors):
+        # What a MapToOutput of output depends on. The screen (bounding box of all outputs) is always
+        # part of it, the transformation is relative to the whole desktop
+        if not monitors:
+            return None
+        screen = (max(m[1] + m[3] for m in monitors), max(m[2] + m[4] for m in monitors))
+        if output == None or output.lower() == "desktop" or "+" in output: # <- WIDTHxHEIGHT+X+Y is fixed
+            return screen
+        for monitor in monitors:
+            if monitor[0] == output:
+                return (screen, monitor)
+        return (screen, tuple(monitors)) # <- "next", "HEAD-0" or a missing output, any change counts
+
+monitorTopology = MonitorTopology()
+
+if __name__ == "__main__":
+    import time
+    print(monitorTopology.get())
+    monitorTopology.addChangeHandler(lambda old, new: print("Was:", old, "\nNow:", new))
+    print(monitorTopology.watch())
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        monitorTopology.stop()
+        print(monitorTopology)
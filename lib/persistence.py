@@ -0,0 +1,144 @@
+import os, stat, json, atexit, tempfile
+from threading import Lock, Timer
+
+'''
+Persistence:
+    Every settings change ends with a save(), and a profile reset saves once per button.
+    Instead of truncating and rewriting the JSON in place each time:
+
+    - writeJsonAtomic() writes to a temp file in the same directory, fsyncs it and renames
+      it over the target, so a crash leaves either the old file or the new one, never half of one.
+    - WriteBehind coalesces saves: the newest data for each file is held for WRITE_DELAY
+      seconds and written once. A burst of N saves costs one write.
+
+    Anything still pending is flushed on quit (Main.handleQuit) and, as a safety net, atexit.
+    Files WriteBehind manages are only written through it (write(), remove() when it cant wait),
+    so a queued save can never land on top of a newer one or bring back a deleted file.
+'''
+
+WRITE_DELAY = 0.25 # <- Seconds a save may wait for more saves to the same file
+
+def writeJsonAtomic(path, data):
+    writeTextAtomic(path, json.dumps(data))
+
+def currentUmask():
+    try:
+        with open("/proc/self/status", 'r') as status: # <- Reading it does not change it, unlike os.umask()
+            for line in status:
+                if line.startswith("Umask:"):
+                    return int(line.split()[1], 8)
+    except (OSError, ValueError):
+        pass
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return umask
+
+def fileMode(path):
+    # The permissions the file has now, or what open() would give a new one. mkstemp's are always 0600
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        return 0o666 & ~currentUmask()
+
+def writeTextAtomic(path, text):
+    directory = os.path.dirname(path)
+    mode = fileMode(path)
+    fd, tempPath = tempfile.mkstemp(prefix=".{}.".format(os.path.basename(path)), suffix=".tmp", dir=directory)
+    try:
+        os.fchmod(fd, mode)
+        with os.fdopen(fd, 'w') as tempFile:
+            tempFile.write(text)
+            tempFile.flush()
+            os.fsync(tempFile.fileno())
+        os.replace(tempPath, path)
+    except BaseException:
+        if os.path.exists(tempPath):
+            os.remove(tempPath)
+        raise
+
+    # Make the rename itself durable
+    dirFd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dirFd)
+    finally:
+        os.close(dirFd)
+
+class WriteBehind():
+    def __init__(self, delay=WRITE_DELAY):
+        self.delay     = delay
+        self.requested = 0 # <- save() calls
+        self.written   = 0 # <- Actual file writes
+        self._pending  = {} # <- path -> json string
+        self._lock     = Lock() # <- Guards _pending, never held while writing, so save() does not wait on the disk
+        self._fileLock = Lock() # <- Held while writing, keeps writes of one file in the order they were saved
+        self._timer    = None
+        self._written  = [] # <- Callbacks, called with the path of every file written
+
+    def __str__(self):
+        return "WriteBehind(Requested: {}, Written: {}, Pending: {})".format(self.requested, self.written, len(self._pending))
+
+    def schedule(self, path, data):
+        # Serialize right away, the caller keeps mutating its dict after this returns
+        jsonString = json.dumps(data)
+        with self._lock:
+            self._pending[path] = jsonString
+            self.requested += 1
+            if self._timer == None:
+                self._timer = Timer(self.delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def addWrittenListener(self, callback):
+        self._written.append(callback)
+
+    def isPending(self, path):
+        with self._lock:
+            return path in self._pending
+
+    def write(self, path, data):
+        # Save now instead of WRITE_DELAY later, in order with anything queued. Replaces a pending save of path
+        jsonString = json.dumps(data)
+        with self._fileLock:
+            with self._lock:
+                self._pending.pop(path, None)
+                self.requested += 1
+            self._write(path, jsonString)
+
+    def remove(self, path):
+        # Delete the file, a save that is pending or being written cant recreate it afterwards
+        with self._fileLock:
+            self.discard(path)
+            os.remove(path)
+
+    def discard(self, path):
+        # Forget a pending write, Eg. because the file is about to be deleted
+        with self._lock:
+            self._pending.pop(path, None)
+
+    def flush(self, path=None):
+        # Write everything pending now (or just path)
+        with self._fileLock:
+            with self._lock:
+                if path == None:
+                    writes = self._pending
+                    self._pending = {}
+                    if self._timer != None:
+                        self._timer.cancel()
+                        self._timer = None
+                elif path in self._pending:
+                    writes = {path: self._pending.pop(path)}
+                else:
+                    writes = {}
+
+            for writePath, jsonString in writes.items():
+                self._write(writePath, jsonString)
+
+    def _write(self, path, jsonString):
+        # Caller holds _fileLock
+        writeTextAtomic(path, jsonString)
+        self.written += 1
+        for callback in self._written:
+            callback(path)
+
+writeBehind = WriteBehind()
+atexit.register(writeBehind.flush)
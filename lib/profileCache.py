@@ -0,0 +1,116 @@
+import os, json, copy
+from collections import OrderedDict
+from threading   import Lock, Thread
+
+try:
+    from lib.persistence import writeBehind
+except ImportError:
+    from persistence     import writeBehind
+
+'''
+ProfileCache:
+    LRU cache of parsed button profiles, keyed by file uri.
+
+    Switching profiles used to re-read and re-parse the profile JSON every time.
+    Now the parsed data is kept for the PROFILE_CACHE_SIZE most recently used profiles,
+    and the most recently used ones are loaded ahead of time on a background thread,
+    so picking a profile from the tray does not open a single file.
+
+    Entries remember the mtime and size of the file they were parsed from, and are
+    thrown away when the file changes under us (Eg. tabletctl or the other process saved it).
+    ButtonManager.save() put()s what it saves, and WriteBehind tells us when it has written
+    a file, so our own saves dont count as a change. While a save is pending, ours is newer.
+
+    get() hands out a copy, so unsaved edits to the active profile never leak into the cache.
+'''
+
+PROFILE_CACHE_SIZE = 8 # <- Default, overridden by the 'profile_cache_size' setting
+
+class ProfileCache():
+    def __init__(self, size=PROFILE_CACHE_SIZE):
+        self.size     = size
+        self.hits     = 0
+        self.misses   = 0
+        self._entries = OrderedDict() # <- uri -> [mtime, size, data], oldest first
+        self._lock    = Lock()
+
+        writeBehind.addWrittenListener(self.noteWritten)
+
+    def __str__(self):
+        return "ProfileCache(Size: {}, Cached: {}, Hits: {}, Misses: {})".format(self.size, len(self._entries), self.hits, self.misses)
+
+    def _fileStamp(self, uri):
+        try:
+            stat = os.stat(uri)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def get(self, uri):
+        pending = writeBehind.isPending(uri) # <- Our data is newer than the file, dont compare stamps
+        with self._lock:
+            entry = self._entries.get(uri)
+            if entry != None and (pending or self._fileStamp(uri) == (entry[0], entry[1])):
+                self._entries.move_to_end(uri)
+                self.hits += 1
+                return copy.deepcopy(entry[2])
+
+        self.misses += 1
+        return self.load(uri)
+
+    def load(self, uri):
+        # Parse the profile from disk and cache it
+        writeBehind.flush(uri)
+        stamp = self._fileStamp(uri)
+        with open(uri, 'r') as profileFile:
+            data = json.loads(profileFile.read())
+        self.put(uri, data, stamp)
+        return data
+
+    def put(self, uri, data, stamp=None):
+        # data is what uri holds now (stamp) or will, once WriteBehind wrote it (noteWritten)
+        mtime, size = stamp if stamp != None else (None, None)
+        with self._lock:
+            self._entries[uri] = [mtime, size, copy.deepcopy(data)]
+            self._entries.move_to_end(uri)
+            self._evict()
+
+    def noteWritten(self, uri):
+        # WriteBehind just wrote one of our files, the cached data is what was written
+        with self._lock:
+            entry = self._entries.get(uri)
+            stamp = self._fileStamp(uri)
+            if entry != None and stamp != None:
+                entry[0], entry[1] = stamp
+
+    def invalidate(self, uri=None):
+        with self._lock:
+            if uri == None:
+                self._entries.clear()
+            else:
+                self._entries.pop(uri, None)
+
+    def resize(self, size):
+        with self._lock:
+            self.size = max(1, int(size))
+            self._evict()
+
+    def _evict(self):
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def warm(self, uris):
+        # Load profiles in the background, most recently used first
+        uris = [uri for uri in uris[:self.size] if os.path.isfile(uri)]
+        def doWarm():
+            for uri in reversed(uris): # <- Load the most recent last, so it ends up the least likely to be evicted
+                try:
+                    self.get(uri)
+                except (OSError, ValueError) as e:
+                    print("ProfileCache: Could not warm", uri, e)
+
+        worker = Thread(target=doWarm, daemon=True)
+        worker.start()
+        return worker
+
+profileCache = ProfileCache()
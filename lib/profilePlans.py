@@ -0,0 +1,83 @@
+import sys, json
+from collections import OrderedDict
+
+'''
+Profile Plans:
+    Switching profiles used to re-send every pad binding, even when the two
+    profiles only differ in a single button.
+
+    compileProfile() turns a profile into its command plan: the ordered
+    (button id, binding) pairs that make the pad look like that profile.
+    TransitionPlanner diffs the plan that is live on the pad against the target
+    and keeps only the commands that change something. Transitions are cached per
+    (from plan, to plan) pair, so flipping between two profiles is a dict lookup.
+
+    A dry run prints the planned commands and what they should cost, without touching the device:
+        python3 lib/profilePlans.py <from profile.json> <to profile.json>
+'''
+
+DEFAULT_COMMAND_COST = 15.0 # <- Milliseconds per command, when nothing has been measured yet
+PLAN_CACHE_SIZE      = 64
+
+def compileProfile(profileData):
+    # Profile data -> plan, a tuple of (button id, binding) in button order
+    return tuple((str(button['id']), button['value']) for button in profileData.get('buttons', []))
+
+class PlanCommand():
+    def __init__(self, buttonId, value):
+        self.buttonId = buttonId
+        self.value    = value
+
+    def __str__(self):
+        return "set PAD button {} \"{}\"".format(self.buttonId, self.value)
+
+    def __eq__(self, other):
+        return (self.buttonId, self.value) == (other.buttonId, other.value)
+
+class TransitionPlanner():
+    def __init__(self, size=PLAN_CACHE_SIZE):
+        self.size   = size
+        self.hits   = 0
+        self.misses = 0
+        self._plans = OrderedDict() # <- (from plan, to plan) -> [PlanCommand, ...]
+
+    def __str__(self):
+        return "TransitionPlanner(Cached: {}, Hits: {}, Misses: {})".format(len(self._plans), self.hits, self.misses)
+
+    def plan(self, fromPlan, toPlan):
+        # Minimal commands to go from fromPlan to toPlan. fromPlan None: nothing is known, send everything
+        key = (fromPlan, toPlan)
+        if key in self._plans:
+            self._plans.move_to_end(key)
+            self.hits += 1
+            return self._plans[key]
+
+        self.misses += 1
+        live     = dict(fromPlan) if fromPlan != None else {}
+        commands = [PlanCommand(buttonId, value) for buttonId, value in toPlan if live.get(buttonId) != value]
+
+        self._plans[key] = commands
+        while len(self._plans) > self.size:
+            self._plans.popitem(last=False)
+        return commands
+
+    def describe(self, commands, costPerCommand=DEFAULT_COMMAND_COST):
+        # Human readable dry run of a plan
+        lines = []
+        for command in commands:
+            lines.append("{}  (~{:.1f} ms)".format(command, costPerCommand))
+        lines.append("{} command(s), estimated {:.1f} ms".format(len(commands), len(commands) * costPerCommand))
+        return "\n".join(lines)
+
+transitionPlanner = TransitionPlanner()
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python3 lib/profilePlans.py <from profile.json> <to profile.json>")
+        sys.exit(1)
+
+    with open(sys.argv[1], 'r') as fromFile, open(sys.argv[2], 'r') as toFile:
+        fromPlan = compileProfile(json.loads(fromFile.read()))
+        toPlan   = compileProfile(json.loads(toFile.read()))
+
+    print(transitionPlanner.describe(transitionPlanner.plan(fromPlan, toPlan)))
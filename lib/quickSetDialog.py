@@ -1,7 +1,7 @@
 
-from lib.listeners import TabletButtonListener
+from lib.listeners import createButtonListener
 
-from PyQt6.uic       import loadUi
+from lib.uiCache     import loadUi
 from PyQt6.QtCore    import pyqtSignal
 from PyQt6.QtWidgets import QDialog
 '''
@@ -12,27 +12,39 @@ Stop Listening
 Set button preference with out applying (Because they are disabled)
 '''
 class QuickSetDialog(QDialog):
+    buttonPressed = pyqtSignal(int) # <- Emitted from the listener's thread, handled on the GUI thread
+
     def __init__(self, parent=None):
         super(QuickSetDialog, self).__init__(parent)
         loadUi('lib/qtUI/quickSetDialog.ui', self)
 
-        self.listener = TabletButtonListener()
+        self.listener = createButtonListener()
         self.buttonId = 0
         self.dismissedEarly = False
+        self.closed = False
 
-        self.listener.setListenerCallback(self.reactToKey)
+        self.buttonPressed.connect(self.reactToKey)
+        self.listener.setListenerCallback(self.buttonPressed.emit)
         self.listener.start()
 
         self.pushButton.clicked.connect(self.reject)
 
         parent.earlyDismisalSignal.connect(self.handleEarlyDismisal)
 
-    def handleEarlyDismisal(self):
+    def done(self, result):
+        # Every way out ends here: a button press, Cancel, Esc, the window's close button, early dismisal
+        self.closed = True
         self.listener.stop()
+        super(QuickSetDialog, self).done(result)
+
+    def handleEarlyDismisal(self):
+        if self.closed:
+            return
         self.dismissedEarly = True
         self.reject()
 
     def reactToKey(self, index):
+        if self.buttonId != 0 or self.closed:
+            return # <- Queued up before the listener stopped, the first press (or Cancel) counts
         self.buttonId = index
-        self.listener.stop()
         self.accept()
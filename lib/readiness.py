@@ -0,0 +1,81 @@
+import time
+from threading import Timer
+
+try:
+    from lib.commandInterfaces import deviceRegistry
+except ImportError:
+    from commandInterfaces     import deviceRegistry
+
+'''
+Readiness:
+    After a plug, udev knows about the tablet well before the X wacom driver has created its
+    devices, and applying settings before that silently does nothing. We used to wait a fixed
+    second, which is too long on a fast machine and too short on a slow hub.
+
+    ReadinessWaiter probes until xsetwacom lists the tablet's PAD and STYLUS (on the plugged
+    ID_PATH, when known), following READINESS_SCHEDULE, then calls onReady(elapsedMs) where
+    elapsedMs is counted from the plug. If the schedule runs out, onGiveUp(elapsedMs) is called.
+
+    Probes are scheduled through a callable: schedule(delayMs, callback), a threading.Timer by default.
+    A probe forks xsetwacom, so keep them off the Qt thread: the GUI uses the default and has
+    onReady/onGiveUp emit a signal, the apply then runs on the Qt thread.
+'''
+
+READINESS_SCHEDULE = (0, 25, 50, 100, 200, 400, 800, 1600, 3200) # <- Milliseconds before each probe, ~6.4s total
+
+def timerSchedule(delayMs, callback):
+    timer = Timer(delayMs / 1000, callback)
+    timer.daemon = True
+    timer.start()
+
+def probeTablet(idPath=None):
+    # True once the X driver exposes the tablet's devices
+    try:
+        devices = deviceRegistry.refresh()
+    except (KeyError, ValueError, AttributeError):
+        return False # <- Half enumerated, Eg. udev knows the PAD but X does not yet
+
+    if not devices or "PAD" not in devices or "STYLUS" not in devices:
+        return False
+    return idPath == None or devices["PAD"].getUdev("ID_PATH") == idPath
+
+class ReadinessWaiter():
+    def __init__(self, onReady, onGiveUp=None, idPath=None, pluggedAt=None, schedule=timerSchedule, probe=probeTablet):
+        self.onReady   = onReady
+        self.onGiveUp  = onGiveUp if onGiveUp != None else self.dummy
+        self.idPath    = idPath
+        self.pluggedAt = pluggedAt if pluggedAt != None else time.monotonic() # <- time.monotonic() of the first udev event
+        self.schedule  = schedule
+        self.probe     = probe
+        self.attempt   = 0
+        self.cancelled = False
+
+    def __str__(self):
+        return "ReadinessWaiter(IdPath: {}, Attempts: {})".format(self.idPath, self.attempt)
+
+    def dummy(self, elapsedMs):
+        pass
+
+    def elapsedMs(self):
+        return (time.monotonic() - self.pluggedAt) * 1000
+
+    def start(self):
+        self.schedule(READINESS_SCHEDULE[0], self.check)
+
+    def cancel(self):
+        self.cancelled = True # <- Eg. the tablet was unplugged again before it became ready
+
+    def check(self):
+        if self.cancelled:
+            return
+
+        self.attempt += 1
+        ready = self.probe(self.idPath)
+        if self.cancelled:
+            return # <- Cancelled while the probe ran
+        if ready:
+            self.onReady(self.elapsedMs())
+        elif self.attempt < len(READINESS_SCHEDULE):
+            self.schedule(READINESS_SCHEDULE[self.attempt], self.check)
+        else:
+            self.onGiveUp(self.elapsedMs())
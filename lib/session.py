@@ -0,0 +1,258 @@
+import os
+from threading import RLock
+
+try:
+    from lib.tabinfo      import TabletInfo
+    from lib.settings     import SettingsManager, SETTINGSDIR
+    from lib.buttons      import ButtonManager
+    from lib.profileCache import profileCache, PROFILE_CACHE_SIZE
+    from lib.persistence  import writeBehind, writeJsonAtomic
+    from lib.control      import SESSION_CACHE, SESSION_VERSION
+    from lib.monitors     import MonitorTopology
+except ImportError:
+    from tabinfo          import TabletInfo
+    from settings         import SettingsManager, SETTINGSDIR
+    from buttons          import ButtonManager
+    from profileCache     import profileCache, PROFILE_CACHE_SIZE
+    from persistence      import writeBehind, writeJsonAtomic
+    from control          import SESSION_CACHE, SESSION_VERSION
+    from monitors         import MonitorTopology
+
+'''
+TabletSession:
+    Everything needed to apply a tablet's settings, without any Qt.
+    Used by the GUI (ConfigUI) and by the headless settings daemon (tablet_daemon.py).
+
+    session = TabletSession()
+    if session.load():          <- TabletInfo, per device settings and the active button profile
+        session.applyAll()
+
+    Every method that touches the session takes session.lock, so socket requests and hotplug
+    callbacks arriving on different threads dont interleave their xsetwacom calls.
+
+    TabletSession(remote=ControlClient()): The GUI's session. While the settings daemon runs, applying
+    is left to it (applyAll is skipped, profile switches and touch go over its socket) and this session
+    only tracks state. Without a daemon everything is applied locally.
+'''
+
+def loadSettings(tabInfo):
+    if not tabInfo.isTabletPresent():
+        return None
+
+    name = tabInfo.getGenericName()
+    model = tabInfo.getModel()
+    # Assertain a good directory name for per model settings
+    perDeviceName = "{} {}".format(name, model).replace(" ", "_")
+    perDeviceDir  = os.path.join(SETTINGSDIR, perDeviceName)
+    perDeviceSettings = os.path.join(perDeviceDir, "settings.json")
+    # Create settings object.
+    settings = SettingsManager(perDeviceSettings)
+    # Load settings if they exist, or generate new ones
+    if os.path.isfile(perDeviceSettings):
+        print("Loaded per device settings from:", perDeviceSettings)
+        settings.load()
+    else:
+        print("Generating new per device settings at:", perDeviceSettings)
+        settings.genDefaultSettings()
+
+    return settings
+
+def loadActiveButtonProfile(settings):
+    if settings == None:
+        return None
+
+    perDeviceDir = settings.perDeviceDir
+    # Given that we know where per device settings are saved
+    # Assemble the ButtonProfiles directory and Last Active Profile Uri
+    profilesDir  = os.path.join(perDeviceDir, "ButtonProfiles") # <-- The location where button profiles are saved
+    lastActiveProfile = settings.get('active_profile') # <-- Last loaded profile json file
+    lastActiveProfileUri = os.path.join(profilesDir, lastActiveProfile) # <-- The exact location of the last loaded profile json file
+
+    # Load profile data if it exists, or generate a new default one
+    if os.path.isfile(lastActiveProfileUri):
+        print("Loaded button profile settings from last known active profile:", lastActiveProfileUri)
+        buttons = ButtonManager(profilesDir, activeProfile=lastActiveProfile)
+        buttons.load()
+
+    else:
+        print("Could not find last active button profile:", lastActiveProfile)
+        print("Loaded default button profile...")
+        settings.set('active_profile', 'default.json')
+        buttons = ButtonManager(profilesDir)
+        if os.path.isfile(os.path.join(profilesDir, "default.json")):
+            buttons.load()
+
+        else:
+            buttons.genDefaultProfile()
+            buttons.load()
+
+    buttons.loadProfileList()
+    profileCache.resize(settings.data.get('profile_cache_size', PROFILE_CACHE_SIZE))
+    buttons.warmProfileCache(settings.data.get('recent_profiles', []))
+    saveSessionCache(settings, buttons)
+
+    return buttons
+
+def saveSessionCache(settings, buttons):
+    # Leave what tabletctl.py needs to apply directly, see control.py
+    devices = {}
+    for deviceType, device in (buttons.devices or {}).items():
+        devices[deviceType] = {'name': device.name, 'id': device.id}
+    try:
+        os.makedirs(os.path.dirname(SESSION_CACHE), exist_ok=True)
+        writeJsonAtomic(SESSION_CACHE, {'version'     : SESSION_VERSION,
+                                        'devices'     : devices,
+                                        'settingsFile': settings.settingsFile,
+                                        'profilesDir' : buttons.profilesDir})
+    except OSError as e:
+        print("Could not write session cache:", e)
+
+class TabletSession():
+    def __init__(self, remote=None):
+        self.tabInfo  = None
+        self.settings = None
+        self.buttons  = None
+        self.remote   = remote # <- ControlClient of a settings daemon that applies for us, if it runs
+        self.lock     = RLock()
+
+    def __str__(self):
+        return "TabletSession(Present: {}, Profile: {})".format(self.isPresent(), self.getActiveProfileFile())
+
+    def isPresent(self):
+        return self.settings != None
+
+    def build(self):
+        # Everything load() swaps in, built without touching the session. Safe to run on a worker thread,
+        # install() it from the thread that owns the session once it is known to still be wanted
+        tabInfo  = TabletInfo()
+        settings = loadSettings(tabInfo)
+        buttons  = loadActiveButtonProfile(settings)
+        return (tabInfo, settings, buttons)
+
+    def install(self, loaded):
+        with self.lock:
+            self.tabInfo, self.settings, self.buttons = loaded
+            return self.isPresent()
+
+    def load(self):
+        # (Re)build everything from the current device and disk state. Returns True if a tablet is present.
+        return self.install(self.build())
+
+    def unload(self):
+        with self.lock:
+            self.tabInfo  = None
+            self.settings = None
+            self.buttons  = None
+
+    def syncFromDisk(self):
+        # Another process (the GUI, tabletctl...) may have saved since we loaded, pick its changes up
+        with self.lock:
+            if not self.isPresent():
+                return False
+            self.settings.load()
+            if self.settings.get('active_profile') != self.getActiveProfileFile():
+                self.buttons = loadActiveButtonProfile(self.settings)
+            else:
+                self.buttons.load()
+                self.buttons.loadProfileList()
+            return True
+
+    def requestRemote(self, command, **args):
+        # Let a running settings daemon do the work. Returns its response, or None to do it ourselves
+        if self.remote == None or not self.remote.isRunning():
+            return None
+        try:
+            response = self.remote.request(command, **args)
+        except (OSError, ValueError) as e:
+            print("Settings daemon did not answer:", e)
+            return None
+        if not response.get('ok'):
+            print("Settings daemon refused {}: {}".format(command, response.get('error')))
+            return None
+        return response
+
+    def applyAll(self, onlyChanged=True):
+        with self.lock:
+            if not self.isPresent():
+                return False
+            if self.remote != None and self.remote.isRunning():
+                print("Settings daemon is running, it applies the settings")
+                return False
+            self.settings.applyAll(onlyChanged=onlyChanged)
+            self.buttons.applyButtons(suppressOutput=True, onlyChanged=onlyChanged)
+            return True
+
+    def remapOutputs(self, oldMonitors, newMonitors):
+        # MonitorTopology change handler: re-map only if the layout our monitor_output depends on moved
+        with self.lock:
+            if not self.isPresent():
+                return False
+            if self.remote != None and self.remote.isRunning():
+                return False # <- The settings daemon watches the outputs too
+            output = self.settings.get('monitor_output')
+            if MonitorTopology.layoutFor(output, oldMonitors) == MonitorTopology.layoutFor(output, newMonitors):
+                print("Monitor layout changed, mapping to {} is unaffected".format(output))
+                return False
+            self.settings.reapplyMapping()
+            return True
+
+    def getActiveProfileFile(self):
+        if self.buttons == None:
+            return None
+        return os.path.basename(self.buttons.activeProfile)
+
+    def findProfile(self, profile):
+        # Profile index, file name ("default.json") or display name -> index, or None
+        profiles = self.buttons.getProfiles()
+        if isinstance(profile, int) or str(profile).isdigit():
+            index = int(profile)
+            return index if 0 <= index < len(profiles) else None
+
+        for index in range(0, len(profiles)):
+            if os.path.basename(profiles[index]['uri']) == profile or profiles[index]['name'] == profile:
+                return index
+        return None
+
+    def switchProfile(self, profileIndex, apply=True):
+        with self.lock:
+            self.buttons.switchProfile(profileIndex)
+            newProfileFileName = self.buttons.getProfileFileByIndex(profileIndex)
+            print("Switching active profile to:", newProfileFileName)
+            self.settings.set('active_profile', newProfileFileName)
+            self.settings.set('recent_profiles', list(self.buttons.recentProfiles))
+            self.settings.save()
+            if apply and self.remote != None and os.path.exists(self.remote.path):
+                writeBehind.flush(self.settings.settingsFile) # <- A settings daemon would read it back right away
+            if apply and self.requestRemote('switch', profile=newProfileFileName) != None:
+                self.buttons.appliedPlan = None # <- The daemon changed the pad, our plan of it is stale. The next local apply diffs against the pad
+            elif apply:
+                self.buttons.applyTransition(suppressOutput=True)
+            return newProfileFileName
+
+    def setTouch(self, state):
+        # state: "on", "off" or "toggle". Returns the new state
+        with self.lock:
+            response = self.requestRemote('touch', state=state)
+            if response != None:
+                self.settings.set('enable_touch', response['touch']) # <- The daemon applied and saved it
+                return response['touch']
+
+            if state == "toggle":
+                state = "off" if self.settings.get('enable_touch') == "on" else "on"
+            self.settings.set('enable_touch', state)
+            self.settings.applyTouch()
+            return state
+
+    def status(self):
+        with self.lock:
+            if not self.isPresent():
+                return {'present': False}
+            return {
+                'present'    : True,
+                'name'       : self.tabInfo.getGenericName(),
+                'model'      : self.tabInfo.getModel(),
+                'profile'    : self.buttons.getName(),
+                'profileFile': self.getActiveProfileFile(),
+                'profiles'   : [profile['name'] for profile in self.buttons.getProfiles()],
+                'touch'      : self.settings.get('enable_touch'),
+            }
@@ -1,4 +1,4 @@
-from PyQt6.uic       import loadUi
+from lib.uiCache     import loadUi
 from PyQt6.QtWidgets import QDialog
 # TODO: refactor to KeyBindEditorDialog, class and file name
 # TODO: Dialog should have a button to set the tablet binding to "Do Nothing"
@@ -3,9 +3,13 @@ import os, json
 from pathlib import Path
 
 try:
-    from commandInterfaces import xsetwacom
+    from util              import sameSetting
+    from commandInterfaces import deviceRegistry
+    from persistence       import writeBehind
 except ImportError:
-    from lib.commandInterfaces import xsetwacom
+    from lib.util              import sameSetting
+    from lib.commandInterfaces import deviceRegistry
+    from lib.persistence       import writeBehind
 
 '''
 SettingsManager:
@@ -24,6 +28,7 @@ SettingsManager:
     - save settings to file
 
     the settings should be saved immediatly when changes are made.
+    (save() queues the write, it lands on disk a fraction of a second later, atomically)
 
 '''
 CONFIGDIR    = os.path.join(Path.home(), ".config")
@@ -34,7 +39,7 @@ class SettingsManager():
     def __init__(self, settingsFile):
         self.settingsFile = settingsFile
         self.perDeviceDir = os.path.dirname(self.settingsFile)
-        self.devices      = xsetwacom.getDevices()
+        self.devices      = deviceRegistry.getDevices()
         self.data         = {}
 
         os.makedirs(os.path.dirname(self.settingsFile), exist_ok=True)
@@ -52,14 +57,17 @@ class SettingsManager():
         return printStr
 
     def load(self):
+        writeBehind.flush(self.settingsFile) # <- Dont read around our own pending write
         with open(self.settingsFile, 'r') as settingsData:
             jsonString = settingsData.read()
             self.data = json.loads(jsonString)
 
-    def save(self):
-        with open(self.settingsFile, 'w') as settingsData:
-            jsonString = json.dumps(self.data)
-            settingsData.write(jsonString)
+    def save(self, now=False):
+        # Saves are coalesced and written atomically a moment later, see persistence.py
+        if now:
+            writeBehind.write(self.settingsFile, self.data)
+        else:
+            writeBehind.schedule(self.settingsFile, self.data)
 
     def get(self, key):
         return self.data[key]
@@ -67,18 +75,43 @@ class SettingsManager():
     def set(self, key, value):
         self.data[key] = value
 
-    def applyAll(self):
+    def applyAll(self, onlyChanged=False):
+        # onlyChanged: Snapshot the live device state first, and skip every value that already matches.
+        # Returns the number of commands skipped
         print("Applying all settings...")
-        self.devices["TOUCH"].setProp('touch', self.data['enable_touch'])
-        self.devices["STYLUS"].setProp('mode', self.data['tracking_mode'])
-        self.devices["STYLUS"].setProp('rotate', self.data['orientation']) # IMPORTANT: rotation needs to be applied BEFORE mapToOutput
-        self.devices["TOUCH"].setProp('rotate', self.data['orientation'])
-        self.devices["STYLUS"].setProp('maptooutput', self.data['monitor_output'])
-        self.devices["STYLUS"].setProp('pressurecurve', self.data['pressure_curve'])
-        self.devices["STYLUS"].setButton(2, self.data['stylus_primary'])
-        self.devices["STYLUS"].setButton(3, self.data['stylus_secondary'])
-        self.devices["STYLUS"].setButton(8, self.data['stylus_tertiary'])
+        commands = [
+            ("TOUCH",  'touch',         self.data['enable_touch']),
+            ("STYLUS", 'mode',          self.data['tracking_mode']),
+            ("STYLUS", 'rotate',        self.data['orientation']), # IMPORTANT: rotation needs to be applied BEFORE mapToOutput
+            ("TOUCH",  'rotate',        self.data['orientation']),
+            ("STYLUS", 'maptooutput',   self.data['monitor_output']), # <- Cant be read back, so it is always sent
+            ("STYLUS", 'pressurecurve', self.data['pressure_curve']),
+            ("STYLUS", 'button 2',      self.data['stylus_primary']),
+            ("STYLUS", 'button 3',      self.data['stylus_secondary']),
+            ("STYLUS", 'button 8',      self.data['stylus_tertiary'])
+        ]
+
+        live = {}
+        if onlyChanged:
+            for deviceType in ["TOUCH", "STYLUS"]:
+                live[deviceType] = self.devices[deviceType].getState()
+
+        skipped = 0
+        for deviceType, prop, value in commands:
+            if onlyChanged and sameSetting(live[deviceType].get(prop), value):
+                skipped += 1
+                continue
+
+            if prop.startswith('button '):
+                self.devices[deviceType].setButton(prop.split()[-1], value)
+            else:
+                self.devices[deviceType].setProp(prop, value)
+
+        if onlyChanged:
+            print("Applied {} settings, skipped {} unchanged".format(len(commands) - skipped, skipped))
+
         self.save()
+        return skipped
 
     def applyTouch(self):
         setting = self.get("enable_touch")
@@ -106,13 +139,20 @@ class SettingsManager():
     def applyMonitorMapping(self):
         # From "man xsetwacom" maptooutput:
         # the command needs to be RE-RUN whenever the output configuration changes.
-        # Consideration:
-        # Add this monitor watching functionality to the Daemon. Can pyUdev do this? Or do i need to use XrandR?
+        # See monitors.py, layout changes end up in reapplyMapping()
         setting = self.get('monitor_output')
         print("Setting: \"MapToOutput\" has been set to:", setting)
         self.devices["STYLUS"].setProp('maptooutput', setting)
         self.save()
 
+    def reapplyMapping(self):
+        # The output layout changed: rotation first, then the mapping, same order as applyAll. Nothing changed to save
+        orientation = self.get("orientation")
+        print("Re-applying orientation ({}) and mapping ({})".format(orientation, self.get('monitor_output')))
+        self.devices["STYLUS"].setProp('rotate', orientation)
+        self.devices["TOUCH"].setProp('rotate', orientation)
+        self.devices["STYLUS"].setProp('maptooutput', self.get('monitor_output'))
+
     def applyPressureCurve(self):
         setting = self.get("pressure_curve")
         print("Setting: \"Pressure Curve\" has been set to:", setting)
@@ -138,6 +178,9 @@ class SettingsManager():
         self.save()
 
     def genDefaultSettings(self):
+        # One bulk read per device, the getters below are then served from the snapshots
+        self.devices["TOUCH"].takeSnapshot()
+        self.devices["STYLUS"].takeSnapshot()
         #Get Settings
         self.data = {
             'enable_touch'    : self.devices["TOUCH"].getProp('touch'),
@@ -150,6 +193,8 @@ class SettingsManager():
             'stylus_secondary': self.devices["STYLUS"].getButton(3),
             'stylus_tertiary' : self.devices["STYLUS"].getButton(8)
         }
+        self.devices["TOUCH"].dropSnapshot()
+        self.devices["STYLUS"].dropSnapshot()
         self.save()
 
 if __name__ == "__main__":
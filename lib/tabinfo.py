@@ -1,10 +1,11 @@
-import re, os
 try:
     from lib.util              import *
-    from lib.commandInterfaces import xsetwacom
+    from lib.commandInterfaces import deviceRegistry
+    from lib.libwacom          import libwacomIndex, parseTabletFile
 except ModuleNotFoundError:
     from util                  import *
-    from commandInterfaces     import xsetwacom
+    from commandInterfaces     import deviceRegistry
+    from libwacom              import libwacomIndex, parseTabletFile
 
 from pyudev import Context, Device
 
@@ -42,8 +43,8 @@ class TabletInfo():
         All button operations should be handled there and not in TabletInfo.
         '''
 
-        self.libwacom = "/usr/share/libwacom/"
-        self.devices  = xsetwacom.getDevices()
+        self.libwacom = libwacomIndex.libwacomDir
+        self.devices  = deviceRegistry.getDevices()
 
         self.tabletMetaFile = None
         self.tabletLayoutFile = None
@@ -60,13 +61,13 @@ class TabletInfo():
 
     def getVendor(self):
         # Return vendor according to the PAD device
-        if self.devices != None:
-            return self.devices["PAD"].udev.properties.get("ID_VENDOR").replace("_", " ")
+        if self.devices != None and self.devices["PAD"].getUdev("ID_VENDOR") != None:
+            return self.devices["PAD"].getUdev("ID_VENDOR").replace("_", " ")
 
     def getModel(self):
         # Return model according to the PAD device
-        if self.devices != None:
-            return self.devices["PAD"].udev.properties.get("ID_MODEL").replace("_", " ")
+        if self.devices != None and self.devices["PAD"].getUdev("ID_MODEL") != None:
+            return self.devices["PAD"].getUdev("ID_MODEL").replace("_", " ")
 
     def getGenericName(self):
         return self.metadata.device.name
@@ -78,9 +79,11 @@ class TabletInfo():
     def getDevMatch(self):
         # Return vendor according to the PAD device
         if self.devices != None:
-            idVendorId = self.devices["PAD"].udev.properties.get("ID_VENDOR_ID")
-            idModelId  = self.devices["PAD"].udev.properties.get("ID_MODEL_ID")
-            idBus      = self.devices["PAD"].udev.properties.get("ID_BUS")
+            idVendorId = self.devices["PAD"].getUdev("ID_VENDOR_ID")
+            idModelId  = self.devices["PAD"].getUdev("ID_MODEL_ID")
+            idBus      = self.devices["PAD"].getUdev("ID_BUS")
+            if None in [idBus, idVendorId, idModelId]:
+                return None # <- No udev device behind the PAD, nothing to look up in libwacom
             devmatch = "{}:{}:{}".format(idBus, idVendorId, idModelId)
             return devmatch
 
@@ -115,92 +118,22 @@ class TabletInfo():
             return "No device"
 
     def findTabletFileAndLayout(self):
-        for file in os.listdir(self.libwacom):
-            fullfile = os.path.join(self.libwacom, file)
-            if not os.path.isdir(fullfile):
-                with open(fullfile, "r") as tablet:
-                    contents = tablet.readlines()
-                    for line in contents:
-                        if "DeviceMatch=" in line:
-                            devMatchFromFile = line.strip("\n").split("=")[-1]
-                            if devMatchFromFile == self.getDevMatch():
-                                self.tabletMetaFile   = os.path.join(self.libwacom, file)
-                                layout = file.split(".")[0]+".svg"
-                                self.tabletLayoutFile = os.path.join(self.libwacom, "layout/"+layout)
+        # Indexed DeviceMatch lookup, see libwacom.LibwacomIndex
+        self.tabletMetaFile, self.tabletLayoutFile = libwacomIndex.lookup(self.getDevMatch())
 
     def loadTabletMetadata(self):
-        # Load info from libwacom .tablet file
-
+        # Load info from libwacom .tablet file, cached by path and mtime
         if self.tabletMetaFile == None:
             return None
 
-        self.metadata = TabletMetadata()
-        with open(self.tabletMetaFile, 'r') as metaFile:
-            lines = metaFile.readlines()
-            currentCatagoryKey = ""
-            for line in lines:
-                catagoryMatch = re.search(r"\[.*\]", line)
-                if catagoryMatch != None:
-                    key = catagoryMatch.group().strip("[").strip("]").lower()
-                    currentCatagoryKey = key
-                    # init metadata catagory
-                    self.metadata[key] = TabletMetadata()
-
-                itemMatch = re.search(r".*=.*", line)
-                if itemMatch != None:
-                    # currentCatagoryKey -> itemMatch.group()
-                    keyValuePair = itemMatch.group().split("=")
-                    key = keyValuePair[0].lower()
-                    value = keyValuePair[1]
-                    if key == "class":
-                        key = "_class"
-                    # init key value pair in catagory
-                    self.metadata[currentCatagoryKey][key] = value
+        self.metadata = parseTabletFile(self.tabletMetaFile)
 
     def isTabletPresent(self):
-        if not xsetwacom.getDevices():
+        if not deviceRegistry.getDevices():
             return False
         else:
             return True
 
-class TabletMetadata(dict):
-    # Implementation of dot accesable dict
-    def __init__(self, *args, **kwargs):
-        super(TabletMetadata, self).__init__(*args, **kwargs)
-        for arg in args:
-            if isinstance(arg, dict):
-                for k, v in arg.iteritems():
-                    self[k] = v
-
-        if kwargs:
-            for k, v in kwargs.iteritems():
-                self[k] = v
-
-    def __str__(self):
-        infoString = ""
-        for catagory in self:
-            infoString += "[" + catagory + "]\n"
-            for key in self[catagory]:
-                infoString += key + " -> " + self[catagory][key] + "\n"
-        return infoString
-
-    def __getattr__(self, attr):
-        return self.get(attr)
-
-    def __setattr__(self, key, value):
-        self.__setitem__(key, value)
-
-    def __setitem__(self, key, value):
-        super(TabletMetadata, self).__setitem__(key, value)
-        self.__dict__.update({key: value})
-
-    def __delattr__(self, item):
-        self.__delitem__(item)
-
-    def __delitem__(self, key):
-        super(TabletMetadata, self).__delitem__(key)
-        del self.__dict__[key]
-
 if __name__ == "__main__":
     tabInfo = TabletInfo()
     print(tabInfo.isTabletPresent())
@@ -0,0 +1,84 @@
+import os, io, sys, importlib.util
+
+from PyQt6.QtCore import PYQT_VERSION_STR
+
+try:
+    from lib.persistence import writeTextAtomic
+except ImportError:
+    from persistence     import writeTextAtomic
+
+'''
+UI cache:
+    uic.loadUi parses the .ui XML every time a widget is built, KeybindListElement did it once per pad button.
+    loadUi() here compiles each .ui file to Python once (uic.compileUi), keeps the result in UICACHEDIR
+    and afterwards only runs the generated setupUi(). A compiled file starts with a stamp line holding the
+    source's mtime, size and the PyQt version, it is regenerated as soon as any of them changes.
+
+    Drop in replacement for PyQt6.uic.loadUi(uiFile, baseInstance), falls back to it if compiling fails.
+
+    Precompile everything (Eg. while packaging):
+        python3 lib/uiCache.py lib/qtUI/*.ui
+'''
+
+UICACHEDIR = os.path.join(os.path.expanduser("~"), ".cache", "TabletCfg", "ui")
+
+_forms = {} # <- .ui path -> (stamp, Ui_ form class), so each file is imported once per process
+
+def sourceStamp(uiFile):
+    stat = os.stat(uiFile)
+    return "# uiCache: {} {} {} PyQt {}\n".format(os.path.abspath(uiFile), stat.st_mtime_ns, stat.st_size, PYQT_VERSION_STR)
+
+def compiledPath(uiFile):
+    name = os.path.splitext(os.path.basename(uiFile))[0]
+    return os.path.join(UICACHEDIR, "ui_{}.py".format(name))
+
+def compileUiFile(uiFile, stamp):
+    from PyQt6 import uic # <- Only needed when a .ui file changed
+    output = io.StringIO()
+    output.write(stamp)
+    uic.compileUi(uiFile, output)
+    os.makedirs(UICACHEDIR, exist_ok=True)
+    writeTextAtomic(compiledPath(uiFile), output.getvalue())
+    print("uiCache: Compiled", uiFile)
+
+def isFresh(path, stamp):
+    try:
+        with open(path, 'r') as compiled:
+            return compiled.readline() == stamp
+    except OSError:
+        return False
+
+def formClass(uiFile):
+    stamp  = sourceStamp(uiFile)
+    cached = _forms.get(uiFile)
+    if cached != None and cached[0] == stamp:
+        return cached[1]
+
+    path = compiledPath(uiFile)
+    if not isFresh(path, stamp):
+        compileUiFile(uiFile, stamp)
+
+    spec   = importlib.util.spec_from_file_location("ui_" + os.path.splitext(os.path.basename(uiFile))[0], path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    form = [value for name, value in vars(module).items() if name.startswith("Ui_")][0]
+    _forms[uiFile] = (stamp, form)
+    return form
+
+def loadUi(uiFile, baseInstance):
+    try:
+        form = formClass(uiFile)
+    except Exception as e:
+        print("uiCache: Could not use a compiled {}, parsing it instead: {}".format(uiFile, e))
+        from PyQt6 import uic
+        return uic.loadUi(uiFile, baseInstance)
+
+    ui = form()
+    ui.setupUi(baseInstance)
+    for name, value in vars(ui).items(): # <- Like uic.loadUi, child widgets become attributes of baseInstance
+        setattr(baseInstance, name, value)
+    return baseInstance
+
+if __name__ == "__main__":
+    for uiFile in sys.argv[1:]:
+        compileUiFile(uiFile, sourceStamp(uiFile))
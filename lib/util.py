@@ -13,6 +13,12 @@ def boolFromStr(str):
         else:
             return None
 
+def sameSetting(live, wanted):
+    ## Compare a value read back from xsetwacom with the one we would send, ignoring spacing
+    if live == None or wanted == None:
+        return False
+    return " ".join(str(live).split()) == " ".join(str(wanted).split())
+
 def legalize( x ):
     # Sanitize string by removing any potentially illegal characters
     ILLEGAL = [
@@ -1,4 +1,4 @@
-from PyQt6.uic       import loadUi
+from lib.uiCache     import loadUi
 from PyQt6.QtWidgets import QDialog
 
 class WarningResetBindingsDialog(QDialog):
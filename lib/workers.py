@@ -0,0 +1,119 @@
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+'''
+Workers:
+    Anything that forks xsetwacom, xinput or xrandr should not run on the Qt GUI thread.
+
+    future = workerPool.submit(xrandr.getActiveMonitorList)
+    future.then(self.populateMonitorMapping)   <- Called on the GUI thread with the result
+    future.catch(print)                         <- Or with the exception, if it raised
+
+    Every future belongs to the pool's current generation. workerPool.invalidate() (Eg. a hotplug fired)
+    starts a new generation: older futures still running are cancelled, their callbacks never run,
+    and queued ones are taken off the pool before they start.
+'''
+
+class TaskSignals(QObject):
+    finished = pyqtSignal(object, object) # <- (result, exception)
+
+class Task(QRunnable):
+    def __init__(self, function, args, kwargs):
+        super(Task, self).__init__()
+        self.function = function
+        self.args     = args
+        self.kwargs   = kwargs
+        self.signals  = TaskSignals() # <- Created on the GUI thread, so finished is delivered there
+        self.setAutoDelete(False)     # <- The Future keeps it, for tryTake()
+
+    def run(self):
+        try:
+            result = self.function(*self.args, **self.kwargs)
+        except Exception as e:
+            self.signals.finished.emit(None, e)
+        else:
+            self.signals.finished.emit(result, None)
+
+class Future():
+    def __init__(self, pool, task, generation):
+        self.pool       = pool
+        self.task       = task
+        self.generation = generation
+        self.done       = False
+        self.cancelled  = False
+        self.result     = None
+        self.exception  = None
+        self.callbacks  = []
+        self.errbacks   = []
+        task.signals.finished.connect(self._finished)
+
+    def __str__(self):
+        return "Future(Generation: {}, Done: {}, Cancelled: {})".format(self.generation, self.done, self.cancelled)
+
+    def then(self, callback):
+        if self.done and self.exception == None and not self.cancelled:
+            callback(self.result)
+        else:
+            self.callbacks.append(callback)
+        return self
+
+    def catch(self, callback):
+        if self.done and self.exception != None and not self.cancelled:
+            callback(self.exception)
+        else:
+            self.errbacks.append(callback)
+        return self
+
+    def cancel(self):
+        if self.done:
+            return False
+        self.cancelled = True
+        if self.pool.threadPool.tryTake(self.task): # <- Still queued, it never starts and never reports back
+            self.done = True
+            self.pool.pending.discard(self)
+            self.pool.stale += 1
+        return True
+
+    def _finished(self, result, exception):
+        self.done = True
+        self.pool.pending.discard(self)
+        if self.cancelled or self.generation != self.pool.generation:
+            self.pool.stale += 1 # <- Gathered for a tablet state that is gone
+            return
+
+        self.result    = result
+        self.exception = exception
+        if exception != None:
+            if not self.errbacks:
+                print("Worker: {} failed: {}".format(getattr(self.task.function, '__name__', self.task.function), exception))
+            for errback in self.errbacks:
+                errback(exception)
+        else:
+            for callback in self.callbacks:
+                callback(result)
+
+class WorkerPool():
+    def __init__(self, threadPool=None):
+        self.threadPool = threadPool if threadPool != None else QThreadPool.globalInstance()
+        self.generation = 0
+        self.pending    = set()
+        self.submitted  = 0
+        self.stale      = 0
+
+    def __str__(self):
+        return "WorkerPool(Generation: {}, Submitted: {}, Pending: {}, Stale: {})".format(self.generation, self.submitted, len(self.pending), self.stale)
+
+    def submit(self, function, *args, **kwargs):
+        task   = Task(function, args, kwargs)
+        future = Future(self, task, self.generation)
+        self.pending.add(future)
+        self.submitted += 1
+        self.threadPool.start(task)
+        return future
+
+    def invalidate(self):
+        # Cancel everything in flight, results gathered before now are not wanted anymore
+        self.generation += 1
+        for future in list(self.pending):
+            future.cancel()
+
+workerPool = WorkerPool()
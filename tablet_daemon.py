@@ -0,0 +1,105 @@
+#! /usr/bin/python3
+
+"""
+Headless tablet settings daemon.
+
+    Applies the saved settings and active button profile at start and whenever the tablet is plugged
+    in, and answers the control socket (see lib/control.py and lib/controlServer.py) so the GUI, tray and tabletctl.py can
+    switch profiles, toggle touch and reapply without doing the work themselves.
+    When the monitor layout changes, the stylus is re-mapped to its output (see lib/monitors.py).
+
+    No Qt is imported. While idle it only sleeps in the udev monitor and the socket accept,
+    so it is cheap enough to autostart on every workstation.
+
+    ./tablet_daemon.py
+"""
+import sys, signal, time
+from threading import Event
+
+from lib.persistence import writeBehind
+from lib.daemon      import Daemon, HotplugCoalescer
+from lib.readiness   import ReadinessWaiter
+from lib.session     import TabletSession
+from lib.controlServer import ControlServer, SessionCommands
+from lib.monitors    import monitorTopology
+
+class TabletDaemon():
+    def __init__(self):
+        self.session  = TabletSession()
+        self.daemon   = Daemon()
+        self.hotplug  = HotplugCoalescer()
+        self.commands = SessionCommands(self.session)
+        self.server   = ControlServer(self.commands.handleRequest)
+        self.waiter   = None
+        self.finished = Event()
+
+    def start(self):
+        started = time.monotonic()
+        if self.session.load():
+            self.session.applyAll(onlyChanged=True)
+            print("Settings applied in {:.0f} ms".format((time.monotonic() - started) * 1000))
+        else:
+            print("No tablet present, waiting for one")
+
+        self.hotplug.setArrivedHandler(self.tabletArrived)
+        self.hotplug.setLeftHandler(self.tabletLeft)
+        self.daemon.setAddHandler(self.hotplug.deviceAdded)
+        self.daemon.setRemoveHandler(self.hotplug.deviceRemoved)
+        self.daemon.start()
+        self.server.start()
+
+        monitorTopology.addChangeHandler(self.session.remapOutputs) # <- Re-run MapToOutput when the outputs move
+        monitorTopology.watch()
+
+    def stop(self):
+        self.server.stop()
+        self.daemon.stop()
+        self.hotplug.cancel()
+        monitorTopology.stop()
+        print(monitorTopology)
+        writeBehind.flush()
+
+    def run(self):
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.finished.set())
+        signal.signal(signal.SIGINT,  lambda signum, frame: self.finished.set())
+        self.start()
+        while not self.finished.wait(3600): # <- Wake on signals only
+            pass
+        self.stop()
+
+    #### Hotplug ####
+    # self.waiter is replaced on the hotplug thread and read on the probe's timer thread, both under session.lock
+    def tabletArrived(self, device):
+        idPath = device.properties.get("ID_PATH")
+        waiter = ReadinessWaiter(lambda elapsedMs: self.tabletReady(waiter),
+                                 lambda elapsedMs: self.tabletReady(waiter),
+                                 idPath=idPath, pluggedAt=self.hotplug.firstSeen.get(idPath))
+        with self.session.lock:
+            if self.waiter != None:
+                self.waiter.cancel()
+            self.waiter = waiter
+        waiter.start()
+
+    def tabletReady(self, waiter):
+        with self.session.lock:
+            if waiter is not self.waiter:
+                return # <- Unplugged or plugged again since this waiter started
+            self.waiter = None
+            if self.session.load(): # <- Always from disk, the GUI may have changed things while it was gone
+                self.session.applyAll(onlyChanged=True)
+        print("Tablet at {} applied, plug to applied: {:.0f} ms".format(waiter.idPath, waiter.elapsedMs()))
+
+    def tabletLeft(self, device):
+        with self.session.lock:
+            if self.waiter != None:
+                self.waiter.cancel()
+                self.waiter = None
+            self.session.unload()
+
+if __name__ == "__main__":
+    try:
+        tabletDaemon = TabletDaemon()
+    except RuntimeError as e:
+        print(e)
+        sys.exit(1)
+    tabletDaemon.run()
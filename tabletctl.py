@@ -0,0 +1,237 @@
+#! /usr/bin/python3
+import time
+STARTED = time.perf_counter() # <- For --time, before anything else is imported
+
+import os, sys, json
+
+from lib.control import ControlClient, readSessionCache, isGuiRunning, SESSION_CACHE
+
+"""
+tabletctl: switch profiles, toggle touch and print state from a shortcut, without Qt.
+
+    tabletctl.py status
+    tabletctl.py switch <profile>          <- Index, file name (krita.json) or display name
+    tabletctl.py touch [on|off|toggle]
+    tabletctl.py reapply                   <- Needs the settings daemon
+
+    --time    print how long it took, on stderr. End to end from the process start (interpreter start up
+              included, 10 ms resolution) and from the first line of this script
+    --json    print the raw response
+    --direct  dont ask the settings daemon, even if it runs
+
+When tablet_daemon.py (or, without a daemon, wacom_settings.py) runs, the request goes over its control
+socket. Otherwise the change is applied directly with xsetwacom, using the device names the GUI or daemon
+cached the last time they loaded the tablet (lib/control.py, SESSION_CACHE). Their cached ids are checked
+against one "xsetwacom list devices" first, a replug may have handed an id to another device.
+Only changed pad buttons are sent when switching profiles directly.
+If the GUI runs but does not answer, nothing is written directly: it would overwrite our change.
+"""
+
+def loadDirectDependencies():
+    # Only the direct path needs these, dont make daemon requests pay for importing them
+    global run, PIPE, writeJsonAtomic, compileProfile, transitionPlanner, PROFILE_CACHE_SIZE
+    from subprocess       import run, PIPE
+    from lib.persistence  import writeJsonAtomic
+    from lib.profilePlans import compileProfile, transitionPlanner
+    from lib.profileCache import PROFILE_CACHE_SIZE
+
+PROFILEINDEXFILE = ".index.json" # <- Same as buttons.PROFILEINDEXFILE, not imported to keep startup light
+USAGE = "Usage: tabletctl.py [--time] [--json] [--direct] status | switch <profile> | touch [on|off|toggle] | reapply"
+
+class DirectControl():
+    def __init__(self, cache):
+        self.cache       = cache
+        self.idsVerified = False
+        loadDirectDependencies()
+
+    def xsetwacom(self, deviceType, *args):
+        if not self.idsVerified:
+            self.resolveIds()
+        device = self.cache['devices'].get(deviceType)
+        if device == None or device.get('id') == None:
+            raise RuntimeError("No {} device is plugged in".format(deviceType.lower()))
+        process = run(["xsetwacom", "set", str(device['id'])] + [str(arg) for arg in args], stdout=PIPE, stderr=PIPE)
+        if process.returncode != 0 or process.stderr != b'':
+            raise RuntimeError(process.stderr.decode('utf-8').strip() or "xsetwacom failed")
+
+    def resolveIds(self):
+        # Check the cached ids against the cached device names with one "xsetwacom list devices".
+        # After a replug an old id may belong to another device, so the names decide
+        process = run(["xsetwacom", "list", "devices"], stdout=PIPE, stderr=PIPE)
+        ids = {}
+        for line in process.stdout.decode('utf-8').splitlines():
+            fields = line.split("\t")
+            if len(fields) >= 2 and fields[1].strip().startswith("id:"):
+                ids[fields[0].strip()] = fields[1].split(":")[-1].strip()
+
+        changed = False
+        for device in self.cache['devices'].values():
+            newId = ids.get(device['name'])
+            if newId != (str(device['id']) if device.get('id') != None else None):
+                device['id'] = newId # <- None: not plugged in right now
+                changed = True
+        if changed:
+            writeJsonAtomic(SESSION_CACHE, self.cache)
+        self.idsVerified = True
+        return changed
+
+    def loadJson(self, path):
+        with open(path, 'r') as jsonFile:
+            return json.loads(jsonFile.read())
+
+    def loadSettings(self):
+        return self.loadJson(self.cache['settingsFile'])
+
+    def saveSettings(self, settings):
+        writeJsonAtomic(self.cache['settingsFile'], settings)
+
+    def profileFiles(self):
+        # Profile file names in the order the GUI lists them, Default first
+        try:
+            profiles = self.loadJson(os.path.join(self.cache['profilesDir'], PROFILEINDEXFILE))['profiles']
+        except (OSError, ValueError, KeyError):
+            profiles = {}
+        files = [fileName for fileName, meta in profiles.items() if meta.get('name') != "Default"]
+        files.insert(0, "default.json")
+        return files, profiles
+
+    def findProfile(self, profile):
+        files, profiles = self.profileFiles()
+        if profile.isdigit():
+            index = int(profile)
+            return files[index] if index < len(files) else None
+        for fileName in files:
+            if fileName == profile or profiles.get(fileName, {}).get('name') == profile:
+                return fileName
+        if os.path.isfile(os.path.join(self.cache['profilesDir'], profile)):
+            return profile
+        return None
+
+    def status(self):
+        self.resolveIds() # <- The cached devices are only plugged in if xsetwacom still lists them
+        present  = any(device.get('id') != None for device in self.cache['devices'].values())
+        settings = self.loadSettings()
+        files, profiles = self.profileFiles()
+        active = settings.get('active_profile')
+        return {'ok'         : True,
+                'present'    : present,
+                'profile'    : profiles.get(active, {}).get('name', active),
+                'profileFile': active,
+                'profiles'   : [profiles.get(fileName, {}).get('name', fileName) for fileName in files],
+                'touch'      : settings.get('enable_touch')}
+
+    def switch(self, profile):
+        fileName = self.findProfile(profile)
+        if fileName == None:
+            return {'ok': False, 'error': "No such profile: {}".format(profile)}
+
+        settings   = self.loadSettings()
+        profileDir = self.cache['profilesDir']
+        try:
+            fromPlan = compileProfile(self.loadJson(os.path.join(profileDir, settings.get('active_profile'))))
+        except (OSError, ValueError, TypeError):
+            fromPlan = None # <- Unknown, send every binding
+        toProfile = self.loadJson(os.path.join(profileDir, fileName))
+
+        for command in transitionPlanner.plan(fromPlan, compileProfile(toProfile)):
+            self.xsetwacom('PAD', "button", command.buttonId, command.value)
+
+        recent = [name for name in settings.get('recent_profiles', []) if name != fileName]
+        settings['active_profile']  = fileName
+        settings['recent_profiles'] = ([fileName] + recent)[:settings.get('profile_cache_size', PROFILE_CACHE_SIZE)]
+        self.saveSettings(settings)
+        return {'ok': True, 'profileFile': fileName, 'profile': toProfile.get('name')}
+
+    def touch(self, state):
+        settings = self.loadSettings()
+        if state == "toggle":
+            state = "off" if settings.get('enable_touch') == "on" else "on"
+        self.xsetwacom('TOUCH', "touch", state)
+        settings['enable_touch'] = state
+        self.saveSettings(settings)
+        return {'ok': True, 'touch': state}
+
+def viaDaemon(command, argument):
+    client = ControlClient()
+    if command == "switch":
+        return client.request("switch", profile=argument)
+    elif command == "touch":
+        return client.request("touch", state=argument)
+    return client.request(command)
+
+def viaDirect(command, argument):
+    cache = readSessionCache()
+    if cache == None:
+        return {'ok': False, 'error': "No settings daemon and no cached session, start wacom_settings.py or tablet_daemon.py once"}
+    if command != "status" and isGuiRunning():
+        return {'ok': False, 'error': "wacom_settings.py is running but not answering, it would overwrite a direct change. Use its tray, or restart it"}
+    direct = DirectControl(cache)
+    try:
+        if command == "status":
+            return direct.status()
+        elif command == "switch":
+            return direct.switch(argument)
+        elif command == "touch":
+            return direct.touch(argument)
+        return {'ok': False, 'error': "{} needs the settings daemon".format(command)}
+    except (OSError, ValueError, KeyError, RuntimeError) as e:
+        return {'ok': False, 'error': str(e)}
+
+def printResponse(response):
+    if not response.get('ok'):
+        print("Error:", response.get('error'), file=sys.stderr)
+        return
+    for key, value in response.items():
+        if key == 'ok':
+            continue
+        if isinstance(value, list):
+            value = ", ".join(value)
+        print("{}: {}".format(key, value))
+
+def sinceProcessStart():
+    # Milliseconds since the kernel started this process, interpreter start up included.
+    # Both /proc values are in clock ticks (usually 10 ms), so this is only that precise
+    try:
+        with open("/proc/self/stat", 'r') as statFile:
+            startTicks = int(statFile.read().rsplit(")", 1)[1].split()[19]) # <- Field 22, starttime
+        with open("/proc/uptime", 'r') as uptimeFile:
+            uptime = float(uptimeFile.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+    return (uptime - startTicks / os.sysconf("SC_CLK_TCK")) * 1000
+
+def main(argv):
+    flags = [arg for arg in argv if arg.startswith("--")]
+    args  = [arg for arg in argv if not arg.startswith("--")]
+    if not args or args[0] not in ["status", "switch", "touch", "reapply"] or (args[0] == "switch" and len(args) < 2):
+        print(USAGE, file=sys.stderr)
+        return 2
+
+    command  = args[0]
+    argument = args[1] if len(args) > 1 else ("toggle" if command == "touch" else None)
+    if command == "touch" and argument not in ["on", "off", "toggle"]:
+        print(USAGE, file=sys.stderr)
+        return 2
+
+    route = "direct"
+    if not "--direct" in flags:
+        try:
+            response = viaDaemon(command, argument)
+            route    = "daemon"
+        except OSError:
+            response = None # <- No daemon listening
+    if route == "direct":
+        response = viaDirect(command, argument)
+
+    if "--json" in flags:
+        print(json.dumps(response))
+    else:
+        printResponse(response)
+    if "--time" in flags:
+        endToEnd = sinceProcessStart()
+        print("tabletctl: {} via {} in {} ms end to end, {:.1f} ms after interpreter start up".format(
+            command, route, "{:.0f}".format(endToEnd) if endToEnd != None else "?", (time.perf_counter() - STARTED) * 1000), file=sys.stderr)
+    return 0 if response.get('ok') else 1
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,4 @@
+import os, sys
+
+# The scripts and lib/ are imported the way the app runs them, from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,70 @@
+import pytest
+
+from lib.buttonActions import canonicalize
+
+# Actions as typed by the user, and the string "xsetwacom get" should print for them afterwards.
+# DERIVED by hand from xsetwacom's alias tables and printing rules (see lib/buttonActions.py),
+# not recorded from a real pad. None: canonicalize() must refuse and leave it to xsetwacom.
+DERIVED_CORPUS = [
+    ("key +ctrl",               "key +Control_L"),
+    ("key +Control_L",          "key +Control_L"),
+    ("key +Escape",             "key +Escape"),
+    ("key +esc",                "key +Escape"),
+    ("key +ctrl +space",        "key +Control_L +space"),
+    ("key +shift +space",       "key +Shift_L +space"),
+    ("key ctrl tab",            "key +Control_L -Control_L +Tab -Tab"),
+    ("key +ctrl f5 -ctrl",      "key +Control_L +F5 -F5 -Control_L"),
+    ("key +CTRL +alt +tab",     "key +Control_L +Alt_L +Tab"),
+    ("key +super",              "key +Super_L"),
+    ("key f5",                  "key +F5 -F5"),
+    ("key PgUp",                "key +Prior -Prior"),
+    ("button +1",               "button +1"),
+    ("button +0",               "button +0"),
+    ("button 3",                "button +3 -3"),
+    ("button +1 -1 +1 -1",      "button +1 -1 +1 -1"),
+    ("BUTTON +2",               "button +2"),
+    ("key +alt button +1",      "key +Alt_L button +1"),
+    ("key +ctrl button 1 key -ctrl", "key +Control_L button +1 -1 key -Control_L"),
+    ("modetoggle",              "modetoggle"),
+    ("pan",                     "pan"),
+    ("displaytoggle",           "displaytoggle"),
+    ("key +meta",               None), # <- Keymap dependent
+    ("key +XF86AudioPlay",      None),
+    ("key A",                   None),
+    ("+ctrl",                   None), # <- No action type
+    ("button +left",            None),
+]
+
+# Letters, digits and punctuation depend on the layout: "key 1" reads back as "ampersand" on AZERTY,
+# bracketleft is AltGr+8 on German layouts. Never predicted locally
+LAYOUT_DEPENDENT = ["key z", "key +ctrl z", "key 1", "key +ctrl +bracketleft", "key minus", "key +shift slash"]
+
+# Outputs captured from a real pad with "python3 lib/buttonActions.py --record <action> ...".
+# Seeded with the bindings of a Bamboo 16FG 4x5 as its own "xsetwacom -s get" dumped them
+# (xsetwacom-persistant-settings.sh, "default settings example.txt"), trailing space and all:
+# what the driver handed back must canonicalize to itself
+RECORDED_CORPUS = [
+    ("key +Escape ",            "key +Escape"),
+    ("key +Control_L ",         "key +Control_L"),
+    ("key +Control_L +space ",  "key +Control_L +space"),
+    ("key +Shift_L +space ",    "key +Shift_L +space"),
+    ("button +1 ",              "button +1"),
+    ("button +2 ",              "button +2"),
+    ("button +3 ",              "button +3"),
+    ("button +4 ",              "button +4"),
+    ("button +5 ",              "button +5"),
+    ("button +8 ",              "button +8"),
+    ("button +9 ",              "button +9"),
+]
+
+@pytest.mark.parametrize("action, expected", DERIVED_CORPUS + RECORDED_CORPUS)
+def test_canonicalize(action, expected):
+    assert canonicalize(action) == expected
+
+@pytest.mark.parametrize("action", LAYOUT_DEPENDENT)
+def test_layout_dependent_keys_are_left_to_xsetwacom(action):
+    assert canonicalize(action) == None
+
+def test_cleared_binding_falls_back_to_the_driver_default():
+    assert canonicalize("", buttonNumber=3) == "button +3"
+    assert canonicalize("") == None
@@ -0,0 +1,37 @@
+import check_models
+
+NUMERIC_NAME_TABLET = """[Device]
+Name=1234
+ModelName=5678
+DeviceMatch=usb|056a|1234|1234;
+Class=Bamboo
+
+[Features]
+Stylus=true
+Buttons=4
+"""
+
+def writeTablet(directory, fileName, contents):
+    path = directory / fileName
+    path.write_text(contents)
+    return str(path)
+
+def test_numeric_name_stays_a_string(tmp_path):
+    record = check_models.parseRecord(writeTablet(tmp_path, "numeric.tablet", NUMERIC_NAME_TABLET))
+    assert record["name"] == "1234"
+    assert record["model"] == "5678"
+    assert record["matches"] == ["usb:056a:1234"]
+    assert record["buttons"] == 4
+    assert record["stylus"] is True
+
+def test_name_filter_on_numeric_names(tmp_path):
+    writeTablet(tmp_path, "numeric.tablet", NUMERIC_NAME_TABLET)
+    records = check_models.loadCatalog(str(tmp_path), workers=1)
+    assert len(check_models.filterCatalog(records, name="123")) == 1
+    assert len(check_models.filterCatalog(records, name="567")) == 1
+    assert check_models.filterCatalog(records, name="bamboo") == []
+
+def test_name_filter_on_numeric_records():
+    # Records built by older parsers, or by hand, may still carry ints
+    records = [{"name": 1234, "model": None, "matches": []}]
+    assert check_models.filterCatalog(records, name="23") == records
@@ -0,0 +1,59 @@
+import pytest
+
+pytest.importorskip("pyudev")
+pytest.importorskip("Xlib")
+from Xlib import XK
+from lib.commandInterfaces import XinputNative
+
+# "Wacom Button Actions" encoding without an X server: a fake display with a fixed keymap stands in
+# for the keycode <-> keysym round trip, the strings are what "xsetwacom get <pad> Button N" prints
+KEYMAP = ['Control_L', 'Shift_L', 'Alt_L', 'Super_L', 'space', 'Escape', 'Tab', 'Return',
+          'BackSpace', 'F5', 'F12', 'Prior', 'Next', 'Up', 'z', 'apostrophe']
+
+class FakeDisplay():
+    def __init__(self):
+        self.keycodes = {XK.string_to_keysym(name): keycode for keycode, name in enumerate(KEYMAP, 9)}
+        self.keysyms  = {keycode: keysym for keysym, keycode in self.keycodes.items()}
+
+    def keysym_to_keycode(self, keysym):
+        return self.keycodes.get(keysym, 0)
+
+    def keycode_to_keysym(self, keycode, index):
+        return self.keysyms.get(keycode, 0)
+
+@pytest.fixture
+def native():
+    native = XinputNative()
+    native._display = FakeDisplay()
+    return native
+
+ROUND_TRIP = [
+    "key +Control_L +space -space -Control_L",
+    "key +Control_L +z -z -Control_L",
+    "key +Shift_L +Alt_L +Tab -Tab -Alt_L -Shift_L",
+    "key +Escape -Escape",
+    "key +F5 -F5",
+    "key +F12",
+    "key +Prior -Prior",
+    "key +Super_L +Up -Up -Super_L",
+    "key +apostrophe -apostrophe",
+    "key +Return -Return +BackSpace -BackSpace",
+    "button +1",
+    "button +3 -3",
+    "key +Control_L button +1 -1 key -Control_L",
+]
+
+@pytest.mark.parametrize("action", ROUND_TRIP)
+def test_round_trip(native, action):
+    actions = native._parseActions(action)
+    assert actions
+    assert native._formatActions(actions) == action
+
+def test_aliases_read_back_as_xsetwacom_names(native):
+    assert native._formatActions(native._parseActions("key +ctrl +esc -esc -ctrl")) == "key +Control_L +Escape -Escape -Control_L"
+    assert native._formatActions(native._parseActions("key PgUp")) == "key +Prior -Prior"
+
+def test_unmapped_keys_are_left_to_xsetwacom(native):
+    assert native._parseActions("key +XF86AudioPlay") == None
+    assert native._parseActions("key +NoSuchKey") == None
+    assert native._formatActions([XinputNative.AC_KEY | XinputNative.AC_KEYBTNPRESS | 200]) == None
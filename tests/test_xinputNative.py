@@ -0,0 +1,66 @@
+import os, shutil, subprocess
+import pytest
+
+pytest.importorskip("pyudev")
+pytest.importorskip("Xlib")
+from lib.commandInterfaces import XinputNative
+
+# Runs the native backend against a throwaway Xvfb. Xvfb has no wacom devices, so the core X server's
+# own "Device Enabled" property (INTEGER, 8 bit) of the XTEST pointer stands in for the driver's
+pytestmark = pytest.mark.skipif(shutil.which("Xvfb") == None, reason="Xvfb is not installed")
+
+DEVICE   = "Virtual core XTEST pointer"
+PROPERTY = "Device Enabled"
+
+@pytest.fixture(scope="module")
+def xvfb():
+    readFd, writeFd = os.pipe()
+    server = subprocess.Popen(["Xvfb", "-displayfd", str(writeFd), "-nolisten", "tcp"],
+                              pass_fds=[writeFd], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    os.close(writeFd)
+    with os.fdopen(readFd) as displayPipe:
+        number = displayPipe.readline().strip() # <- Written once the server accepts connections
+    if number == "":
+        server.kill()
+        pytest.skip("Xvfb did not start")
+
+    oldDisplay = os.environ.get("DISPLAY")
+    os.environ["DISPLAY"] = ":" + number
+    yield
+    if oldDisplay == None:
+        del os.environ["DISPLAY"]
+    else:
+        os.environ["DISPLAY"] = oldDisplay
+    server.terminate()
+    server.wait()
+
+class FakeXsetwacom():
+    def __init__(self):
+        self.calls = []
+
+    def setProp(self, name, prop, value):
+        self.calls.append((name, prop, value))
+
+@pytest.fixture
+def native(xvfb):
+    native = XinputNative()
+    native.fallback = FakeXsetwacom()
+    assert native._connect() != None
+    yield native
+    native._display.close()
+
+def test_accepted_write(native):
+    assert native._setProperty(DEVICE, PROPERTY, 'INTEGER', 8, [1]) == True
+    assert native._getProperty(DEVICE, PROPERTY) == [1]
+
+def test_refused_write_is_reported(native):
+    # The server answers a 32 bit "Device Enabled" with BadValue, asynchronously
+    assert native._setProperty(DEVICE, PROPERTY, 'INTEGER', 32, [1]) == False
+
+def test_refused_write_falls_back_to_xsetwacom(native):
+    native._run(lambda: native._setProperty(DEVICE, PROPERTY, 'INTEGER', 32, [1]) or None,
+                lambda: native.fallback.setProp(DEVICE, 'enabled', '1'))
+    assert native.fallback.calls == [(DEVICE, 'enabled', '1')]
+
+def test_unknown_device_falls_back(native):
+    assert native._setProperty("No such device", PROPERTY, 'INTEGER', 8, [1]) == False
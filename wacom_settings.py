@@ -23,17 +23,36 @@ One my last project we used both. QSS for over size and choice of fonts, QPalett
 There is an example that let's you change the pallette and save it, but I can't find it right now. It is worth checking out.
 
 """
-import sys
+import sys, time
+STARTED = time.perf_counter() # <- Start up timing, before Qt is imported
+
 from PyQt6.QtGui        import QIcon
 from PyQt6.QtWidgets    import *
 from PyQt6.QtCore       import QTimer, pyqtSignal
 
 from lib                import logger
-from lib.daemon         import Daemon
-from lib.configUiWidget import ConfigUI
+from lib.persistence    import writeBehind
+from lib.daemon         import Daemon, HotplugCoalescer
+from lib.readiness      import ReadinessWaiter
+from lib.session        import TabletSession
+from lib.control        import ControlClient, acquireGuiLock
 from lib.trayApplet     import TrayApplet
+from lib.workers        import workerPool
+from lib.monitors       import monitorTopology
 
 class Main(QMainWindow):
+    '''
+    Tray first: the tray icon comes up before anything else, then the tablet is loaded and applied
+    through TabletSession (no UI files involved). The settings window (ConfigUI, which pulls in
+    uic and every widget) is only built the first time the user opens it.
+
+    ./wacom_settings.py          <- Also opens the settings window
+    ./wacom_settings.py --tray   <- Only the tray, what the autostart .desktop file uses
+    '''
+    resetUI = pyqtSignal(bool) # Signal Returns: True if tablet is present, False if tablet is not present
+    monitorsChanged = pyqtSignal(list) # <- New monitor names, emitted from MonitorTopology's thread
+    controlChanged  = pyqtSignal(str)  # <- Control socket command that changed the session, emitted from its thread
+    readinessDone   = pyqtSignal(object, bool, float) # <- (ReadinessWaiter, ready, elapsedMs), emitted from its probe thread
 
     def __init__(self, app, parent=None):
         super(Main, self).__init__(parent)
@@ -46,109 +65,274 @@ class Main(QMainWindow):
         #### WIDGETS ####
         self.app           = app
         self.parent        = parent
+        self.session       = TabletSession(remote=ControlClient()) # <- Applies through tablet_daemon.py when it runs
+        self.controlServer = None # <- Our own control socket, when no tablet_daemon.py serves one
+        self.guiLock       = acquireGuiLock() # <- Tells tabletctl.py not to write settings behind our back
+        self.daemon        = Daemon()
+        self.hotplug       = HotplugCoalescer()
+        self.configUI      = None # <- Built on first show, see ensureConfigUI()
         self.centralWidget = QWidget(self)
         self.mainLayout    = QVBoxLayout(self)
-        self.configUI      = ConfigUI(self)
         self.trayApplet    = TrayApplet(self)
         self.noTabletLabel = QLabel(self)
-        self.updateTrayAppletProfileList()
-        self.determineInitialUIState()
+        self.readinessWaiter = None
+        self.pluggedIdPath   = None # <- ID_PATH and time.monotonic() of the last tablet plug, for ReadinessWaiter
+        self.pluggedAt       = None
 
         #### BUILD ####
         self.app.setQuitOnLastWindowClosed(False)
         self.centralWidget.setLayout(self.mainLayout)
-        self.mainLayout.addWidget(self.configUI)
         self.mainLayout.addWidget(self.noTabletLabel)
         self.mainLayout.setContentsMargins(0,0,0,0)
         self.setCentralWidget(self.centralWidget)
+        self.trayApplet.tabletPresent.emit(0) # <- Until the session is loaded
 
         #### POPULATE ####
         # TODO: Create a nice and pretty ui to display this text.
         self.noTabletLabel.setText("No tablet detected! Please connect a tablet...")
 
         #### MANIPULATE SIGNALS ####
-        self.configUI.startDaemon.emit()
-        self.configUI.resetUI.connect(self.toggleUILater)
-        self.configUI.profileListChanged.connect(self.updateTrayAppletProfileList)
+        self.resetUI.connect(self.toggleUILater)
+        self.monitorsChanged.connect(self.handleMonitorsChanged)
+        self.controlChanged.connect(self.handleControlChanged)
+        self.readinessDone.connect(self.handleReadinessDone)
 
         self.trayApplet.menuActionShowWindow.triggered.connect(self.handleShowMainWindow)
         self.trayApplet.menuActionToggleTouch.triggered.connect(self.handleToggleTouch)
         self.trayApplet.menuActionQuitApp.triggered.connect(self.handleQuit)
         self.trayApplet.profileSelectionChangedSignal.connect(self.handleProfileSelectionChanged)
 
+        QTimer.singleShot(0, self.startUp) # <- Once the event loop runs, the tray is up
+
+    def startUp(self):
+        print("Time to tray: {:.0f} ms".format((time.perf_counter() - STARTED) * 1000))
+        self.determineInitialUIState()
+        self.setupControlServer()
+        self.setupDaemon()
+
+    def ensureConfigUI(self):
+        if self.configUI != None:
+            return self.configUI
+
+        started = time.perf_counter()
+        from lib.configUiWidget import ConfigUI # <- uic and every widget, only once the window is wanted
+        self.configUI = ConfigUI(self.session, self)
+        self.mainLayout.insertWidget(0, self.configUI)
+        self.configUI.profileListChanged.connect(self.updateTrayAppletProfileList)
+        if self.session.isPresent():
+            self.setTabletPresentUiModel()
+        else:
+            self.setNoTabletUiModel()
+        print("Settings window built in {:.0f} ms".format((time.perf_counter() - started) * 1000))
+        return self.configUI
+
+    def setupControlServer(self):
+        # Without a settings daemon, serve its socket ourselves: tabletctl.py then goes through us
+        # instead of writing the settings files our in memory session (and its pending saves) would overwrite
+        if self.guiLock == None:
+            print("Another settings window is running")
+        if self.session.remote.isRunning():
+            return
+
+        from lib.controlServer import ControlServer, SessionCommands
+        self.session.remote = None # <- We are the one applying from now on, never ask ourselves
+        try:
+            self.controlServer = ControlServer(SessionCommands(self.session, onChanged=self.controlChanged.emit).handleRequest)
+        except (RuntimeError, OSError) as e:
+            print("Control socket unavailable:", e)
+            return
+        self.controlServer.start()
+
+    #### Hotplug ####
+    def setupDaemon(self):
+        # Udev events -> one arrived/left transition per tablet -> devicePlugged/deviceUnplugged
+        self.hotplug.setArrivedHandler(self.devicePlugged)
+        self.hotplug.setLeftHandler(self.deviceUnplugged)
+        self.daemon.setAddHandler(self.hotplug.deviceAdded)
+        self.daemon.setRemoveHandler(self.hotplug.deviceRemoved)
+        self.daemon.start()
+
+        # RandR/drm events -> re-map the stylus if its output moved, and refresh the monitor list
+        monitorTopology.addChangeHandler(self.outputsChanged)
+        monitorTopology.watch()
+
+    def outputsChanged(self, oldMonitors, newMonitors):
+        self.session.remapOutputs(oldMonitors, newMonitors)
+        self.monitorsChanged.emit([monitor[0] for monitor in newMonitors])
+
+    def deviceUnplugged(self, device):
+        # Fired once per tablet unplugged/removed via USB, see HotplugCoalescer
+        try:
+            idPath = device.properties["ID_PATH"]
+            idTabletPad = device.properties["ID_INPUT_TABLET_PAD"]
+            tabInfo = self.session.tabInfo
+            if (idTabletPad == "1") and tabInfo != None and (idPath == tabInfo.getIdPath()):
+                # Was the device im processing a tablet pad
+                # And if so, was it MY tablet pad
+                print("Tablet device at {} was removed".format(idPath))
+                # Shut down all window interaction here
+                if self.configUI != None:
+                    self.configUI.earlyDismisalSignal.emit()
+                self.resetUI.emit(False)
+
+        except KeyError:
+            pass
+
+    def devicePlugged(self, device):
+        # Fired once per tablet plugged in/added via USB, see HotplugCoalescer
+        try:
+            idSerial    = device.properties["ID_SERIAL"].replace("_", " ")
+            idTabletPad = device.properties["ID_INPUT_TABLET_PAD"]
+            if idTabletPad == "1":
+                print("Found new tablet device:", idSerial)
+                self.pluggedIdPath = device.properties.get("ID_PATH")
+                self.pluggedAt     = self.hotplug.firstSeen.get(self.pluggedIdPath)
+                self.resetUI.emit(True)
+
+        except KeyError:
+            pass
+
+    #### Handlers ####
     def handleQuit(self):
-        self.configUI.stopDaemon.emit()
+        self.daemon.stop()
+        self.hotplug.cancel()
+        monitorTopology.stop()
+        print(monitorTopology)
+        if self.controlServer != None:
+            self.controlServer.stop()
+        writeBehind.flush() # <- Make sure every queued settings/profile save hits the disk
+        print(writeBehind)
+        print(workerPool)
         self.app.quit()
 
+    def handleControlChanged(self, command):
+        if command == "reapply":
+            self.tabletReloaded(self.session.isPresent())
+        elif command == "switch":
+            if self.configUI != None:
+                self.configUI.profileSwitched(refreshUi=self.isVisible())
+        elif command == "touch":
+            if self.configUI != None:
+                self.configUI.populateTouchEnabled()
+
+    def handleMonitorsChanged(self, monitors):
+        if self.configUI != None and self.session.isPresent():
+            self.configUI.monitorsArrived(monitors)
+
     def handleShowMainWindow(self):
+        self.ensureConfigUI().populateIfStale()
         self.show()
 
     def handleHideMainWindow(self):
         self.hide()
 
     def handleToggleTouch(self):
-        # This kind of shit makes accessing settings really difficult. Consider making settings staticly accessable
-        state = self.configUI.settings.get('enable_touch')
-        if state == "on":
-            self.configUI.settings.set('enable_touch', 'off')
-            print("Toggle Touch: was:", state, "- now: off")
-
-        else:
-            self.configUI.settings.set('enable_touch', 'on')
-            print("Toggle Touch: was:", state, "- now: on")
-
-        self.configUI.settings.applyTouch()
-        self.configUI.populateTouchEnabled()
+        state    = self.session.settings.get('enable_touch')
+        newState = self.session.setTouch('toggle') # <- Through the settings daemon when it runs
+        print("Toggle Touch: was:", state, "- now:", newState)
+        if self.configUI != None:
+            self.configUI.populateTouchEnabled()
 
     def handleProfileSelectionChanged(self, profileIndex):
-        self.configUI.doSwitchActiveProfile(profileIndex)
+        # From the tray: when the window is hidden, skip rebuilding widgets nobody can see
+        self.session.switchProfile(profileIndex)
+        if self.configUI != None:
+            self.configUI.profileSwitched(refreshUi=self.isVisible())
 
     def closeEvent(self, event):
         self.handleHideMainWindow()
 
     def updateTrayAppletProfileList(self):
-        if self.configUI.buttons != None:
-            self.trayApplet.setProfileMenuItems(self.configUI.buttons.getProfiles())
+        if self.session.buttons != None:
+            self.trayApplet.setProfileMenuItems(self.session.buttons.getProfiles())
 
     def setNoTabletUiModel(self):
-        self.configUI.hide()
-        self.configUI.profileListChanged.emit()
+        self.updateTrayAppletProfileList()
         self.trayApplet.tabletPresent.emit(0)
         self.noTabletLabel.show()
         self.setWindowTitle("No tablet is detected! - Tablet Config")
+        if self.configUI != None:
+            self.configUI.hide()
 
     def setTabletPresentUiModel(self):
-        self.configUI.show()
-        self.configUI.populateFeilds()
-        self.configUI.profileListChanged.emit()
+        self.updateTrayAppletProfileList()
         self.trayApplet.tabletPresent.emit(1)
         self.noTabletLabel.hide()
-        genericName = self.configUI.tabInfo.getGenericName()
-        modelName   = self.configUI.tabInfo.getModel()
+        genericName = self.session.tabInfo.getGenericName()
+        modelName   = self.session.tabInfo.getModel()
         self.setWindowTitle("Device: {} {} - Tablet Config".format(genericName, modelName))
+        if self.configUI != None:
+            self.configUI.show()
+            self.configUI.populateFeilds()
 
     def determineInitialUIState(self):
-        if self.configUI.tabInfo.isTabletPresent():
-            self.setTabletPresentUiModel()
-            self.configUI.populateFeilds()
-            self.configUI.applyAllSettings()
-        else:
-            self.setNoTabletUiModel()
+        workerPool.submit(self.session.build).then(self.tabletLoaded)
 
     def toggleUILater(self, isTabletPresent):
-        print("Scheduling UI Reset...")
-        QTimer.singleShot(1000, lambda: self.toggleUI(isTabletPresent))
+        workerPool.invalidate() # <- Anything still being gathered describes the old tablet state
+        if self.readinessWaiter != None:
+            self.readinessWaiter.cancel()
+            self.readinessWaiter = None
+
+        if not isTabletPresent:
+            self.toggleUI(False)
+            return
+
+        # Apply as soon as the X driver exposes the tablet, instead of after a fixed delay.
+        # Probes fork xsetwacom, they run on timer threads and only the outcome comes back to us
+        print("Waiting for the tablet to become ready...")
+        waiter = ReadinessWaiter(lambda elapsedMs: self.readinessDone.emit(waiter, True, elapsedMs),
+                                 lambda elapsedMs: self.readinessDone.emit(waiter, False, elapsedMs),
+                                 idPath=self.pluggedIdPath, pluggedAt=self.pluggedAt)
+        self.readinessWaiter = waiter
+        waiter.start()
+
+    def handleReadinessDone(self, waiter, ready, elapsedMs):
+        if waiter is not self.readinessWaiter:
+            return # <- Replaced or cancelled by a newer hotplug while it was probing
+        self.readinessWaiter = None
+        if ready:
+            print("Tablet ready after {} probe(s) at {:.0f} ms".format(waiter.attempt, elapsedMs))
+        else:
+            print("Tablet did not become ready within {:.0f} ms, applying anyway".format(elapsedMs))
+        self.toggleUI(True)
 
     def toggleUI(self, isTabletPresent):
 
         print("Resetting UI")
         print("Tablet Present:", isTabletPresent)
         if isTabletPresent:
-            self.configUI.reloadDataObjects() # Reload all data objects to reflect the new tablet
-            self.configUI.applyAllSettings()  # Re-apply all device settings, specific to the new tablet
+            # Build the new tablet's data objects on a worker. They only replace the session's in
+            # tabletLoaded, so a build overtaken by an unplug (invalidated generation) never lands
+            workerPool.submit(self.session.build).then(self.tabletLoaded)
+        else:
+            self.session.unload()
+            self.tabletReloaded(False)
+
+    def tabletLoaded(self, loaded):
+        isTabletPresent = self.session.install(loaded)
+        if isTabletPresent:
+            # Re-apply all device settings, specific to the new tablet
+            workerPool.submit(self.session.applyAll, onlyChanged=True).then(self.settingsApplied)
+        self.tabletReloaded(isTabletPresent)
+
+    def settingsApplied(self, applied):
+        if not applied:
+            print("Settings left to the settings daemon")
+        pluggedAt = self.hotplug.firstSeen.get(self.pluggedIdPath) # <- First udev event of the last plug, None at start up
+        if pluggedAt != None:
+            print("Tablet at {} applied, plug to applied: {:.0f} ms".format(self.pluggedIdPath, (time.monotonic() - pluggedAt) * 1000))
+        else:
+            print("Time to settings applied: {:.0f} ms".format((time.perf_counter() - STARTED) * 1000))
+
+    def tabletReloaded(self, isTabletPresent):
+        if isTabletPresent:
+            if self.configUI != None:
+                self.configUI.reloadDataObjects()
             self.setTabletPresentUiModel()
         else:
-            self.configUI.deloadDataObjects()
+            if self.configUI != None:
+                self.configUI.deloadDataObjects()
             self.setNoTabletUiModel()
 
 if __name__ == "__main__":
@@ -157,7 +341,8 @@ if __name__ == "__main__":
         app = QApplication(sys.argv)
         app.setWindowIcon(QIcon.fromTheme('input-tablet'))
         win = Main(app)
-        win.show()
+        if not "--tray" in sys.argv:
+            win.handleShowMainWindow()
         sys.exit(app.exec())
     except:
         logger.report()